@@ -0,0 +1,294 @@
+"""
+Benchmarks for the CASH engines.
+
+Every generated workload (see workloads.py) is run through every engine: the
+parse-tree visitor, the closure engine, the bytecode VM and the LLVM compiler
+(in process with MCJIT, when llvmlite is installed). For each pair the report
+shows the time spent in
+
+- parse: lexing and parsing with ANTLR,
+- prepare: constant folding, type inference, lowering and compiling to
+  closures, bytecode or LLVM (including optimization and object emission),
+- exec: running the program (for LLVM, loading the object and running main),
+
+along with the peak Python heap over all three phases and the throughput in
+source lines per second. Phase times are the best of --repeat runs.
+
+Results can be saved as a JSON baseline, and a later run compared against it:
+every phase that got slower by more than --threshold is reported as a
+regression and the run exits with status 1.
+
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "interpreter"))
+sys.path.append(str(ROOT / "compiler"))
+
+from antlr4 import InputStream
+from frontend import FrontEnd
+from constant_folding import fold_constants
+from typechecker import TypeChecker
+from lowering import lower
+from resolver import resolve
+from symbol_table import SymbolTable, DEFAULT_RECURSION_LIMIT, new_global_frame
+from inputs import StreamInput
+from output import MemorySink
+from visitor import InterpreterVisitor
+from closure_engine import ClosureCompiler, run as run_closures
+from bytecode import build_memos, compile_bytecode, run as run_bytecode
+from workloads import WORKLOADS, generate
+
+PHASES = ("parse_s", "prepare_s", "exec_s")
+
+# phases that took less longer than this are never regressions, however large the ratio
+MIN_REGRESSION_S = 0.001
+
+
+def no_input():
+    return StreamInput(io.StringIO())
+
+
+# ENGINES
+# each takes a parse tree and returns a function that runs the program and
+# returns what it printed
+def prepare_visitor(tree):
+    constants = fold_constants(tree)
+
+    def run():
+        output = MemorySink()
+        InterpreterVisitor(SymbolTable(), constants, no_input(), output).visit(tree)
+        return output.getvalue()
+    return run
+
+
+def prepare_closure(tree):
+    checker = TypeChecker(SymbolTable())
+    types = checker.visit(tree)
+    ast = resolve(lower(tree, fold_constants(tree), use_types=checker.use_types))
+    output = MemorySink()
+    compiled = ClosureCompiler(types=types, inputs=no_input(), output=output).compile_program(ast)
+
+    def run():
+        run_closures(compiled, new_global_frame(len(ast.names), DEFAULT_RECURSION_LIMIT))
+        return output.getvalue()
+    return run
+
+
+def prepare_bytecode(tree):
+    code_object = compile_bytecode(resolve(lower(tree, fold_constants(tree))))
+    memos = build_memos(code_object)
+
+    def run():
+        output = MemorySink()
+        run_bytecode(code_object, new_global_frame(len(code_object.names), DEFAULT_RECURSION_LIMIT), memos,
+                     no_input(), output)
+        return output.getvalue()
+    return run
+
+
+def prepare_llvm(tree):
+    from codegen import Compiler
+    from jit import run_object
+
+    compiler = Compiler(Path("bench.cash"), fold_constants(tree), prompt=False)
+    compiler.visit(tree)
+    obj = compiler.emit_object()
+
+    def run():
+        # the program prints with C stdio, so its output is caught at the file descriptor
+        with tempfile.TemporaryFile() as captured:
+            sys.stdout.flush()
+            saved = os.dup(1)
+            os.dup2(captured.fileno(), 1)
+            try:
+                run_object(obj)
+            finally:
+                os.dup2(saved, 1)
+                os.close(saved)
+            captured.seek(0)
+            return captured.read().decode()
+    return run
+
+
+ENGINES = {
+    "visitor": prepare_visitor,
+    "closure": prepare_closure,
+    "bytecode": prepare_bytecode,
+    "llvm": prepare_llvm,
+}
+
+
+def llvm_available() -> bool:
+    try:
+        import llvmlite.binding
+    except ImportError:
+        return False
+    return True
+
+
+# MEASURING
+def run_once(engine: str, source: str) -> tuple:
+    start = time.perf_counter()
+    tree = FrontEnd().parse(InputStream(source))
+    parsed = time.perf_counter()
+    run = ENGINES[engine](tree)
+    prepared = time.perf_counter()
+    output = run()
+    done = time.perf_counter()
+    return (parsed - start, prepared - parsed, done - prepared), output
+
+
+def peak_memory(engine: str, source: str) -> int:
+    tracemalloc.start()
+    try:
+        run_once(engine, source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(workload: str, engine: str, source: str, repeat: int) -> dict:
+    best = None
+    output = None
+    for _ in range(repeat):
+        times, output = run_once(engine, source)
+        best = times if best is None else tuple(map(min, best, times))
+    lines = source.count("\n")
+    return {
+        "workload": workload,
+        "engine": engine,
+        "lines": lines,
+        "parse_s": best[0],
+        "prepare_s": best[1],
+        "exec_s": best[2],
+        "peak_kb": peak_memory(engine, source) // 1024,
+        "lines_per_s": lines / sum(best),
+        "output": output,
+    }
+
+
+def run_benchmarks(workloads: list, engines: list, scale: float, repeat: int) -> list:
+    results = []
+    for workload in workloads:
+        source = generate(workload, scale)
+        for engine in engines:
+            results.append(measure(workload, engine, source, repeat))
+    return results
+
+
+def check_outputs(results: list) -> list:
+    """
+    Workloads whose engines printed different receipts.
+    """
+    outputs = {}
+    for result in results:
+        outputs.setdefault(result["workload"], set()).add(result["output"])
+    return [workload for workload, printed in outputs.items() if len(printed) > 1]
+
+
+# BASELINES
+def git_commit() -> str | None:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return commit.stdout.strip() or None
+
+
+def baseline(results: list, scale: float, repeat: int) -> dict:
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "repeat": repeat,
+        "results": [{key: value for key, value in result.items() if key != "output"} for result in results],
+    }
+
+
+def regressions(results: list, base: dict, threshold: float) -> list:
+    """
+    (workload, engine, phase, before, after) for every phase that got slower
+    than the baseline allows.
+    """
+    before = {(result["workload"], result["engine"]): result for result in base["results"]}
+    found = []
+    for result in results:
+        old = before.get((result["workload"], result["engine"]))
+        if old is None:
+            continue
+        for phase in PHASES:
+            if result[phase] > old[phase] * (1 + threshold) and result[phase] - old[phase] > MIN_REGRESSION_S:
+                found.append((result["workload"], result["engine"], phase, old[phase], result[phase]))
+    return found
+
+
+# REPORTING
+def print_results(results: list, out=sys.stdout):
+    out.write(f"{'workload':<16}{'engine':<10}{'parse ms':>10}{'prepare ms':>12}{'exec ms':>10}"
+              f"{'peak KiB':>10}{'lines/s':>10}\n")
+    for result in results:
+        out.write(f"{result['workload']:<16}{result['engine']:<10}{result['parse_s'] * 1000:>10.2f}"
+                  f"{result['prepare_s'] * 1000:>12.2f}{result['exec_s'] * 1000:>10.2f}"
+                  f"{result['peak_kb']:>10}{result['lines_per_s']:>10.0f}\n")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the CASH engines on generated workloads.")
+    arg_parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                            help="run only this workload (repeatable, default: all)")
+    arg_parser.add_argument("--engine", action="append", choices=sorted(ENGINES),
+                            help="run only on this engine (repeatable, default: all available)")
+    arg_parser.add_argument("--scale", type=float, default=1.0, help="multiply the size of every workload")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per workload and engine, the best counts")
+    arg_parser.add_argument("--save", metavar="FILE", help="write the results to FILE as a JSON baseline")
+    arg_parser.add_argument("--compare", metavar="FILE", help="compare against a JSON baseline written by --save")
+    arg_parser.add_argument("--threshold", type=float, default=0.25,
+                            help="relative slowdown of a phase that counts as a regression (default: 0.25)")
+    arg_parser.add_argument("--json", action="store_true", help="print the results as JSON instead of a table")
+    args = arg_parser.parse_args()
+
+    engines = args.engine or [engine for engine in ENGINES if engine != "llvm" or llvm_available()]
+    results = run_benchmarks(args.workload or list(WORKLOADS), engines, args.scale, args.repeat)
+    current = baseline(results, args.scale, args.repeat)
+
+    if args.json:
+        print(json.dumps(current, indent=2))
+    else:
+        print_results(results)
+    status = 0
+    for workload in check_outputs(results):
+        print(f"MISMATCH {workload}: the engines printed different receipts", file=sys.stderr)
+        status = 1
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        base = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if base["scale"] != args.scale:
+            arg_parser.error(f"{args.compare} was recorded at --scale {base['scale']}")
+        found = regressions(results, base, args.threshold)
+        for workload, engine, phase, old, new in found:
+            print(f"REGRESSION {workload} on {engine}: {phase[:-2]} {old * 1000:.2f} ms -> {new * 1000:.2f} ms "
+                  f"(+{(new / old - 1) * 100:.0f}%)", file=sys.stderr)
+        if found:
+            status = 1
+        else:
+            print(f"no regressions against {base.get('commit') or args.compare}", file=sys.stderr)
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
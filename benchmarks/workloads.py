@@ -0,0 +1,137 @@
+"""
+Generators for parametric CASH benchmark programs.
+
+Every generator takes a size and returns the source of a program that needs no
+input and keeps its values integral, so all engines, including the compiler,
+can run it and print the same receipts.
+"""
+
+
+def program(lines: list) -> str:
+    return "HELLO.\n\n" + "\n".join(lines) + "\n\nBYE.\n"
+
+
+def scan_loop(iterations: int) -> str:
+    """
+    One SCAN doing a little arithmetic per iteration.
+    """
+    return program([
+        "COST i = 0 $",
+        "COST total = 0 $",
+        f"SCAN (i < {iterations}):",
+        "    COST total = total + i * 3 - 1 $",
+        "    COST i = i + 1 $",
+        "$",
+        'RECEIPT "Total: ", total $',
+    ])
+
+
+def nested_scans(size: int) -> str:
+    """
+    SCAN bodies cannot hold another SCAN, so the inner loop is a task called
+    from the outer one: size * size iterations in all.
+    """
+    return program([
+        "COST cells = 0 $",
+        "START TASK row (IN: width):",
+        "    COST j = 0 $",
+        "    SCAN (j < width):",
+        "        COST cells = cells + 1 $",
+        "        COST j = j + 1 $",
+        "    $",
+        "END row",
+        "COST i = 0 $",
+        f"SCAN (i < {size}):",
+        f"    TODO row(width: {size}) $",
+        "    COST i = i + 1 $",
+        "$",
+        'RECEIPT "Cells: ", cells $',
+    ])
+
+
+def many_variables(count: int) -> str:
+    """
+    A long straight-line program where every statement defines a new variable.
+    """
+    lines = ["COST v0 = 1 $"]
+    for index in range(1, count):
+        lines.append(f"COST v{index} = v{index - 1} + {index % 7} $")
+    lines.append(f'RECEIPT "Last: ", v{count - 1} $')
+    return program(lines)
+
+
+def confirm_chain(arms: int, calls: int = 200) -> str:
+    """
+    A task with a CONFIRM/CHECK_AGAIN chain of `arms` conditions, called
+    `calls` times with arguments that take every arm.
+    """
+    lines = ["COST hits = 0 $", "START TASK classify (IN: x):"]
+    lines.append("    CONFIRM x < 1:")
+    lines.append("        COST hits = hits + 1 $")
+    for arm in range(2, arms + 1):
+        lines.append(f"    CHECK_AGAIN x < {arm}:")
+        lines.append(f"        COST hits = hits + {arm} $")
+    lines.append("    FALLBACK:")
+    lines.append("        COST hits = hits - 1 $")
+    lines.append("END classify")
+    lines += [
+        "COST n = 0 $",
+        f"SCAN (n < {calls}):",
+        "    TODO classify(x: n) $",
+        "    COST n = n + 1 $",
+        "$",
+        'RECEIPT "Hits: ", hits $',
+    ]
+    return program(lines)
+
+
+def task_calls(calls: int) -> str:
+    """
+    A loop that does nothing but call a small task with a new argument.
+    """
+    return program([
+        "COST acc = 0 $",
+        "START TASK add (IN: x):",
+        "    COST acc = acc + x $",
+        "END add",
+        "COST i = 0 $",
+        f"SCAN (i < {calls}):",
+        "    TODO add(x: i) $",
+        "    COST i = i + 1 $",
+        "$",
+        'RECEIPT "Sum: ", acc $',
+    ])
+
+
+def large_source(statements: int) -> str:
+    """
+    A long program of assignments, CONFIRM chains with boolean operators and
+    receipts, to stress the front end rather than execution.
+    """
+    lines = ["COST a = 1 $", "COST b = 2 $"]
+    for index in range(statements // 4):
+        lines.append(f"COST a = (a + {index % 5}) * 2 - a - b $")
+        lines.append(f"CONFIRM a > {index} AND NOT b = {index}:")
+        lines.append("    COST b = b + 1 $")
+        lines.append(f"CHECK_AGAIN a <= {index} OR b >= {index}:")
+        lines.append("    COST b = b - 1 $")
+        lines.append("FALLBACK:")
+        lines.append("    COST a = a + b $")
+        lines.append(f'RECEIPT "Step {index}: ", a - a + b $')
+    return program(lines)
+
+
+# name -> (generator, size at scale 1.0)
+WORKLOADS = {
+    "scan_loop": (scan_loop, 20000),
+    "nested_scans": (nested_scans, 120),
+    "many_variables": (many_variables, 2000),
+    "confirm_chain": (confirm_chain, 60),
+    "task_calls": (task_calls, 5000),
+    "large_source": (large_source, 2000),
+}
+
+
+def generate(name: str, scale: float = 1.0) -> str:
+    generator, size = WORKLOADS[name]
+    return generator(max(1, int(size * scale)))
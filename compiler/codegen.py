@@ -0,0 +1,902 @@
+"""
+LLVM code generation for CASH.
+
+`Compiler` walks the parse tree and builds an LLVM module with llvmlite; the
+module can be written out for clang or optimized and emitted as an object file.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import llvmlite.ir as ir
+import llvmlite.binding as llvm
+
+from antlr4 import *
+from cash.CASHParser import CASHParser
+from cash.CASHVisitor import CASHVisitor
+
+# passes shared with the interpreter live next to it
+sys.path.append(str(Path(__file__).resolve().parent.parent / "interpreter"))
+from constant_folding import assigned_in
+from symbol_table import SymbolTable
+from typechecker import TypeChecker
+from profiler import context_site, site_label
+import fixed_point
+
+def init_module(source_file: Path):
+    """
+    Initialize an LLVM module for the given source file.
+    This sets up the target and data layout so LLVM knows how to emit code for the host system.
+    """
+    llvm.initialize()
+    llvm.initialize_native_target()
+    module = ir.Module(name=source_file.name)
+
+    target = llvm.Target.from_default_triple()
+    machine = target.create_target_machine()
+
+    module.triple = machine.triple
+    module.data_layout = str(machine.target_data)
+    return module
+
+BYTE_TYPE = ir.IntType(8) 
+BOOL_TYPE = ir.IntType(1)
+DEFAULT_INT = ir.IntType(32)  
+INT_TYPE = ir.IntType(64)
+FLOAT_TYPE = ir.DoubleType()
+STRING_TYPE = ir.PointerType(BYTE_TYPE)
+# a variable holding both integers and floats: whether the value is a float, and the value
+NUMBER_TYPE = ir.LiteralStructType((BOOL_TYPE, FLOAT_TYPE))
+PRINTF_TYPE = ir.FunctionType(DEFAULT_INT, (ir.PointerType(BYTE_TYPE),), var_arg=True) 
+MAIN_TYPE = ir.FunctionType(DEFAULT_INT, ()) 
+
+# C library functions the generated code calls besides printf
+LIBC = {
+    "snprintf": ir.FunctionType(DEFAULT_INT, (STRING_TYPE, INT_TYPE, STRING_TYPE), var_arg=True),
+    "strtod": ir.FunctionType(FLOAT_TYPE, (STRING_TYPE, ir.PointerType(STRING_TYPE))),
+    "strchr": ir.FunctionType(STRING_TYPE, (STRING_TYPE, DEFAULT_INT)),
+    "strcat": ir.FunctionType(STRING_TYPE, (STRING_TYPE, STRING_TYPE)),
+    "strcmp": ir.FunctionType(DEFAULT_INT, (STRING_TYPE, STRING_TYPE)),
+    "atoi": ir.FunctionType(DEFAULT_INT, (STRING_TYPE,)),
+    "scanf": ir.FunctionType(DEFAULT_INT, (STRING_TYPE,), var_arg=True),
+    "fflush": ir.FunctionType(DEFAULT_INT, (STRING_TYPE,)),
+    "setvbuf": ir.FunctionType(DEFAULT_INT, (STRING_TYPE, STRING_TYPE, DEFAULT_INT, INT_TYPE)),
+    "fprintf": ir.FunctionType(DEFAULT_INT, (STRING_TYPE, STRING_TYPE), var_arg=True),
+    "exit": ir.FunctionType(ir.VoidType(), (DEFAULT_INT,)),
+}
+
+# large enough for any double printed by float_repr
+FORMAT_BUFFER_SIZE = 32
+
+# receipts are collected in a stdout buffer this large and written when it
+# fills up, before ASK prompts and at exit
+STDOUT_BUFFER_SIZE = 1 << 16
+# setvbuf mode for full buffering, the same in glibc, musl and the BSDs
+IOFBF = 0
+
+# CASH comparison operators and their icmp predicates
+COMPARISONS = {"=": "==", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+class Compiler(CASHVisitor):
+    """
+    The main compiler class that walks the parse tree
+    and generates LLVM IR for each supported CASH construct.
+
+    Variables the main program assigns are module globals. Inside a task,
+    parameters and the other variables it assigns live in stack slots of the
+    task's function, and every other name refers to the global.
+
+    The TypeChecker decides how each variable is stored: integers as i64,
+    floats as double, strings as i8*, and variables that hold both integers
+    and floats as a NUMBER_TYPE pair.
+
+    With `cents` every number is an i64 count of cents instead, computed with
+    the integer operations of fixed_point.py. `constants` must then have been
+    folded in cents mode too.
+    """
+
+    def __init__(self, source_file: Path, constants: dict | None = None, prompt: bool = True,
+                 profile: bool = False, cents: bool = False):
+        self.source_file = source_file
+        self.constants = constants or {}
+        self.prompt = prompt
+        self.profile = profile
+        self.cents = cents
+        self.counters = []
+        self.module = init_module(source_file)
+        self.uses_c_printf = None  
+        self.current_builder = None 
+        self.constant_counter = 0 
+        # the constant pool: one global per distinct string, however often it is used
+        self.strings = {}
+        self.global_names = set()
+        self.variables = {}  
+        self.locals = None
+        self.allocas = None
+        self.tasks = {}
+        self.types = {}
+
+    def visit(self, tree):
+        """
+        Emit expressions the constant folder proved constant directly, when the
+        value has a representation here.
+        """
+        value = self.constants.get(tree)
+        if type(value) is bool:
+            return ir.Constant(BOOL_TYPE, value)
+        if type(value) is int:
+            return ir.Constant(INT_TYPE, value)
+        if type(value) is float:
+            return ir.Constant(FLOAT_TYPE, value)
+        if type(value) is str:
+            return self.string_literal(value)
+        return tree.accept(self)
+
+    def next_constant(self, prefix: str = "str"):
+        """
+        Generate a unique name for a new global string constant.
+        This ensures no naming collisions between multiple string literals.
+        """
+        self.constant_counter += 1
+        return f"{prefix}{self.constant_counter}"
+
+    def with_printf(self):
+        """
+        Declare or return the printf function.
+        Needed to call printf from generated LLVM IR.
+        """
+        if not self.uses_c_printf:
+            func = ir.Function(self.module, PRINTF_TYPE, name="printf")
+            self.uses_c_printf = func
+        return self.uses_c_printf
+
+    def libc(self, name: str):
+        """
+        Declare or return one of the C library functions in LIBC.
+        """
+        if name in self.module.globals:
+            return self.module.globals[name]
+        return ir.Function(self.module, LIBC[name], name=name)
+
+    # TYPES
+    def storage_type(self, name: str):
+        """
+        The LLVM type that can hold every value the TypeChecker found for a variable.
+        """
+        types = self.types.get(name, set())
+        if self.cents and types <= {"integer", "float"}:
+            return INT_TYPE
+        if types == {"string"}:
+            return STRING_TYPE
+        if types == {"float"}:
+            return FLOAT_TYPE
+        if types == {"integer", "float"}:
+            return NUMBER_TYPE
+        if types <= {"integer"}:
+            return INT_TYPE
+        raise TypeError(f"Variable {name} can hold {', '.join(sorted(types))}, which cannot be compiled")
+
+    def coerce(self, value, type: ir.Type):
+        """
+        Convert a value to the storage type of a variable or parameter.
+        """
+        if value.type == type:
+            return value
+        if type == FLOAT_TYPE and value.type == INT_TYPE:
+            return self.current_builder.sitofp(value, FLOAT_TYPE)
+        if type == NUMBER_TYPE and value.type in (INT_TYPE, FLOAT_TYPE):
+            return self.number(ir.Constant(BOOL_TYPE, value.type == FLOAT_TYPE), self.as_float(value))
+        raise TypeError(f"Cannot store a value of type {value.type} in {type}")
+
+    def number(self, is_float, value):
+        result = self.current_builder.insert_value(ir.Constant(NUMBER_TYPE, None), is_float, 0)
+        return self.current_builder.insert_value(result, value, 1)
+
+    def is_float(self, value):
+        if value.type == NUMBER_TYPE:
+            return self.current_builder.extract_value(value, 0)
+        return ir.Constant(BOOL_TYPE, value.type == FLOAT_TYPE)
+
+    def as_float(self, value):
+        if value.type == INT_TYPE:
+            return self.current_builder.sitofp(value, FLOAT_TYPE)
+        if value.type == NUMBER_TYPE:
+            return self.current_builder.extract_value(value, 1)
+        if value.type == FLOAT_TYPE:
+            return value
+        raise TypeError(f"Expected a number but got {value.type}")
+
+    # VARIABLES
+    def variable(self, name: str):
+        """
+        Return the storage of a variable in the current function, creating it
+        the first time the variable is seen.
+        """
+        type = self.storage_type(name)
+        if self.locals is not None and name in self.locals:
+            return self.locals[name]
+        if self.locals is not None and name not in self.global_names:
+            # stack slots go in the entry block, so loops do not grow the stack
+            self.locals[name] = self.allocas.alloca(type, name=name)
+            return self.locals[name]
+        if name not in self.variables:
+            glob = ir.GlobalVariable(self.module, type, name="var." + name)
+            glob.initializer = ir.Constant(type, None)
+            self.variables[name] = glob
+        return self.variables[name]
+
+    def store(self, name: str, value):
+        ptr = self.variable(name)
+        self.current_builder.store(self.coerce(value, ptr.type.pointee), ptr)
+
+    def load(self, name: str):
+        if self.locals is not None and name in self.locals:
+            return self.current_builder.load(self.locals[name], name=name)
+        if name in self.variables:
+            return self.current_builder.load(self.variables[name], name=name)
+        if self.locals is not None and name in self.global_names:
+            # a task may be defined before the main program first assigns the global
+            return self.current_builder.load(self.variable(name), name=name)
+        return None
+
+    # PROGRAM STRUCTURE
+    def visitProgram(self, ctx: CASHParser.ProgramContext):
+        """
+        Generate the LLVM IR for the main function.
+        CASH starts execution here. Each statement is visited in order.
+        """
+        self.types = TypeChecker(SymbolTable()).visit(ctx)
+        for child in ctx.getChildren():
+            if not isinstance(child, CASHParser.Task_modContext) and isinstance(child, ParserRuleContext):
+                self.global_names |= assigned_in(child)
+
+        mainf = ir.Function(self.module, MAIN_TYPE, name="main")
+        # the entry block clears every variable once all are known, so main can be
+        # called more than once in a process and each run starts afresh
+        main_block = mainf.append_basic_block("entry")
+        body = mainf.append_basic_block("body")
+        self.current_builder = ir.IRBuilder(body)
+        self.buffer_stdout()
+        
+        for child in ctx.getChildren():
+            self.visit(child)
+
+        self.current_builder.call(self.libc("fflush"), [ir.Constant(STRING_TYPE, None)])
+        if self.profile:
+            self.report_counters()
+        self.current_builder.ret(ir.Constant(DEFAULT_INT, 0))
+
+        entry = ir.IRBuilder(main_block)
+        for variable in self.variables.values():
+            entry.store(ir.Constant(variable.value_type, None), variable)
+        entry.branch(body)
+
+    def c_stream(self, name: str):
+        """
+        Load the C library's FILE *stdout or *stderr, which Darwin calls
+        __stdoutp and __stderrp.
+        """
+        if "apple" in self.module.triple or "darwin" in self.module.triple:
+            name = f"__{name}p"
+        stream = self.module.globals.get(name)
+        if stream is None:
+            stream = ir.GlobalVariable(self.module, STRING_TYPE, name=name)
+            stream.linkage = "external"
+        return self.current_builder.load(stream)
+
+    def buffer_stdout(self):
+        """
+        Switch stdout to full buffering, so printf writes a whole buffer of
+        receipts at once instead of a line at a time on a terminal.
+        """
+        self.current_builder.call(self.libc("setvbuf"), [
+            self.c_stream("stdout"), ir.Constant(STRING_TYPE, None),
+            ir.Constant(DEFAULT_INT, IOFBF), ir.Constant(INT_TYPE, STDOUT_BUFFER_SIZE)])
+
+    # PROFILING
+    def count(self, ctx: ParserRuleContext):
+        """
+        Emit an increment of a counter of its own for a statement, SCAN, CONFIRM
+        or task body. Only called when profiling.
+        """
+        counter = ir.GlobalVariable(self.module, INT_TYPE, name=self.module.get_unique_name("profile.count"))
+        counter.linkage = "internal"
+        counter.initializer = ir.Constant(INT_TYPE, 0)
+        self.counters.append((site_label(*context_site(ctx)), counter))
+        builder = self.current_builder
+        builder.store(builder.add(builder.load(counter), ir.Constant(INT_TYPE, 1)), counter)
+
+    def report_counters(self):
+        """
+        Print every counter to stderr in source order, in the interpreter's
+        --profile layout minus the times.
+        """
+        builder = self.current_builder
+        stderr = self.c_stream("stderr")
+        builder.call(self.libc("fprintf"), [stderr, self.global_string(f"{'count':>10}  site\n")])
+        line = self.global_string("%10lld  %s\n")
+        for label, counter in self.counters:
+            builder.call(self.libc("fprintf"), [stderr, line, builder.load(counter), self.global_string(label)])
+
+    def visitMain_stmt(self, ctx: CASHParser.Main_stmtContext):
+        if self.profile:
+            self.count(ctx.statement())
+        return self.visitChildren(ctx)
+
+    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
+        """
+        Compile a task to an internal function taking its typed parameters.
+        The function is registered before its body is compiled, so a task can
+        call itself; later definitions with the same name replace it.
+        """
+        name = ctx.IDENTIFIER(0).getText()
+        params = self.visit(ctx.param_list())
+        func_type = ir.FunctionType(ir.VoidType(), [self.storage_type(param) for param in params])
+        func = ir.Function(self.module, func_type, name=self.module.get_unique_name("task." + name))
+        func.linkage = "internal"
+        self.tasks[name] = func
+
+        # the entry block only holds the stack slots and jumps to the body once
+        # every local is known
+        caller = self.current_builder
+        self.allocas = ir.IRBuilder(func.append_basic_block("entry"))
+        body = func.append_basic_block("body")
+        self.current_builder = ir.IRBuilder(body)
+        self.locals = {}
+        for param, arg in zip(params, func.args):
+            self.locals[param] = self.allocas.alloca(arg.type, name=param)
+            self.allocas.store(arg, self.locals[param])
+        if self.profile:
+            self.count(ctx)
+
+        self.visit(ctx.task_body())
+        self.current_builder.ret_void()
+        self.allocas.branch(body)
+        self.current_builder, self.locals, self.allocas = caller, None, None
+
+    def visitParam_list(self, ctx: CASHParser.Param_listContext):
+        return [param.getText() for param in ctx.IDENTIFIER()]
+
+    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
+        func = self.current_builder.function
+        cond_block = func.append_basic_block("scan.cond")
+        body_block = func.append_basic_block("scan.body")
+        end_block = func.append_basic_block("scan.end")
+        if self.profile:
+            self.count(ctx)
+
+        self.current_builder.branch(cond_block)
+        self.current_builder.position_at_end(cond_block)
+        cond = self.visit(ctx.bool_expr())
+        self.current_builder.cbranch(cond, body_block, end_block)
+
+        self.current_builder.position_at_end(body_block)
+        for stmt in ctx.main_stmt():
+            self.visit(stmt)
+        self.current_builder.branch(cond_block)
+
+        self.current_builder.position_at_end(end_block)
+
+    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
+        """
+        CONFIRM and every CHECK_AGAIN test their condition in turn, and the first
+        one that holds runs its statement. FALLBACK runs when none of them did.
+        """
+        func = self.current_builder.function
+        end_block = func.append_basic_block("confirm.end")
+        conds = ctx.bool_expr()
+        stmts = ctx.main_stmt()
+        if self.profile:
+            self.count(ctx)
+
+        for cond, stmt in zip(conds, stmts):
+            then_block = func.append_basic_block("confirm.then")
+            else_block = func.append_basic_block("confirm.else")
+            self.current_builder.cbranch(self.visit(cond), then_block, else_block)
+
+            self.current_builder.position_at_end(then_block)
+            self.visit(stmt)
+            self.current_builder.branch(end_block)
+            self.current_builder.position_at_end(else_block)
+
+        if len(stmts) > len(conds):
+            self.visit(stmts[len(conds)])
+        self.current_builder.branch(end_block)
+        self.current_builder.position_at_end(end_block)
+
+    # STATEMENTS
+    def visitCost(self, ctx: CASHParser.CostContext):
+        var_name = ctx.IDENTIFIER().getText()
+        self.store(var_name, self.visit(ctx.expression()))
+
+    def visitPrint(self, ctx: CASHParser.PrintContext):
+        # Case 1: String only
+        if ctx.expression() and ctx.expression().getChild(0).getText().startswith('"'):
+            text = ctx.expression().getChild(0).getText()[1:-1] + "\n"
+            self.current_builder.call(self.with_printf(), [self.global_string(text)])
+
+        # Case 2: String and variable
+        elif ctx.STRING() and ctx.expression():
+            spec, arg = self.printable(self.visit(ctx.expression()))
+            format_str = ctx.STRING().getText()[1:-1] + spec + "\n"
+            self.current_builder.call(self.with_printf(), [self.global_string(format_str), arg])
+
+        # Case 3: Variable only
+        elif ctx.expression():
+            spec, arg = self.printable(self.visit(ctx.expression()))
+            self.current_builder.call(self.with_printf(), [self.global_string(spec + "\n"), arg])
+
+    def printable(self, value):
+        """
+        The printf conversion and argument that print a value like the interpreter does.
+        """
+        if value.type == STRING_TYPE:
+            return "%s", value
+        if self.cents:
+            return "%s", self.current_builder.call(self.with_cents_repr(), [value])
+        if value.type == FLOAT_TYPE:
+            return "%s", self.current_builder.call(self.with_float_repr(), [value])
+        if value.type == NUMBER_TYPE:
+            return "%s", self.current_builder.call(self.with_number_repr(), [value])
+        return "%lld", value
+
+    def visitDiscount(self, ctx: CASHParser.DiscountContext):
+        percentage = self.visit(ctx.expression()) 
+        var_name = ctx.IDENTIFIER().getText()
+        value = self.load(var_name)
+        
+        if value is not None and self.cents:
+            builder = self.current_builder
+            discount = builder.call(self.with_round_div(), [
+                builder.mul(value, percentage), ir.Constant(INT_TYPE, fixed_point.PERCENT_SCALE)])
+            self.store(var_name, builder.sub(value, discount))
+        elif value is not None:
+            # value - value * (percentage / 100), always as a float
+            value = self.as_float(value)
+            rate = self.current_builder.fdiv(self.as_float(percentage), ir.Constant(FLOAT_TYPE, 100.0))
+            discount = self.current_builder.fmul(value, rate)
+            self.store(var_name, self.current_builder.fsub(value, discount))
+
+    def visitAsk(self, ctx: CASHParser.AskContext):
+        """
+        Read a float from stdin with scanf. The prompt is printed like in the
+        interpreter unless prompts are turned off for scripted input, and a
+        missing or malformed answer ends the program.
+        """
+        var_name = ctx.IDENTIFIER().getText()
+        builder = self.current_builder
+        if self.prompt:
+            builder.call(self.with_printf(), [self.global_string(ctx.STRING().getText()[1:-1] + ": ")])
+            builder.call(self.libc("fflush"), [ir.Constant(STRING_TYPE, None)])
+
+        answer = self.ask_buffer()
+        read = builder.call(self.libc("scanf"), [self.global_string(" %lf"), answer])
+        func = builder.function
+        failed = func.append_basic_block("ask.failed")
+        done = func.append_basic_block("ask.done")
+        builder.cbranch(builder.icmp_signed("==", read, ir.Constant(DEFAULT_INT, 1)), done, failed)
+
+        builder.position_at_end(failed)
+        builder.call(self.with_printf(), [self.global_string(f"No input left for ASK {var_name}\n")])
+        builder.call(self.libc("exit"), [ir.Constant(DEFAULT_INT, 1)])
+        builder.unreachable()
+
+        builder.position_at_end(done)
+        if self.cents:
+            self.store(var_name, self.cents_from_double(builder.load(answer)))
+        else:
+            self.store(var_name, builder.load(answer))
+
+    def ask_buffer(self):
+        if "cash.ask_buffer" not in self.module.globals:
+            glob = ir.GlobalVariable(self.module, FLOAT_TYPE, name="cash.ask_buffer")
+            glob.initializer = ir.Constant(FLOAT_TYPE, 0.0)
+            glob.linkage = "internal"
+        return self.module.globals["cash.ask_buffer"]
+
+    def visitTodo(self, ctx: CASHParser.TodoContext):
+        name = ctx.IDENTIFIER().getText()
+        if name not in self.tasks:
+            raise KeyError(f"Task {name} not found!!")
+        func = self.tasks[name]
+
+        args = [self.visit(expr) for expr in ctx.actual_param_list().expression()]
+        # like the interpreter, extra arguments are dropped and missing ones start out as 0
+        args = [self.coerce(arg, param.type) for arg, param in zip(args, func.args)]
+        args += [ir.Constant(param.type, None) for param in func.args[len(args):]]
+        self.current_builder.call(func, args)
+
+    # EXPRESSIONS
+    def visitNested(self, ctx: CASHParser.NestedContext):
+        return self.visit(ctx.expression())
+
+    def arithmetic(self, op: str, left, right):
+        """
+        Integer arithmetic stays in i64. Anything involving a float is done in
+        double, and `/` is true division like in the interpreter. The result of
+        a NUMBER_TYPE operand is a float only when one of the operands is.
+        """
+        builder = self.current_builder
+        if self.cents:
+            return self.cents_arithmetic(op, left, right)
+        if left.type == INT_TYPE and right.type == INT_TYPE and op != "/":
+            return {"*": builder.mul, "+": builder.add, "-": builder.sub}[op](left, right)
+
+        operation = {"*": builder.fmul, "+": builder.fadd, "-": builder.fsub, "/": builder.fdiv}[op]
+        value = operation(self.as_float(left), self.as_float(right))
+        if NUMBER_TYPE in (left.type, right.type) and op != "/":
+            return self.number(builder.or_(self.is_float(left), self.is_float(right)), value)
+        return value
+
+    def cents_arithmetic(self, op: str, left, right):
+        """
+        Arithmetic on counts of cents: products and quotients are rounded back
+        to whole cents by cash.round_div.
+        """
+        builder = self.current_builder
+        scale = ir.Constant(INT_TYPE, fixed_point.SCALE)
+        if op == "+":
+            return builder.add(left, right)
+        if op == "-":
+            return builder.sub(left, right)
+        if op == "*":
+            return builder.call(self.with_round_div(), [builder.mul(left, right), scale])
+        return builder.call(self.with_round_div(), [builder.mul(left, scale), right])
+
+    def cents_from_double(self, value):
+        """
+        Round an ASK answer to cents like fixed_point.from_number.
+        """
+        builder = self.current_builder
+        negative = builder.fcmp_ordered("<", value, ir.Constant(FLOAT_TYPE, 0.0))
+        magnitude = builder.select(negative, builder.fneg(value), value)
+        scaled = builder.fadd(builder.fmul(magnitude, ir.Constant(FLOAT_TYPE, float(fixed_point.SCALE))),
+                              ir.Constant(FLOAT_TYPE, 0.5))
+        cents = builder.fptosi(scaled, INT_TYPE)
+        return builder.select(negative, builder.neg(cents), cents)
+
+    def visitMult(self, ctx: CASHParser.MultContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        return self.arithmetic("*", left, right)
+
+    def visitAdd(self, ctx: CASHParser.AddContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        return self.arithmetic("+", left, right)
+
+    def visitSub(self, ctx: CASHParser.SubContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        return self.arithmetic("-", left, right)
+
+    def visitDiv(self, ctx: CASHParser.DivContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        return self.arithmetic("/", left, right)
+
+    def visitStrlit(self, ctx: CASHParser.StrlitContext):
+        return self.string_literal(ctx.getText()[1:-1])
+
+    def string_literal(self, text: str):
+        """
+        A pointer to the pooled global constant holding a string literal.
+        """
+        return self.global_string(text)
+
+    def global_string(self, text: str):
+        """
+        A pointer to the null-terminated global constant holding `text`, made
+        the first time the text is used. It is a constant expression, so it
+        can be used from any function.
+        """
+        if text in self.strings:
+            return self.strings[text]
+        value_bytes = (text + "\0").encode()
+
+        array_type = ir.ArrayType(BYTE_TYPE, len(value_bytes))
+        const_val = ir.Constant(array_type, bytearray(value_bytes))
+
+        var_name = self.next_constant()
+        glob = ir.GlobalVariable(self.module, array_type, name=var_name)
+        glob.global_constant = True
+        # private and without a meaningful address, so LLVM may also merge it
+        # with equal strings from the C runtime helpers
+        glob.linkage = "private"
+        glob.unnamed_addr = True
+        glob.initializer = const_val
+        self.strings[text] = glob.bitcast(STRING_TYPE)
+        return self.strings[text]
+
+    def visitFloat(self, ctx: CASHParser.FloatContext):
+        if self.cents:
+            return ir.Constant(INT_TYPE, fixed_point.from_literal(ctx.FLOAT().getText()))
+        # Convert comma to decimal point for float parsing
+        float_str = ctx.FLOAT().getText().replace(',', '.')
+        return ir.Constant(FLOAT_TYPE, float(float_str))
+
+    def visitInt(self, ctx: CASHParser.IntContext):
+        if self.cents:
+            return ir.Constant(INT_TYPE, fixed_point.from_literal(ctx.INT().getText()))
+        return ir.Constant(INT_TYPE, int(ctx.INT().getText()))
+
+    def visitVar(self, ctx: CASHParser.VarContext):
+        value = self.load(ctx.IDENTIFIER().getText())
+        if value is None:
+            return ir.Constant(INT_TYPE, 0)
+        return value
+
+    # BOOLEAN EXPRESSIONS
+    def visitNested_bool(self, ctx: CASHParser.Nested_boolContext):
+        return self.visit(ctx.bool_expr())
+
+    def visitComp(self, ctx: CASHParser.CompContext):
+        return self.visit(ctx.comparison())
+
+    def visitComparison(self, ctx: CASHParser.ComparisonContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        op = COMPARISONS[ctx.getChild(1).getText()]
+        if left.type == INT_TYPE and right.type == INT_TYPE:
+            return self.current_builder.icmp_signed(op, left, right)
+        if left.type == STRING_TYPE and right.type == STRING_TYPE:
+            order = self.current_builder.call(self.libc("strcmp"), [left, right])
+            return self.current_builder.icmp_signed(op, order, ir.Constant(DEFAULT_INT, 0))
+        if STRING_TYPE in (left.type, right.type):
+            if op != "==":
+                raise TypeError(f"Cannot compare {left.type} and {right.type} with {op}")
+            # a string never equals a number
+            return ir.Constant(BOOL_TYPE, False)
+        return self.current_builder.fcmp_ordered(op, self.as_float(left), self.as_float(right))
+
+    def visitNot(self, ctx: CASHParser.NotContext):
+        return self.current_builder.not_(self.visit(ctx.bool_expr()))
+
+    def short_circuit(self, ctx: ParserRuleContext, is_and: bool):
+        """
+        Evaluate the right operand only when the left one does not decide the
+        result: AND stops at false, OR stops at true.
+        """
+        func = self.current_builder.function
+        left = self.visit(ctx.bool_expr(0))
+        left_block = self.current_builder.block
+        right_block = func.append_basic_block("and.rhs" if is_and else "or.rhs")
+        end_block = func.append_basic_block("and.end" if is_and else "or.end")
+        if is_and:
+            self.current_builder.cbranch(left, right_block, end_block)
+        else:
+            self.current_builder.cbranch(left, end_block, right_block)
+
+        self.current_builder.position_at_end(right_block)
+        right = self.visit(ctx.bool_expr(1))
+        right_block = self.current_builder.block
+        self.current_builder.branch(end_block)
+
+        self.current_builder.position_at_end(end_block)
+        result = self.current_builder.phi(BOOL_TYPE)
+        result.add_incoming(ir.Constant(BOOL_TYPE, not is_and), left_block)
+        result.add_incoming(right, right_block)
+        return result
+
+    def visitAnd(self, ctx: CASHParser.AndContext):
+        return self.short_circuit(ctx, True)
+
+    def visitOr(self, ctx: CASHParser.OrContext):
+        return self.short_circuit(ctx, False)
+
+    # RUNTIME
+    def with_float_repr(self):
+        """
+        Define or return `cash.float_repr(double) -> i8*`, which formats a float
+        like Python's repr: the fewest digits that read back as the same value,
+        written in exponent form below 1e-4 and from 1e16 on, and whole numbers
+        with a trailing ".0". The result lives in a static buffer.
+        """
+        if "cash.float_repr" in self.module.globals:
+            return self.module.globals["cash.float_repr"]
+        func = ir.Function(self.module, ir.FunctionType(STRING_TYPE, (FLOAT_TYPE,)), name="cash.float_repr")
+        func.linkage = "internal"
+        x = func.args[0]
+        buf = self.format_buffer()
+        size = ir.Constant(INT_TYPE, FORMAT_BUFFER_SIZE)
+        snprintf = self.libc("snprintf")
+
+        entry = func.append_basic_block("entry")
+        special = func.append_basic_block("special")
+        shortest = func.append_basic_block("shortest")
+        found = func.append_basic_block("found")
+        fixed = func.append_basic_block("fixed")
+        whole = func.append_basic_block("whole")
+        done = func.append_basic_block("done")
+
+        # x - x is nan exactly when x is inf or nan, neither of which has digits
+        builder = ir.IRBuilder(entry)
+        difference = builder.fsub(x, x)
+        builder.cbranch(builder.fcmp_unordered("uno", difference, difference), special, shortest)
+
+        builder.position_at_end(special)
+        infinity = builder.select(builder.fcmp_ordered(">", x, ir.Constant(FLOAT_TYPE, 0.0)),
+                                  self.global_string("inf"), self.global_string("-inf"))
+        builder.ret(builder.select(builder.fcmp_unordered("uno", x, x), self.global_string("nan"), infinity))
+
+        # try 1, 2, ... significant digits until the text reads back as x
+        builder.position_at_end(shortest)
+        digits = builder.phi(DEFAULT_INT, name="digits")
+        digits.add_incoming(ir.Constant(DEFAULT_INT, 1), entry)
+        precision = builder.sub(digits, ir.Constant(DEFAULT_INT, 1))
+        builder.call(snprintf, [buf, size, self.global_string("%.*e"), precision, x])
+        parsed = builder.call(self.libc("strtod"), [buf, ir.Constant(ir.PointerType(STRING_TYPE), None)])
+        exact = builder.fcmp_ordered("==", parsed, x)
+        exhausted = builder.icmp_signed(">=", digits, ir.Constant(DEFAULT_INT, 17))
+        digits.add_incoming(builder.add(digits, ir.Constant(DEFAULT_INT, 1)), shortest)
+        builder.cbranch(builder.or_(exact, exhausted), found, shortest)
+
+        builder.position_at_end(found)
+        exponent_text = builder.call(self.libc("strchr"), [buf, ir.Constant(DEFAULT_INT, ord("e"))])
+        exponent = builder.call(self.libc("atoi"), [builder.gep(exponent_text, [ir.Constant(DEFAULT_INT, 1)])])
+        use_exponent = builder.or_(builder.icmp_signed("<", exponent, ir.Constant(DEFAULT_INT, -4)),
+                                   builder.icmp_signed(">=", exponent, ir.Constant(DEFAULT_INT, 16)))
+        builder.cbranch(use_exponent, done, fixed)
+
+        # the same digits without an exponent
+        builder.position_at_end(fixed)
+        decimals = builder.sub(precision, exponent)
+        negative = builder.icmp_signed("<", decimals, ir.Constant(DEFAULT_INT, 0))
+        decimals = builder.select(negative, ir.Constant(DEFAULT_INT, 0), decimals)
+        builder.call(snprintf, [buf, size, self.global_string("%.*f"), decimals, x])
+        builder.cbranch(builder.icmp_signed("==", decimals, ir.Constant(DEFAULT_INT, 0)), whole, done)
+
+        builder.position_at_end(whole)
+        builder.call(self.libc("strcat"), [buf, self.global_string(".0")])
+        builder.branch(done)
+
+        builder.position_at_end(done)
+        builder.ret(buf)
+        return func
+
+    def with_number_repr(self):
+        """
+        Define or return `cash.number_repr(NUMBER_TYPE) -> i8*`, which prints a
+        float like float_repr and an integer without a fraction.
+        """
+        if "cash.number_repr" in self.module.globals:
+            return self.module.globals["cash.number_repr"]
+        func = ir.Function(self.module, ir.FunctionType(STRING_TYPE, (NUMBER_TYPE,)), name="cash.number_repr")
+        func.linkage = "internal"
+        float_repr = self.with_float_repr()
+        buf = self.format_buffer()
+
+        entry = func.append_basic_block("entry")
+        as_float = func.append_basic_block("float")
+        as_int = func.append_basic_block("integer")
+
+        builder = ir.IRBuilder(entry)
+        value = builder.extract_value(func.args[0], 1)
+        builder.cbranch(builder.extract_value(func.args[0], 0), as_float, as_int)
+
+        builder.position_at_end(as_float)
+        builder.ret(builder.call(float_repr, [value]))
+
+        builder.position_at_end(as_int)
+        integer = builder.fptosi(value, INT_TYPE)
+        builder.call(self.libc("snprintf"), [buf, ir.Constant(INT_TYPE, FORMAT_BUFFER_SIZE),
+                                             self.global_string("%lld"), integer])
+        builder.ret(buf)
+        return func
+
+    def with_cents_repr(self):
+        """
+        Define or return `cash.cents_repr(i64) -> i8*`, which prints a count of
+        cents with two decimals like fixed_point.text.
+        """
+        if "cash.cents_repr" in self.module.globals:
+            return self.module.globals["cash.cents_repr"]
+        func = ir.Function(self.module, ir.FunctionType(STRING_TYPE, (INT_TYPE,)), name="cash.cents_repr")
+        func.linkage = "internal"
+        value = func.args[0]
+        scale = ir.Constant(INT_TYPE, fixed_point.SCALE)
+
+        builder = ir.IRBuilder(func.append_basic_block("entry"))
+        negative = builder.icmp_signed("<", value, ir.Constant(INT_TYPE, 0))
+        magnitude = builder.select(negative, builder.neg(value), value)
+        sign = builder.select(negative, self.global_string("-"), self.global_string(""))
+        buf = self.format_buffer()
+        builder.call(self.libc("snprintf"), [buf, ir.Constant(INT_TYPE, FORMAT_BUFFER_SIZE),
+                                             self.global_string(f"%s%lld.%0{fixed_point.DIGITS}lld"), sign,
+                                             builder.sdiv(magnitude, scale), builder.srem(magnitude, scale)])
+        builder.ret(buf)
+        return func
+
+    def with_round_div(self):
+        """
+        Define or return `cash.round_div(i64 n, i64 d) -> i64`, n / d rounded to
+        the nearest integer with halves away from zero, like
+        fixed_point.round_div. Dividing by zero ends the program.
+        """
+        if "cash.round_div" in self.module.globals:
+            return self.module.globals["cash.round_div"]
+        func = ir.Function(self.module, ir.FunctionType(INT_TYPE, (INT_TYPE, INT_TYPE)), name="cash.round_div")
+        func.linkage = "internal"
+        n, d = func.args
+        zero = ir.Constant(INT_TYPE, 0)
+
+        entry = func.append_basic_block("entry")
+        by_zero = func.append_basic_block("by_zero")
+        divide = func.append_basic_block("divide")
+        builder = ir.IRBuilder(entry)
+        builder.cbranch(builder.icmp_signed("==", d, zero), by_zero, divide)
+
+        builder.position_at_end(by_zero)
+        builder.call(self.with_printf(), [self.global_string("Division by zero\n")])
+        builder.call(self.libc("exit"), [ir.Constant(DEFAULT_INT, 1)])
+        builder.unreachable()
+
+        # sdiv truncates and srem keeps the sign of n, so the quotient moves one
+        # step away from zero when the remainder is at least half the divisor
+        builder.position_at_end(divide)
+        quotient = builder.sdiv(n, d)
+        remainder = builder.srem(n, d)
+        remainder = builder.select(builder.icmp_signed("<", remainder, zero), builder.neg(remainder), remainder)
+        divisor = builder.select(builder.icmp_signed("<", d, zero), builder.neg(d), d)
+        away = builder.icmp_signed(">=", builder.add(remainder, remainder), divisor)
+        negative = builder.xor(builder.icmp_signed("<", n, zero), builder.icmp_signed("<", d, zero))
+        step = builder.select(negative, ir.Constant(INT_TYPE, -1), ir.Constant(INT_TYPE, 1))
+        builder.ret(builder.add(quotient, builder.select(away, step, zero)))
+        return func
+
+    def format_buffer(self):
+        if "cash.format_buffer" not in self.module.globals:
+            buffer_type = ir.ArrayType(BYTE_TYPE, FORMAT_BUFFER_SIZE)
+            glob = ir.GlobalVariable(self.module, buffer_type, name="cash.format_buffer")
+            glob.initializer = ir.Constant(buffer_type, None)
+            glob.linkage = "internal"
+        return self.module.globals["cash.format_buffer"].bitcast(STRING_TYPE)
+
+    def write_llvm_file(self):
+        """
+        Output the generated LLVM IR to a .ll file for inspection or compilation.
+        """
+        filename = self.source_file.stem
+        source_file = "compiler/" + filename + '.ll'
+        with open(source_file, "w") as out:
+            out.write(str(self.module))
+
+    def call_llvm_compile(self):
+        """
+        Use clang to compile the .ll file into a native executable.
+        Returns the path of the executable.
+        """
+        filename = self.source_file.stem
+        source_file = "compiler/" + filename + '.ll'
+        subprocess.run(['clang', source_file, '-w', '-o', source_file.split(".")[0]])
+        return Path(source_file.split(".")[0])
+
+    def optimize(self, opt_level: int = 2):
+        """
+        Parse the generated IR and run the LLVM optimization pipeline on it.
+        Returns the optimized module and the target machine it was tuned for.
+        """
+        llvm.initialize_native_asmprinter()
+        module = llvm.parse_assembly(str(self.module))
+        module.verify()
+
+        target = llvm.Target.from_default_triple()
+        machine = target.create_target_machine(opt=opt_level)
+        tuning = llvm.create_pipeline_tuning_options(speed_level=opt_level)
+        builder = llvm.create_pass_builder(machine, tuning)
+        builder.getModulePassManager().run(module, builder)
+        return module, machine
+
+    def emit_object(self, opt_level: int = 2) -> bytes:
+        """
+        Optimize the module and return it as a native object file.
+        """
+        module, machine = self.optimize(opt_level)
+        return machine.emit_object(module)
+
+    def print_llvm(self):
+        """
+        Return the LLVM IR as a string.
+        """
+        return str(self.module)
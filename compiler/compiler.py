@@ -1,285 +1,112 @@
+import argparse
 import os
+import platform
 import subprocess
 import sys
+from contextlib import nullcontext
 from pathlib import Path
 
-import llvmlite.ir as ir
-import llvmlite.binding as llvm
+import llvmlite
 
-from antlr4 import *
-from cash.CASHParser import CASHParser
-from cash.CASHLexer import CASHLexer
-from cash.CASHVisitor import CASHVisitor
+# passes shared with the interpreter live next to it
+sys.path.append(str(Path(__file__).resolve().parent.parent / "interpreter"))
+from program_cache import ProgramCache, cache_key
 
-def init_module(source_file: Path):
+# part of every cache key; bump it whenever the generated code changes
+COMPILER_VERSION = "8"
+
+def run_program(artifact, jit: bool, input_file: str | None = None):
     """
-    Initialize an LLVM module for the given source file.
-    This sets up the target and data layout so LLVM knows how to emit code for the host system.
+    Run a JIT object in this process or an executable as a child process,
+    with stdin read from `input_file` when one is given.
     """
-    llvm.initialize()
-    llvm.initialize_native_target()
-    module = ir.Module(name=source_file.name)
-
-    target = llvm.Target.from_default_triple()
-    machine = target.create_target_machine()
-
-    module.triple = machine.triple
-    module.data_layout = str(machine.target_data)
-    return module
-
-BYTE_TYPE = ir.IntType(8) 
-DEFAULT_INT = ir.IntType(32)  
-FLOAT_TYPE = ir.FloatType()
-PRINTF_TYPE = ir.FunctionType(DEFAULT_INT, (ir.PointerType(BYTE_TYPE),), var_arg=True) 
-MAIN_TYPE = ir.FunctionType(DEFAULT_INT, ()) 
-
-
-class Compiler(CASHVisitor):
+    with open(input_file, "rb") if input_file is not None else nullcontext() as stdin:
+        if jit:
+            from jit import run_object
+            if stdin is not None:
+                os.dup2(stdin.fileno(), 0)
+            sys.stdout.flush()
+            sys.exit(run_object(artifact))
+        subprocess.run(str(artifact), stdin=stdin)
+
+def program_key(source: bytes, jit: bool, fold: bool, prompt: bool, profile: bool, cents: bool) -> str:
     """
-    The main compiler class that walks the parse tree
-    and generates LLVM IR for each supported CASH construct.
+    Everything that decides the compiled artifact: the source, this compiler,
+    the LLVM it runs on, the target and the options that change codegen.
     """
-
-    def __init__(self, source_file: Path):
-        self.source_file = source_file
-        self.module = init_module(source_file)
-        self.uses_c_printf = None  
-        self.current_builder = None 
-        self.constant_counter = 0 
-        self.variables = {}  
-        self.string_vars = {}
-
-    def next_constant(self, prefix: str = "str"):
-        """
-        Generate a unique name for a new global string constant.
-        This ensures no naming collisions between multiple string literals.
-        """
-        self.constant_counter += 1
-        return f"{prefix}{self.constant_counter}"
-
-    def with_printf(self):
-        """
-        Declare or return the printf function.
-        Needed to call printf from generated LLVM IR.
-        """
-        if not self.uses_c_printf:
-            func = ir.Function(self.module, PRINTF_TYPE, name="printf")
-            self.uses_c_printf = func
-        return self.uses_c_printf
-
-    def visitProgram(self, ctx: CASHParser.ProgramContext):
-        """
-        Generate the LLVM IR for the main function.
-        CASH starts execution here. Each statement is visited in order.
-        """
-        mainf = ir.Function(self.module, MAIN_TYPE, name="main")
-        main_block = mainf.append_basic_block("entry")
-        self.current_builder = ir.IRBuilder(main_block)
-        
-        for child in ctx.children:
-            if hasattr(child, 'children'):
-                for stmt in child.children:
-                    self.visit(stmt)
-            else:
-                self.visit(child)
-
-        self.current_builder.ret(ir.Constant(DEFAULT_INT, 0))
-
-    def visitCost(self, ctx: CASHParser.CostContext):
-        var_name = ctx.IDENTIFIER().getText()
-        expr = ctx.expression()
-        value = self.visit(expr)
-        
-        if isinstance(value, tuple):
-            self.string_vars[var_name] = value
-        else:  
-            self.variables[var_name] = value
-
-    def visitPrint(self, ctx: CASHParser.PrintContext):
-        # Case 1: String only
-        if ctx.expression() and ctx.expression().getChild(0).getText().startswith('"'):
-            value = ctx.expression().getChild(0).getText()[1:-1] + "\n\0" 
-            value_bytes = value.encode()
-
-            array_type = ir.ArrayType(BYTE_TYPE, len(value_bytes))
-            const_val = ir.Constant(array_type, bytearray(value_bytes))
-
-            var_name = self.next_constant()
-            glob = ir.GlobalVariable(self.module, array_type, name=var_name)
-            glob.global_constant = True
-            glob.initializer = const_val
-
-            ptr = self.current_builder.bitcast(glob, ir.PointerType(BYTE_TYPE))
-            self.current_builder.call(self.with_printf(), [ptr])
-
-        # Case 2: String and variable
-        elif ctx.STRING() and ctx.expression():
-            format_str = ctx.STRING().getText()[1:-1] + "%d\n\0"
-            format_bytes = format_str.encode()
-
-            array_type = ir.ArrayType(BYTE_TYPE, len(format_bytes))
-            const_val = ir.Constant(array_type, bytearray(format_bytes))
-
-            var_name = self.next_constant()
-            glob = ir.GlobalVariable(self.module, array_type, name=var_name)
-            glob.global_constant = True
-            glob.initializer = const_val
-
-            ptr = self.current_builder.bitcast(glob, ir.PointerType(BYTE_TYPE))
-            var_value = self.visit(ctx.expression())
-
-            if isinstance(var_value, tuple):
-                var_value = var_value[1]
-
-            self.current_builder.call(self.with_printf(), [ptr, var_value])
-
-        # Case 3: Variable only
-        elif ctx.expression():
-            format_str = "%d\n\0"
-            format_bytes = format_str.encode()
-
-            array_type = ir.ArrayType(BYTE_TYPE, len(format_bytes))
-            const_val = ir.Constant(array_type, bytearray(format_bytes))
-
-            var_name = self.next_constant()
-            glob = ir.GlobalVariable(self.module, array_type, name=var_name)
-            glob.global_constant = True
-            glob.initializer = const_val
-
-            ptr = self.current_builder.bitcast(glob, ir.PointerType(BYTE_TYPE))
-            var_value = self.visit(ctx.expression())
-
-            if isinstance(var_value, tuple):
-                var_value = var_value[1]
-
-            self.current_builder.call(self.with_printf(), [ptr, var_value])
-
-
-    def visitDiscount(self, ctx: CASHParser.DiscountContext):
-        percentage = self.visit(ctx.expression()) 
-        var_name = ctx.IDENTIFIER().getText()
-        
-        if var_name in self.variables:
-            value = self.variables[var_name]
-            hundred = ir.Constant(DEFAULT_INT, 100)
-            
-            # Calculate (100 - percentage)
-            diff = self.current_builder.sub(hundred, percentage)
-            # Multiply by value
-            product = self.current_builder.mul(value, diff)
-            # Divide by 100
-            discounted = self.current_builder.sdiv(product, hundred)
-            
-            self.variables[var_name] = discounted
-
-    def visitNested(self, ctx: CASHParser.NestedContext):
-        return self.visit(ctx.expression())
-
-    def visitMult(self, ctx: CASHParser.MultContext):
-        left = self.visit(ctx.expression(0))
-        right = self.visit(ctx.expression(1))
-        return self.current_builder.mul(left, right)
-
-    def visitAdd(self, ctx: CASHParser.AddContext):
-        left = self.visit(ctx.expression(0))
-        right = self.visit(ctx.expression(1))
-        return self.current_builder.add(left, right)
-
-    def visitSub(self, ctx: CASHParser.SubContext):
-        left = self.visit(ctx.expression(0))
-        right = self.visit(ctx.expression(1))
-        return self.current_builder.sub(left, right)
-
-    def visitDiv(self, ctx: CASHParser.DivContext):
-        left = self.visit(ctx.expression(0))
-        right = self.visit(ctx.expression(1))
-        return self.current_builder.sdiv(left, right)
-
-    def visitStrlit(self, ctx: CASHParser.StrlitContext):
-        value = ctx.getText()[1:-1] + "\0"  
-        value_bytes = value.encode()
-
-        array_type = ir.ArrayType(BYTE_TYPE, len(value_bytes))
-        const_val = ir.Constant(array_type, bytearray(value_bytes))
-
-        var_name = self.next_constant()
-        glob = ir.GlobalVariable(self.module, array_type, name=var_name)
-        glob.global_constant = True
-        glob.initializer = const_val
-
-        ptr = self.current_builder.bitcast(glob, ir.PointerType(BYTE_TYPE))
-        return (value, ptr)
-
-    def visitFloat(self, ctx: CASHParser.FloatContext):
-        # Convert comma to decimal point for float parsing
-        float_str = ctx.FLOAT().getText().replace(',', '.')
-        return ir.Constant(FLOAT_TYPE, float(float_str))
-
-    def visitInt(self, ctx: CASHParser.IntContext):
-        return ir.Constant(DEFAULT_INT, int(ctx.INT().getText()))
-
-    def visitVar(self, ctx: CASHParser.VarContext):
-        var_name = ctx.IDENTIFIER().getText()
-        if var_name in self.variables:
-            return self.variables[var_name]
-        elif var_name in self.string_vars:
-            return self.string_vars[var_name]
-        return ir.Constant(DEFAULT_INT, 0)
-
-    def write_llvm_file(self):
-        """
-        Output the generated LLVM IR to a .ll file for inspection or compilation.
-        """
-        filename = self.source_file.stem
-        source_file = "compiler/" + filename + '.ll'
-        with open(source_file, "w") as out:
-            out.write(str(self.module))
-
-    def call_llvm_compile(self):
-        """
-        Use clang to compile the .ll file into a native executable.
-        """
-        filename = self.source_file.stem
-        source_file = "compiler/" + filename + '.ll'
-        subprocess.run(['clang', source_file, '-w', '-o', source_file.split(".")[0]])
-
-    def print_llvm(self):
-        """
-        Return the LLVM IR as a string.
-        """
-        return str(self.module)
-
+    # llvmlite pins its LLVM, and the host decides the default target; neither
+    # needs the LLVM library loaded, which is slow to import
+    return cache_key(source, COMPILER_VERSION, llvmlite.__version__, sys.platform, platform.machine(),
+                     "jit" if jit else "exe", "fold" if fold else "no-fold",
+                     "prompt" if prompt else "no-prompt", "profile" if profile else "no-profile",
+                     "cents" if cents else "float")
 
 def main():
     """
     The main driver: parses the source file, runs the compiler,
     writes the IR, compiles it, and runs the resulting program.
     """
-    if len(sys.argv) >= 2:
-        fname = sys.argv[1]
-        fpath = Path(fname)
-
-        # parse the CASH source using ANTLR 
-        input_stream = FileStream(fname, encoding="utf-8")
-        lexer = CASHLexer(input_stream)
-        token_stream = CommonTokenStream(lexer)
-        parser = CASHParser(token_stream)
-        tree = parser.program()
-        
-        # compile the parse tree to LLVM 
-        compiler = Compiler(fpath)
-        compiler.visit(tree)
-
-        # optionally print LLVM IR for debugging 
-        if "--debug" in sys.argv:
-            print(compiler.print_llvm())
-
-        # compile and run
-        compiler.write_llvm_file()
-        compiler.call_llvm_compile()
-        subprocess.run(f"./compiler/{fpath.stem}")
-    else:
-        print("Usage: python compiler.py path/to/file.cash [--debug]")
+    arg_parser = argparse.ArgumentParser(description="Compile a CASH program with LLVM and run it.")
+    arg_parser.add_argument("file", help="path to a .cash source file")
+    arg_parser.add_argument("--debug", action="store_true", help="print the LLVM IR, without using the cache")
+    arg_parser.add_argument("--no-fold", action="store_true",
+                            help="skip constant folding and dead-branch elimination")
+    arg_parser.add_argument("--jit", action="store_true",
+                            help="compile in process with MCJIT and run it right away instead of linking an executable")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="always compile, without reading or writing the program cache")
+    arg_parser.add_argument("--input", metavar="FILE",
+                            help="answer ASK from FILE, one value per line, without prompting")
+    arg_parser.add_argument("--no-prompt", action="store_true", help="read ASK answers without printing prompts")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="count how often every statement runs and print the counts to stderr at exit")
+    arg_parser.add_argument("--cents", action="store_true",
+                            help="compute exactly in whole cents instead of floats, rounding halves away from zero")
+    args = arg_parser.parse_args()
+    fpath = Path(args.file)
+    fold = not args.no_fold
+    # answers read from a file are never prompted for
+    prompt = not args.no_prompt and args.input is None
+
+    # a cached object or executable skips parsing and codegen altogether
+    cache = ProgramCache()
+    key = program_key(fpath.read_bytes(), args.jit, fold, prompt, args.profile, args.cents)
+    use_cache = not args.no_cache and not args.debug
+    cached = cache.lookup(key) if use_cache else None
+    if cached is not None:
+        run_program(cached.read_bytes() if args.jit else cached, args.jit, args.input)
+        return
+
+    # ANTLR and LLVM are only loaded when there is code to generate
+    from antlr4 import FileStream
+    from frontend import parse
+    from constant_folding import fold_constants
+    from codegen import Compiler
+
+    # parse the CASH source using ANTLR 
+    tree = parse(FileStream(args.file, encoding="utf-8"))
+    
+    # fold constants, then compile the parse tree to LLVM 
+    constants = fold_constants(tree, args.cents) if fold else {}
+    compiler = Compiler(fpath, constants, prompt, args.profile, args.cents)
+    compiler.visit(tree)
+
+    # optionally print LLVM IR for debugging 
+    if args.debug:
+        print(compiler.print_llvm())
+
+    # run in process, or compile to a native executable and run that
+    if args.jit:
+        obj = compiler.emit_object()
+        if not args.no_cache:
+            cache.store(key, obj)
+        run_program(obj, args.jit, args.input)
+        return
+    compiler.write_llvm_file()
+    executable = compiler.call_llvm_compile()
+    if not args.no_cache and executable.exists():
+        cache.store(key, executable.read_bytes(), mode=0o755)
+    run_program(f"./compiler/{fpath.stem}", args.jit, args.input)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
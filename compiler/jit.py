@@ -0,0 +1,69 @@
+"""
+Running compiled CASH programs in this process with LLVM's MCJIT.
+
+Kept apart from code generation, so running a cached object never imports
+ANTLR or the IR builder.
+"""
+import ctypes
+import ctypes.util
+import sys
+
+import llvmlite.binding as llvm
+
+# the type of the generated `int main(void)`
+MAIN_FUNCTION = ctypes.CFUNCTYPE(ctypes.c_int)
+
+SEEK_SET = 0
+
+
+def load_object(obj: bytes):
+    """
+    Load a native object file into a new MCJIT engine. Its functions can be
+    called for as long as the engine is kept alive.
+    """
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    machine = llvm.Target.from_default_triple().create_target_machine()
+    engine = llvm.create_mcjit_compiler(llvm.parse_assembly(""), machine)
+    engine.add_object_file(llvm.ObjectFileRef.from_data(obj))
+    engine.finalize_object()
+    engine.run_static_constructors()
+    return engine
+
+
+def main_function(engine):
+    """
+    The program's main function as a ctypes function.
+    """
+    return MAIN_FUNCTION(engine.get_function_address("main"))
+
+
+def libc():
+    return ctypes.CDLL(ctypes.util.find_library("c"))
+
+
+def flush_stdio():
+    # printf buffers in C stdio, which Python never flushes on its own
+    libc().fflush(None)
+
+
+def rewind_stdin():
+    """
+    Make C stdio read fd 0 from its start, dropping whatever it buffered and
+    the end of file it saw before.
+    """
+    c = libc()
+    stdin = ctypes.c_void_p.in_dll(c, "__stdinp" if sys.platform == "darwin" else "stdin")
+    c.fseek.argtypes = (ctypes.c_void_p, ctypes.c_long, ctypes.c_int)
+    c.fseek(stdin, 0, SEEK_SET)
+
+
+def run_object(obj: bytes) -> int:
+    """
+    Load a native object file into an MCJIT engine and call its main function.
+    """
+    engine = load_object(obj)
+    result = main_function(engine)()
+    flush_stdio()
+    return result
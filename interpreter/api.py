@@ -0,0 +1,217 @@
+"""
+Compiling CASH programs once and running them from Python.
+
+The command line front ends parse a file, run it once and print the receipts.
+A service can instead compile each script once at start-up and run it in
+process as often as it likes, from any number of threads:
+
+    import api
+
+    program = api.compile(Path("example_code/calc.cash").read_text())
+    receipts = program.run(inputs={"price": [10, 12], "quantity": 3})
+
+`run` returns the receipts as {"prefix", "value"} records like `--records`,
+with every value as the program computed it. Only the "llvm" engine returns
+each printed line as the prefix, with no value. Each run starts from a new global
+frame, so runs never share variables, tasks or answers.
+
+`engine` decides how the program runs. "closure" (the default) and "bytecode"
+run in the interpreter. "llvm" compiles the program to native code with
+MCJIT, and `Program.entry` is its `int main(void)` as a ctypes function.
+"""
+import os
+import sys
+import tempfile
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+from interpreter import load_program
+from symbol_table import DEFAULT_RECURSION_LIMIT, new_global_frame
+from inputs import MappingInput, StreamInput
+from output import NO_VALUE, RecordSink
+from closure_engine import ClosureCompiler, run as run_closures
+from bytecode import build_memos, compile_bytecode, run as run_bytecode
+from memo import DEFAULT_MEMO_SIZE
+
+ENGINES = ("closure", "bytecode", "llvm")
+
+# codegen.py and jit.py for the llvm engine live next to the interpreter
+COMPILER_DIR = str(Path(__file__).resolve().parent.parent / "compiler")
+if COMPILER_DIR not in sys.path:
+    sys.path.append(COMPILER_DIR)
+
+# compiled programs print with C stdio on the process's file descriptors, so
+# only one of them can run at a time
+NATIVE_LOCK = threading.Lock()
+
+
+class Channel:
+    """
+    The answers and the receipts of the run in progress on one thread. The
+    closures of a program are compiled against a channel once per thread, and
+    every run points it at its own.
+    """
+    __slots__ = ("inputs", "output")
+
+    def ask(self, name: str, prompt: str):
+        return self.inputs.ask(name, prompt)
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.output.receipt(prefix, value)
+
+    def flush(self):
+        pass
+
+
+class Program:
+    """
+    A compiled CASH program. Nothing about it changes after `compile`, so any
+    number of threads can run it at once. The interpreter engines keep the
+    closures and task memos they build per thread.
+    """
+    __slots__ = ("engine", "cents", "memo_size", "recursion_limit", "ast", "types", "code_object",
+                 "object", "jit", "entry", "threads")
+
+    def __init__(self, engine: str, cents: bool, memo_size: int, recursion_limit: int, ast=None, types=None,
+                 code_object=None, obj: bytes | None = None):
+        set_field = object.__setattr__
+        set_field(self, "engine", engine)
+        set_field(self, "cents", cents)
+        set_field(self, "memo_size", memo_size)
+        set_field(self, "recursion_limit", recursion_limit)
+        set_field(self, "ast", ast)
+        set_field(self, "types", types)
+        set_field(self, "code_object", code_object)
+        # the native object file, which can also be linked into other programs
+        set_field(self, "object", obj)
+        set_field(self, "jit", None)
+        set_field(self, "entry", None)
+        if obj is not None:
+            from jit import load_object, main_function
+            # the engine owns the machine code, so it lives as long as the program
+            set_field(self, "jit", load_object(obj))
+            set_field(self, "entry", main_function(self.jit))
+        set_field(self, "threads", threading.local())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a compiled Program cannot be changed")
+
+    @property
+    def address(self) -> int | None:
+        """
+        The address of the compiled `main`, for callers outside ctypes.
+        """
+        return self.jit.get_function_address("main") if self.jit is not None else None
+
+    def run(self, inputs=None) -> list:
+        """
+        Run the program once and return its receipts. `inputs` are the answers
+        to its ASKs: a dict with the answer or the list of answers for every
+        variable, or a list answering the ASKs in the order they run. A
+        program compiled with the LLVM engine only takes the list.
+
+        The records of the LLVM engine have another shape: native code only
+        reports the lines it printed, so `prefix` holds the whole line, value
+        included, and `value` is always None.
+        """
+        if self.engine == "llvm":
+            return self.run_native(inputs)
+
+        output = RecordSink()
+        answers = answer_source(inputs)
+        if self.engine == "bytecode":
+            memos = getattr(self.threads, "memos", None)
+            if memos is None:
+                memos = self.threads.memos = build_memos(self.code_object, self.memo_size)
+            frame = new_global_frame(len(self.code_object.names), self.recursion_limit)
+            run_bytecode(self.code_object, frame, memos, answers, output)
+            return output.records
+
+        compiled = getattr(self.threads, "compiled", None)
+        if compiled is None:
+            self.threads.channel = Channel()
+            compiled = self.threads.compiled = ClosureCompiler(
+                self.memo_size, types=self.types, inputs=self.threads.channel, output=self.threads.channel,
+                cents=self.cents).compile_program(self.ast)
+        channel = self.threads.channel
+        channel.inputs, channel.output = answers, output
+        try:
+            run_closures(compiled, new_global_frame(len(self.ast.names), self.recursion_limit))
+        finally:
+            channel.inputs = channel.output = None
+        return output.records
+
+    def run_native(self, inputs) -> list:
+        """
+        Call the compiled `main` with stdin read from the answers and stdout
+        caught in a file. The compiled program only reports the lines it
+        printed, so every receipt is a record without a value. Errors such as
+        a division by zero end the process, as they end the executable.
+        """
+        from jit import flush_stdio, rewind_stdin
+
+        if isinstance(inputs, Mapping):
+            raise TypeError("a program compiled with the LLVM engine takes its answers as a list in ASK order")
+        with NATIVE_LOCK, tempfile.TemporaryFile() as answers, tempfile.TemporaryFile() as printed:
+            answers.write("".join(f"{answer}\n" for answer in inputs or ()).encode())
+            answers.seek(0)
+            sys.stdout.flush()
+            flush_stdio()
+            saved = os.dup(0), os.dup(1)
+            os.dup2(answers.fileno(), 0)
+            os.dup2(printed.fileno(), 1)
+            try:
+                rewind_stdin()
+                self.entry()
+            finally:
+                flush_stdio()
+                os.dup2(saved[0], 0)
+                os.dup2(saved[1], 1)
+                os.close(saved[0])
+                os.close(saved[1])
+            printed.seek(0)
+            lines = printed.read().decode().splitlines()
+        return [{"prefix": line, "value": None} for line in lines]
+
+
+def answer_source(inputs):
+    if inputs is None:
+        return StreamInput([])
+    if isinstance(inputs, Mapping):
+        return MappingInput(inputs)
+    return StreamInput([str(answer) for answer in inputs])
+
+
+def compile(source: str | bytes, engine: str = "closure", fold: bool = True, cents: bool = False,
+            memo_size: int = DEFAULT_MEMO_SIZE, recursion_limit: int = DEFAULT_RECURSION_LIMIT) -> Program:
+    """
+    Parse, check and compile a CASH program for `engine`. The options mean what
+    the command line flags of the same names do.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+
+    if engine == "llvm":
+        return Program(engine, cents, memo_size, recursion_limit, obj=compile_native(source, fold, cents))
+    if engine == "bytecode" and cents:
+        raise ValueError("cents mode needs the closure or the llvm engine")
+    ast, types = load_program(source, fold, cents=cents)
+    if engine == "bytecode":
+        return Program(engine, cents, memo_size, recursion_limit, code_object=compile_bytecode(ast))
+    return Program(engine, cents, memo_size, recursion_limit, ast=ast, types=types)
+
+
+def compile_native(source: bytes, fold: bool, cents: bool) -> bytes:
+    from antlr4 import InputStream
+    from frontend import parse
+    from constant_folding import fold_constants
+    from codegen import Compiler
+
+    tree = parse(InputStream(source.decode("utf-8")))
+    compiler = Compiler(Path("program.cash"), fold_constants(tree, cents) if fold else {}, prompt=False,
+                        cents=cents)
+    compiler.visit(tree)
+    return compiler.emit_object()
@@ -0,0 +1,62 @@
+"""
+An on-disk cache of lowered programs, so unchanged sources skip ANTLR.
+
+Lexing and parsing with the ANTLR Python runtime usually takes longer than
+running a short receipt script. The resolved AST of a program and the types the
+TypeChecker inferred for it are pickled into a `ProgramCache`, keyed by the
+source, the generated parser and the version of the lowering, so a hit never
+touches the parser.
+"""
+import importlib.util
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+from program_cache import ProgramCache, cache_key, default_cache_dir
+
+# part of every key; bump it whenever cash_ast, the lowering, the resolver or
+# the TypeChecker change what they produce
+AST_CACHE_VERSION = "3"
+
+DEFAULT_AST_CACHE_SIZE = 16 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def grammar_version() -> str:
+    """
+    A hash of the generated parser, which changes with every change to CASH.g4.
+    The file is only read, not imported, so a cache hit never loads ANTLR.
+    """
+    spec = importlib.util.find_spec("cash.CASHParser")
+    return cache_key(Path(spec.origin).read_bytes())
+
+
+def program_key(source: bytes, fold: bool, cents: bool = False) -> str:
+    return cache_key(source, AST_CACHE_VERSION, grammar_version(), "fold" if fold else "no-fold",
+                     "cents" if cents else "float")
+
+
+class ASTCache:
+    def __init__(self, directory: Path | None = None, max_size: int = DEFAULT_AST_CACHE_SIZE):
+        directory = Path(directory) if directory is not None else default_cache_dir() / "ast"
+        self.entries = ProgramCache(directory, max_size, ".ast")
+
+    def load(self, source: bytes, fold: bool = True, cents: bool = False):
+        """
+        The (program, types) pair stored for a source, or None on a miss.
+        """
+        data = self.entries.load(program_key(source, fold, cents))
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # written by another Python or a half-upgraded tree, parse again
+            return None
+
+    def store(self, source: bytes, fold: bool, program, cents: bool = False):
+        try:
+            self.entries.store(program_key(source, fold, cents), pickle.dumps(program, pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            # an unwritable cache only costs the next run a parse
+            pass
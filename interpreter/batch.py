@@ -0,0 +1,142 @@
+"""
+Run many CASH programs across all cores.
+
+A batch is a list of jobs, each a script and an optional file of ASK answers.
+Jobs come from directories (every .cash file in them), glob patterns or
+manifest files listing one `script [answers]` pair per line. They are fanned
+out over a pool of worker processes that stay alive for the whole batch, so
+ANTLR is imported once per worker and every script is parsed and lowered once
+per worker no matter how many input sets it runs with.
+
+Results come back in job order, each with its output, its wall time and the
+error that stopped it, if any. A failing job never affects the others.
+"""
+import argparse
+import glob
+import io
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from program_cache import program_loader
+from symbol_table import DEFAULT_RECURSION_LIMIT, new_global_frame
+from inputs import StreamInput
+from output import MemorySink
+from closure_engine import ClosureCompiler, run as run_closures
+
+PROGRAM_CACHE_SIZE = 256
+
+# the programs a worker has loaded, also kept on disk so unchanged scripts are
+# not parsed again in the next batch
+cached_program = program_loader(PROGRAM_CACHE_SIZE)
+
+
+class Job:
+    __slots__ = ("script", "answers")
+
+    def __init__(self, script: str, answers: str | None = None):
+        self.script = script
+        self.answers = answers
+
+
+class JobResult:
+    __slots__ = ("script", "answers", "output", "error", "seconds")
+
+    def __init__(self, script: str, answers: str | None, output: str, error: str | None, seconds: float):
+        self.script = script
+        self.answers = answers
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+
+    def to_json(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def read_manifest(path: Path) -> list:
+    """
+    One job per line: a script and optionally a file of answers, separated by
+    whitespace. Relative paths are relative to the manifest, # starts a comment.
+    """
+    jobs = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        script, answers = fields[0], fields[1] if len(fields) > 1 else None
+        jobs.append(Job(str(path.parent / script), str(path.parent / answers) if answers else None))
+    return jobs
+
+
+def collect_jobs(targets: list) -> list:
+    jobs = []
+    for target in targets:
+        path = Path(target)
+        if path.is_dir():
+            jobs.extend(Job(str(script)) for script in sorted(path.glob("*.cash")))
+        elif path.suffix == ".cash" and path.is_file():
+            jobs.append(Job(target))
+        elif path.is_file():
+            jobs.extend(read_manifest(path))
+        else:
+            jobs.extend(Job(script) for script in sorted(glob.glob(target)))
+    return jobs
+
+
+def run_job(job: Job, recursion_limit: int = DEFAULT_RECURSION_LIMIT) -> JobResult:
+    output = MemorySink()
+    error = None
+    start = time.perf_counter()
+    try:
+        ast, types = cached_program(Path(job.script).read_bytes())
+        with open(job.answers, encoding="utf-8") if job.answers else io.StringIO() as answers:
+            # every job compiles its own closures, so no state leaks between jobs
+            compiler = ClosureCompiler(types=types, inputs=StreamInput(answers), output=output)
+            program = compiler.compile_program(ast)
+            run_closures(program, new_global_frame(len(ast.names), recursion_limit))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return JobResult(job.script, job.answers, output.getvalue(), error, time.perf_counter() - start)
+
+
+def run_batch(jobs: list, workers: int | None = None, chunksize: int = 1) -> list:
+    """
+    Run the jobs on `workers` processes (all cores by default) and return their
+    results in job order.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_job, jobs, chunksize=chunksize))
+
+
+def print_results(results: list, out=sys.stdout):
+    for result in results:
+        label = result.script if result.answers is None else f"{result.script} < {result.answers}"
+        status = "ok" if result.error is None else f"FAILED {result.error}"
+        print(f"== {label} ({result.seconds * 1000:.2f} ms) {status}", file=out)
+        out.write(result.output)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run many CASH programs in parallel.")
+    arg_parser.add_argument("targets", nargs="+",
+                            help="directories of .cash files, glob patterns, .cash files or manifests of "
+                                 "'script [answers]' lines")
+    arg_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    arg_parser.add_argument("--chunksize", type=int, default=1, help="jobs handed to a worker at a time")
+    arg_parser.add_argument("--json", action="store_true", help="print one JSON object per job")
+    args = arg_parser.parse_args()
+
+    jobs = collect_jobs(args.targets)
+    results = run_batch(jobs, args.workers, args.chunksize)
+    if args.json:
+        for result in results:
+            print(json.dumps(result.to_json()))
+    else:
+        print_results(results)
+    if any(result.error is not None for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+"""
+Stack-based bytecode backend for CASH.
+
+A lowered `Program` is compiled into one flat instruction array of
+(opcode, argument) pairs with absolute jump targets. Task bodies are appended
+after the main code and entered through CALL/RETURN. The compiled form can be
+written to a `.cashc` file so later runs skip lexing and parsing completely.
+"""
+import hashlib
+import marshal
+
+from cash_ast import *
+from memo import TaskMemo, DEFAULT_MEMO_SIZE, analyze_purity, replay
+from inputs import PromptInput
+from output import TextSink, NO_VALUE
+from strings import as_text, concat, split
+from symbol_table import Frame, UNSET
+
+CASHC_MAGIC = b"CASHC"
+CASHC_VERSION = 6
+
+# OPCODES
+LOAD_CONST = 0
+LOAD_FAST = 1
+LOAD_LOCAL = 2
+LOAD_GLOBAL = 3
+STORE_LOCAL = 4
+STORE_GLOBAL = 5
+BINARY_MUL = 6
+BINARY_ADD = 7
+BINARY_SUB = 8
+BINARY_DIV = 9
+CONCAT = 10
+SPLIT = 11
+COMPARE_EQ = 12
+COMPARE_LT = 13
+COMPARE_LTE = 14
+COMPARE_GT = 15
+COMPARE_GTE = 16
+NOT = 17
+JUMP = 18
+POP_JUMP_IF_FALSE = 19
+JUMP_IF_FALSE_OR_POP = 20
+JUMP_IF_TRUE_OR_POP = 21
+PRINT_STR = 22
+PRINT_EXPR = 23
+DISCOUNT = 24
+ASK = 25
+DEFINE_TASK = 26
+CALL = 27
+TAIL_CALL = 28
+RETURN = 29
+HALT = 30
+
+BINARY_OPS = {
+    "*": BINARY_MUL,
+    "+": BINARY_ADD,
+    "-": BINARY_SUB,
+    "/": BINARY_DIV,
+    "++": CONCAT,
+    "//": SPLIT,
+}
+
+COMPARE_OPS = {
+    "=": COMPARE_EQ,
+    "<": COMPARE_LT,
+    "<=": COMPARE_LTE,
+    ">": COMPARE_GT,
+    ">=": COMPARE_GTE,
+}
+
+
+class CodeObject:
+    """
+    A compiled program: the flat `code` array holds opcode, argument, opcode, argument, ...
+    `consts` is the constant pool and `names` the global frame layout, one name per slot.
+    """
+    __slots__ = ("code", "consts", "names")
+
+    def __init__(self, code: list, consts: list, names: list):
+        self.code = code
+        self.consts = consts
+        self.names = names
+
+    def dumps(self, source_hash: bytes = bytes(32)) -> bytes:
+        payload = marshal.dumps((tuple(self.code), tuple(self.consts), tuple(self.names)))
+        return CASHC_MAGIC + bytes([CASHC_VERSION]) + source_hash + payload
+
+    @staticmethod
+    def loads(data: bytes, source_hash: bytes | None = None):
+        """
+        Read a `.cashc` image. Returns None if the header does not match this
+        version or, when `source_hash` is given, if it was built from other source.
+        """
+        header = len(CASHC_MAGIC)
+        if data[:header] != CASHC_MAGIC or data[header] != CASHC_VERSION:
+            return None
+        stored_hash = data[header + 1:header + 33]
+        if source_hash is not None and stored_hash != source_hash:
+            return None
+        code, consts, names = marshal.loads(data[header + 33:])
+        return CodeObject(list(code), list(consts), list(names))
+
+
+def hash_source(source: bytes, fold: bool = True) -> bytes:
+    """
+    What a `.cashc` file records it was built from: the source and whether
+    constants were folded, which changes the bytecode.
+    """
+    return hashlib.sha256(source + (b"\0fold" if fold else b"\0no-fold")).digest()
+
+
+class BytecodeCompiler:
+    """
+    Translates a lowered and resolved `Program` into a `CodeObject`.
+    """
+
+    def __init__(self):
+        self.code = []
+        self.consts = []
+        self.const_index = {}
+        self.pending_tasks = []
+
+    def compile_program(self, program: Program) -> CodeObject:
+        """
+        `program` must already be resolved, the frame layout is taken from it.
+        """
+        pure_tasks = analyze_purity(program)
+        for stmt in program.body:
+            self.compile(stmt)
+        self.emit(HALT)
+
+        # task bodies live after the main code and are entered through CALL
+        while self.pending_tasks:
+            node, const_slot = self.pending_tasks.pop(0)
+            entry = len(self.code)
+            for stmt in node.body:
+                self.compile(stmt)
+            self.emit(RETURN)
+            param_slots = tuple(node.names.index(param) for param in node.params)
+            effects = pure_tasks.get(node.name)
+            self.consts[const_slot] = (node.name, param_slots, entry, tuple(node.names), effects)
+        return CodeObject(self.code, self.consts, list(program.names))
+
+    # HELPERS
+    def emit(self, op: int, arg: int = 0) -> int:
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 1
+
+    def patch(self, arg_pos: int, target: int):
+        self.code[arg_pos] = target
+
+    def add_const(self, value) -> int:
+        # 0.0 == -0.0, so floats are told apart by their repr
+        key = (type(value), repr(value) if type(value) is float else value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def compile(self, node: Node):
+        method = getattr(self, "compile_" + type(node).__name__)
+        method(node)
+
+    def emit_load(self, depth: int, slot: int, checked: bool = True):
+        if depth > 0:
+            self.emit(LOAD_GLOBAL, slot)
+        elif checked:
+            self.emit(LOAD_LOCAL, slot)
+        else:
+            self.emit(LOAD_FAST, slot)
+
+    def emit_store(self, depth: int, slot: int):
+        self.emit(STORE_GLOBAL if depth > 0 else STORE_LOCAL, slot)
+
+    # STATEMENTS
+    def compile_Cost(self, node: Cost):
+        self.compile(node.expr)
+        self.emit_store(node.depth, node.slot)
+
+    def compile_Print(self, node: Print):
+        prefix = self.add_const(node.prefix or "")
+        if node.expr is None:
+            self.emit(PRINT_STR, prefix)
+        else:
+            self.compile(node.expr)
+            self.emit(PRINT_EXPR, prefix)
+
+    def compile_Discount(self, node: Discount):
+        self.compile(node.percent)
+        self.emit_load(node.depth, node.slot)
+        self.emit(DISCOUNT)
+        self.emit_store(node.depth, node.slot)
+
+    def compile_Ask(self, node: Ask):
+        self.emit(ASK, self.add_const((node.name, node.prompt)))
+        self.emit_store(node.depth, node.slot)
+
+    def compile_Todo(self, node: Todo):
+        for arg in node.args:
+            self.compile(arg)
+        self.emit(TAIL_CALL if node.tail else CALL, self.add_const((node.name, len(node.args))))
+
+    def compile_Scan(self, node: Scan):
+        top = len(self.code)
+        self.compile(node.cond)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        for stmt in node.body:
+            self.compile(stmt)
+        self.emit(JUMP, top)
+        self.patch(exit_jump, len(self.code))
+
+    def compile_Cond(self, node: Cond):
+        end_jumps = []
+        for cond, body in node.arms:
+            self.compile(cond)
+            next_arm = self.emit(POP_JUMP_IF_FALSE)
+            for stmt in body:
+                self.compile(stmt)
+            end_jumps.append(self.emit(JUMP))
+            self.patch(next_arm, len(self.code))
+        for stmt in node.fallback or []:
+            self.compile(stmt)
+        for jump in end_jumps:
+            self.patch(jump, len(self.code))
+
+    def compile_Task(self, node: Task):
+        # the (name, param slots, entry, frame names, pure effects) constant is filled in once the body is laid out
+        const_slot = len(self.consts)
+        self.consts.append(None)
+        self.pending_tasks.append((node, const_slot))
+        self.emit(DEFINE_TASK, const_slot)
+
+    # EXPRESSIONS
+    def compile_Const(self, node: Const):
+        self.emit(LOAD_CONST, self.add_const(node.value))
+
+    def compile_Var(self, node: Var):
+        self.emit_load(node.depth, node.slot, node.checked)
+
+    def compile_BinOp(self, node: BinOp):
+        self.compile(node.left)
+        self.compile(node.right)
+        self.emit(BINARY_OPS[node.op])
+
+    def compile_Compare(self, node: Compare):
+        self.compile(node.left)
+        self.compile(node.right)
+        self.emit(COMPARE_OPS[node.op])
+
+    def compile_And(self, node: And):
+        self.compile(node.left)
+        jump = self.emit(JUMP_IF_FALSE_OR_POP)
+        self.compile(node.right)
+        self.patch(jump, len(self.code))
+
+    def compile_Or(self, node: Or):
+        self.compile(node.left)
+        jump = self.emit(JUMP_IF_TRUE_OR_POP)
+        self.compile(node.right)
+        self.patch(jump, len(self.code))
+
+    def compile_Not(self, node: Not):
+        self.compile(node.operand)
+        self.emit(NOT)
+
+
+def compile_bytecode(program: Program) -> CodeObject:
+    return BytecodeCompiler().compile_program(program)
+
+
+def build_memos(code_object: CodeObject, size: int = DEFAULT_MEMO_SIZE, policy: str = "lru") -> dict:
+    """
+    A `TaskMemo` for every task the compiler found pure, keyed by task name.
+    """
+    memos = {}
+    if size <= 0:
+        return memos
+    for const in code_object.consts:
+        if isinstance(const, tuple) and len(const) == 5 and const[4] is not None:
+            reads, writes = const[4]
+            memos[const[0]] = TaskMemo(const[0], reads, writes, size, policy)
+    return memos
+
+
+def run(code_object: CodeObject, frame: Frame, memos: dict | None = None, inputs=None, output=None):
+    """
+    The dispatch loop. Opcodes are tested roughly in order of how often they
+    appear in loop bodies. `frame` is the global frame, `memos` maps the
+    names of memoized tasks to their `TaskMemo`, `inputs` answers ASK and
+    `output` receives RECEIPTs.
+    """
+    if memos is None:
+        memos = build_memos(code_object)
+    ask = (inputs or PromptInput()).ask
+    receipt = (output or TextSink()).receipt
+    code = code_object.code
+    consts = code_object.consts
+    global_slots = frame.slots
+    global_names = code_object.names
+    tasks = frame.tasks
+    calls = frame.calls
+    slots = global_slots
+    names = global_names
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    returns = []
+    pc = 0
+
+    while True:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        if op == LOAD_FAST:
+            push(slots[arg])
+        elif op == LOAD_LOCAL:
+            value = slots[arg]
+            if value is UNSET:
+                raise KeyError(f"Variable {names[arg]} not found!!")
+            push(value)
+        elif op == LOAD_CONST:
+            push(consts[arg])
+        elif op == STORE_LOCAL:
+            slots[arg] = pop()
+        elif op == BINARY_ADD:
+            right = pop()
+            stack[-1] = stack[-1] + right
+        elif op == BINARY_SUB:
+            right = pop()
+            stack[-1] = stack[-1] - right
+        elif op == BINARY_MUL:
+            right = pop()
+            stack[-1] = stack[-1] * right
+        elif op == BINARY_DIV:
+            right = pop()
+            stack[-1] = stack[-1] / right
+        elif op == POP_JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == COMPARE_LT:
+            right = pop()
+            stack[-1] = stack[-1] < right
+        elif op == COMPARE_GT:
+            right = pop()
+            stack[-1] = stack[-1] > right
+        elif op == COMPARE_EQ:
+            right = pop()
+            stack[-1] = stack[-1] == right
+        elif op == COMPARE_LTE:
+            right = pop()
+            stack[-1] = stack[-1] <= right
+        elif op == COMPARE_GTE:
+            right = pop()
+            stack[-1] = stack[-1] >= right
+        elif op == LOAD_GLOBAL:
+            value = global_slots[arg]
+            if value is UNSET:
+                raise KeyError(f"Variable {global_names[arg]} not found!!")
+            push(value)
+        elif op == STORE_GLOBAL:
+            global_slots[arg] = pop()
+        elif op == NOT:
+            stack[-1] = not stack[-1]
+        elif op == JUMP_IF_FALSE_OR_POP:
+            if not stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == PRINT_EXPR:
+            receipt(consts[arg], pop())
+        elif op == PRINT_STR:
+            receipt(consts[arg], NO_VALUE)
+        elif op == CONCAT:
+            right = pop()
+            stack[-1] = concat(as_text(stack[-1]), as_text(right))
+        elif op == SPLIT:
+            right = pop()
+            stack[-1] = split(stack[-1], right)
+        elif op == DISCOUNT:
+            value = pop()
+            rate = float(stack[-1]) / 100
+            stack[-1] = value - (value * rate)
+        elif op == ASK:
+            name, prompt = consts[arg]
+            push(ask(name, prompt))
+        elif op == CALL:
+            name, argc = consts[arg]
+            _, param_slots, entry, task_names, _ = tasks[name]
+            values = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+            pending = None
+            memo = memos.get(name)
+            if memo is not None:
+                key = memo.key(global_slots, values)
+                if key is not None:
+                    effect = memo.lookup(key)
+                    if effect is not None:
+                        replay(effect, global_slots)
+                        continue
+                    pending = (memo, key)
+            returns.append((pc, frame, names, pending))
+            frame = calls.push(len(task_names))
+            slots = frame.slots
+            names = task_names
+            for slot, value in zip(param_slots, values):
+                slots[slot] = value
+            pc = entry
+        elif op == TAIL_CALL:
+            # the caller's frame is released first, so the callee usually gets it back
+            name, argc = consts[arg]
+            _, param_slots, entry, task_names, _ = tasks[name]
+            values = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+            calls.pop(frame)
+            frame = calls.push(len(task_names))
+            slots = frame.slots
+            names = task_names
+            for slot, value in zip(param_slots, values):
+                slots[slot] = value
+            pc = entry
+        elif op == RETURN:
+            calls.pop(frame)
+            pc, frame, names, pending = returns.pop()
+            slots = frame.slots
+            if pending is not None:
+                memo, key = pending
+                memo.store(key, global_slots)
+        elif op == DEFINE_TASK:
+            task = consts[arg]
+            tasks[task[0]] = task
+        elif op == HALT:
+            return
+        else:
+            raise ValueError(f"Unknown opcode {op} at {pc - 2}")
@@ -0,0 +1,157 @@
+"""
+A compact AST for CASH programs.
+
+The ANTLR parse tree is lowered once into these slotted nodes (see lowering.py)
+so the execution engines never have to touch parser contexts, tokens or child
+indices at runtime. Nothing here depends on ANTLR, so a cached AST can be
+loaded and run without importing it.
+"""
+
+
+# EXPRESSIONS
+class Node:
+    __slots__ = ()
+
+class Const(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+class Var(Node):
+    """
+    `depth` and `slot` are filled in by the resolver. `checked` is cleared when the
+    resolver proves the variable is always assigned before this read. `types` are
+    the types the TypeChecker found this read can see, None when it was not run.
+    """
+    __slots__ = ("name", "depth", "slot", "checked", "types")
+
+    def __init__(self, name: str, types: frozenset | None = None):
+        self.name = name
+        self.types = types
+        self.depth = None
+        self.slot = None
+        self.checked = True
+
+class BinOp(Node):
+    """ Arithmetic and string operators: `*`, `+`, `-`, `/`, `++` and `//`. """
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left: Node, right: Node):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class Compare(Node):
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left: Node, right: Node):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class And(Node):
+    __slots__ = ("left", "right")
+
+    def __init__(self, left: Node, right: Node):
+        self.left = left
+        self.right = right
+
+class Or(Node):
+    __slots__ = ("left", "right")
+
+    def __init__(self, left: Node, right: Node):
+        self.left = left
+        self.right = right
+
+class Not(Node):
+    __slots__ = ("operand",)
+
+    def __init__(self, operand: Node):
+        self.operand = operand
+
+# STATEMENTS
+class Cost(Node):
+    __slots__ = ("name", "expr", "line", "depth", "slot")
+
+    def __init__(self, name: str, expr: Node, line: int = 0):
+        self.name = name
+        self.expr = expr
+        self.line = line
+        self.depth = None
+        self.slot = None
+
+class Print(Node):
+    """ `prefix` is the optional leading string, `expr` the optional value. """
+    __slots__ = ("prefix", "expr", "line")
+
+    def __init__(self, prefix: str | None, expr: Node | None, line: int = 0):
+        self.prefix = prefix
+        self.expr = expr
+        self.line = line
+
+class Discount(Node):
+    __slots__ = ("percent", "name", "line", "depth", "slot")
+
+    def __init__(self, percent: Node, name: str, line: int = 0):
+        self.percent = percent
+        self.name = name
+        self.line = line
+        self.depth = None
+        self.slot = None
+
+class Ask(Node):
+    __slots__ = ("name", "prompt", "line", "depth", "slot")
+
+    def __init__(self, name: str, prompt: str, line: int = 0):
+        self.name = name
+        self.prompt = prompt
+        self.line = line
+        self.depth = None
+        self.slot = None
+
+class Todo(Node):
+    """ `tail` is set by the resolver when the call is the last thing its task does. """
+    __slots__ = ("name", "args", "line", "tail")
+
+    def __init__(self, name: str, args: list, line: int = 0):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.tail = False
+
+class Scan(Node):
+    __slots__ = ("cond", "body", "line")
+
+    def __init__(self, cond: Node, body: list, line: int = 0):
+        self.cond = cond
+        self.body = body
+        self.line = line
+
+class Cond(Node):
+    """ `arms` is a list of (condition, body) pairs tried in order, `fallback` the FALLBACK body. """
+    __slots__ = ("arms", "fallback", "line")
+
+    def __init__(self, arms: list, fallback: list | None, line: int = 0):
+        self.arms = arms
+        self.fallback = fallback
+        self.line = line
+
+class Task(Node):
+    """ `names` lists the task's frame slots, parameters first. """
+    __slots__ = ("name", "params", "body", "line", "names")
+
+    def __init__(self, name: str, params: list, body: list, line: int = 0):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.line = line
+        self.names = []
+
+class Program(Node):
+    """ `names` lists the global frame slots. """
+    __slots__ = ("body", "names")
+
+    def __init__(self, body: list):
+        self.body = body
+        self.names = []
@@ -0,0 +1,480 @@
+"""
+Closure-compiling execution engine.
+
+Every AST node is translated once into a nested Python closure. Running the
+program only calls those closures, so loop bodies never go through visitor
+dispatch or the ANTLR parse tree.
+"""
+import operator
+import sys
+
+from cash_ast import *
+import fixed_point
+from memo import TaskMemo, DEFAULT_MEMO_SIZE, analyze_purity, replay
+from inputs import PromptInput
+from output import TextSink, NO_VALUE
+from strings import Rope, concat, split
+from symbol_table import Frame, CallStack, UNSET
+
+# rough number of Python frames one non-tail task call nests
+PYTHON_FRAMES_PER_CALL = 8
+
+ARITHMETIC = {
+    "*": operator.mul,
+    "+": operator.add,
+    "-": operator.sub,
+    "/": operator.truediv,
+}
+
+# numbers are scaled integers in cents mode, see fixed_point.py
+CENTS_ARITHMETIC = {
+    "*": fixed_point.mul,
+    "+": operator.add,
+    "-": operator.sub,
+    "/": fixed_point.div,
+}
+
+COMPARISONS = {
+    "=": operator.eq,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# TypeChecker names of the values a constant can hold
+TYPE_NAMES = {int: "integer", float: "float", str: "string", bool: "boolean"}
+NUMERIC = ("integer", "float")
+
+
+class CompiledTask:
+    __slots__ = ("name", "param_slots", "frame_size", "body", "memo")
+
+    def __init__(self, name: str, param_slots: tuple, frame_size: int, body, memo: TaskMemo | None = None):
+        self.name = name
+        self.param_slots = param_slots
+        self.frame_size = frame_size
+        self.body = body
+        self.memo = memo
+
+    def execute(self, calls: CallStack, param_values):
+        memo = self.memo
+        if memo is None:
+            return self.run(calls, param_values)
+
+        global_slots = calls.global_frame.slots
+        key = memo.key(global_slots, param_values)
+        if key is None:
+            return self.run(calls, param_values)
+        effect = memo.lookup(key)
+        if effect is not None:
+            replay(effect, global_slots)
+            return
+        self.run(calls, param_values)
+        memo.store(key, global_slots)
+
+    def run(self, calls: CallStack, param_values):
+        """
+        Run the task in a pooled frame. A body that ends in a tail call returns
+        (task, arguments) instead of calling, and the loop below runs that task
+        next without growing the Python stack.
+        """
+        task = self
+        while True:
+            frame = calls.push(task.frame_size)
+            slots = frame.slots
+            for slot, value in zip(task.param_slots, param_values):
+                slots[slot] = value
+            try:
+                tail_call = task.body(frame)
+            finally:
+                calls.pop(frame)
+            if tail_call is None:
+                return
+            task, param_values = tail_call
+
+
+def unassigned(name: str):
+    return KeyError(f"Variable {name} not found!!")
+
+
+class ClosureCompiler:
+    """
+    Compiles a resolved `Program` into a single callable taking the global `Frame`.
+
+    Pure tasks get a `TaskMemo` of `memo_size` entries, a size of 0 turns
+    memoization off. The memos are kept in `memos` for reporting.
+
+    `types` are the TypeChecker's type sets per variable, used for reads that
+    do not carry their own. Expressions whose operands are proven to have a
+    single type compile to specialized closures
+    that skip conversions and generic dispatch; everything else stays generic.
+
+    ASK reads its answers from `inputs`, which prompts on the terminal by default,
+    and RECEIPT writes to the `output` sink.
+
+    Given a `profiler`, every statement, loop, CONFIRM and task body is wrapped
+    to be counted and timed by it. Without one nothing is wrapped.
+
+    With `cents` the program must have been lowered in cents mode: numbers are
+    scaled integers, multiplied, divided and discounted with fixed_point.py and
+    printed with two decimals.
+    """
+
+    def __init__(self, memo_size: int = DEFAULT_MEMO_SIZE, memo_policy: str = "lru", types: dict | None = None,
+                 inputs=None, output=None, profiler=None, cents: bool = False):
+        self.memo_size = memo_size
+        self.memo_policy = memo_policy
+        self.types = types or {}
+        self.inputs = inputs or PromptInput()
+        self.output = output or TextSink()
+        self.profiler = profiler
+        self.cents = cents
+        self.arithmetic = CENTS_ARITHMETIC if cents else ARITHMETIC
+        self.text = fixed_point.text if cents else str
+        self.pure_tasks = {}
+        self.memos = []
+
+    def compile_program(self, program: Program):
+        if self.memo_size > 0:
+            self.pure_tasks = analyze_purity(program)
+        return self.compile_block(program.body)
+
+    def compile_block(self, stmts: list):
+        """
+        A block returns what its last statement returns, so a pending tail call
+        reaches the task that has to run it.
+        """
+        compiled = tuple(self.compile_statement(stmt) for stmt in stmts)
+        if len(compiled) == 1:
+            return compiled[0]
+        if not compiled:
+            return lambda frame: None
+
+        init, last = compiled[:-1], compiled[-1]
+
+        def block(frame):
+            for stmt in init:
+                stmt(frame)
+            return last(frame)
+        return block
+
+    def compile(self, node: Node):
+        method = getattr(self, "compile_" + type(node).__name__)
+        return method(node)
+
+    def compile_statement(self, node: Node):
+        compiled = self.compile(node)
+        if self.profiler is None or isinstance(node, Task):
+            return compiled
+        return self.profiler.wrap(self.profiler.node_site(node), compiled)
+
+    def static_type(self, node: Node) -> str | None:
+        """
+        The one type an expression always has, or None when it is not proven.
+        """
+        if isinstance(node, Const):
+            return TYPE_NAMES.get(type(node.value))
+        if isinstance(node, Var):
+            # the types at this read when known, else those over the whole program
+            types = node.types if node.types is not None else self.types.get(node.name, ())
+            return next(iter(types)) if len(types) == 1 else None
+        if isinstance(node, BinOp):
+            if node.op == "++":
+                return "string"
+            left, right = self.static_type(node.left), self.static_type(node.right)
+            if node.op != "//" and left in NUMERIC and right in NUMERIC:
+                return "float" if node.op == "/" or "float" in (left, right) else "integer"
+        return None
+
+    def compile_load(self, name: str, depth: int, slot: int, checked: bool = True):
+        if depth == 0 and not checked:
+            return lambda frame: frame.slots[slot]
+
+        if depth == 0:
+            def load(frame):
+                value = frame.slots[slot]
+                if value is UNSET:
+                    raise unassigned(name)
+                return value
+            return load
+
+        def load_outer(frame):
+            for _ in range(depth):
+                frame = frame.next
+            value = frame.slots[slot]
+            if value is UNSET:
+                raise unassigned(name)
+            return value
+        return load_outer
+
+    def compile_store(self, depth: int, slot: int, expr):
+        if depth == 0:
+            def store(frame):
+                frame.slots[slot] = expr(frame)
+            return store
+
+        def store_outer(frame):
+            value = expr(frame)
+            for _ in range(depth):
+                frame = frame.next
+            frame.slots[slot] = value
+        return store_outer
+
+    # STATEMENTS
+    def compile_Cost(self, node: Cost):
+        return self.compile_store(node.depth, node.slot, self.compile(node.expr))
+
+    def compile_Print(self, node: Print):
+        prefix = node.prefix or ""
+        receipt = self.output.receipt
+        if node.expr is None:
+            def print_str(frame):
+                receipt(prefix, NO_VALUE)
+            return print_str
+
+        expr = self.compile(node.expr)
+        if self.cents:
+            text = self.text
+
+            def print_cents(frame):
+                receipt(prefix, text(expr(frame)))
+            return print_cents
+
+        def print_expr(frame):
+            receipt(prefix, expr(frame))
+        return print_expr
+
+    def compile_Discount(self, node: Discount):
+        percent = self.compile(node.percent)
+        load = self.compile_load(node.name, node.depth, node.slot)
+
+        if self.cents:
+            discount = fixed_point.discount
+            return self.compile_store(node.depth, node.slot, lambda frame: discount(percent(frame), load(frame)))
+
+        if isinstance(node.percent, Const) and self.static_type(node.percent) in NUMERIC:
+            rate = float(node.percent.value) / 100
+
+            def discounted(frame):
+                value = load(frame)
+                return value - (value * rate)
+            return self.compile_store(node.depth, node.slot, discounted)
+
+        if self.static_type(node.percent) == "float":
+            def discounted(frame):
+                rate = percent(frame) / 100
+                value = load(frame)
+                return value - (value * rate)
+            return self.compile_store(node.depth, node.slot, discounted)
+
+        def discounted(frame):
+            rate = float(percent(frame)) / 100
+            value = load(frame)
+            return value - (value * rate)
+        return self.compile_store(node.depth, node.slot, discounted)
+
+    def compile_Ask(self, node: Ask):
+        name, prompt = node.name, node.prompt
+        ask = self.inputs.ask
+        if self.cents:
+            from_number = fixed_point.from_number
+            return self.compile_store(node.depth, node.slot, lambda frame: from_number(ask(name, prompt)))
+        return self.compile_store(node.depth, node.slot, lambda frame: ask(name, prompt))
+
+    def compile_Todo(self, node: Todo):
+        name = node.name
+        args = tuple(self.compile(arg) for arg in node.args)
+
+        if node.tail:
+            def tail_call(frame):
+                return frame.tasks[name], [arg(frame) for arg in args]
+            return tail_call
+
+        def todo(frame):
+            task = frame.tasks[name]
+            task.execute(frame.calls, [arg(frame) for arg in args])
+        return todo
+
+    def compile_Scan(self, node: Scan):
+        cond = self.compile(node.cond)
+        body = tuple(self.compile_statement(stmt) for stmt in node.body)
+
+        def scan(frame):
+            while cond(frame):
+                for stmt in body:
+                    stmt(frame)
+        return scan
+
+    def compile_Cond(self, node: Cond):
+        arms = tuple((self.compile(c), self.compile_block(body)) for c, body in node.arms)
+        fallback = self.compile_block(node.fallback) if node.fallback else None
+
+        def cond(frame):
+            for c, body in arms:
+                if c(frame):
+                    return body(frame)
+            if fallback is not None:
+                return fallback(frame)
+        return cond
+
+    def compile_Task(self, node: Task):
+        param_slots = tuple(node.names.index(param) for param in node.params)
+        memo = None
+        if node.name in self.pure_tasks:
+            reads, writes = self.pure_tasks[node.name]
+            memo = TaskMemo(node.name, reads, writes, self.memo_size, self.memo_policy)
+            self.memos.append(memo)
+        body = self.compile_block(node.body)
+        if self.profiler is not None:
+            body = self.profiler.wrap(self.profiler.node_site(node), body)
+        task = CompiledTask(node.name, param_slots, len(node.names), body, memo)
+
+        def define(frame):
+            frame.tasks[task.name] = task
+        return define
+
+    # EXPRESSIONS
+    def compile_Const(self, node: Const):
+        value = node.value
+        return lambda frame: value
+
+    def compile_Var(self, node: Var):
+        return self.compile_load(node.name, node.depth, node.slot, node.checked)
+
+    def compile_BinOp(self, node: BinOp):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        left_type = self.static_type(node.left)
+        right_type = self.static_type(node.right)
+
+        text = self.text
+        if node.op == "++":
+            def as_text(value):
+                return value if type(value) is Rope else text(value)
+
+            # long results are ropes, so repeated ++ does not copy the whole string each time
+            if left_type == "string" and right_type == "string":
+                return lambda frame: concat(left(frame), right(frame))
+            if left_type == "string":
+                return lambda frame: concat(left(frame), text(right(frame)))
+            if right_type == "string":
+                return lambda frame: concat(as_text(left(frame)), right(frame))
+            return lambda frame: concat(as_text(left(frame)), as_text(right(frame)))
+        if node.op == "//":
+            return lambda frame: split(text(left(frame)), text(right(frame)))
+
+        if left_type in NUMERIC and right_type in NUMERIC:
+            if self.cents:
+                return self.compile_cents(node, left, right)
+            return self.compile_numeric(node, left, right)
+
+        op = self.arithmetic[node.op]
+        if isinstance(node.right, Const):
+            value = node.right.value
+            return lambda frame: op(left(frame), value)
+        return lambda frame: op(left(frame), right(frame))
+
+    def compile_numeric(self, node: BinOp, left, right):
+        """
+        Both operands are proven numbers, so the operator is applied inline
+        instead of through the generic operator function.
+        """
+        if isinstance(node.right, Const):
+            value = node.right.value
+            if node.op == "*":
+                return lambda frame: left(frame) * value
+            if node.op == "+":
+                return lambda frame: left(frame) + value
+            if node.op == "-":
+                return lambda frame: left(frame) - value
+            return lambda frame: left(frame) / value
+
+        if node.op == "*":
+            return lambda frame: left(frame) * right(frame)
+        if node.op == "+":
+            return lambda frame: left(frame) + right(frame)
+        if node.op == "-":
+            return lambda frame: left(frame) - right(frame)
+        return lambda frame: left(frame) / right(frame)
+
+    def compile_cents(self, node: BinOp, left, right):
+        """
+        compile_numeric for scaled integers. Sums and differences need no
+        rounding, and neither does a product with a whole-number constant.
+        """
+        if node.op == "+":
+            return lambda frame: left(frame) + right(frame)
+        if node.op == "-":
+            return lambda frame: left(frame) - right(frame)
+        if isinstance(node.right, Const):
+            value = node.right.value
+            if node.op == "*" and value % fixed_point.SCALE == 0:
+                factor = value // fixed_point.SCALE
+                return lambda frame: left(frame) * factor
+            op = self.arithmetic[node.op]
+            return lambda frame: op(left(frame), value)
+        op = self.arithmetic[node.op]
+        return lambda frame: op(left(frame), right(frame))
+
+    def compile_Compare(self, node: Compare):
+        left = self.compile(node.left)
+        if self.static_type(node.left) in NUMERIC and self.static_type(node.right) in NUMERIC:
+            return self.compile_numeric_compare(node, left)
+
+        op = COMPARISONS[node.op]
+        if isinstance(node.right, Const):
+            value = node.right.value
+            return lambda frame: op(left(frame), value)
+        right = self.compile(node.right)
+        return lambda frame: op(left(frame), right(frame))
+
+    def compile_numeric_compare(self, node: Compare, left):
+        if isinstance(node.right, Const):
+            value = node.right.value
+            if node.op == "=":
+                return lambda frame: left(frame) == value
+            if node.op == "<":
+                return lambda frame: left(frame) < value
+            if node.op == "<=":
+                return lambda frame: left(frame) <= value
+            if node.op == ">":
+                return lambda frame: left(frame) > value
+            return lambda frame: left(frame) >= value
+
+        right = self.compile(node.right)
+        if node.op == "=":
+            return lambda frame: left(frame) == right(frame)
+        if node.op == "<":
+            return lambda frame: left(frame) < right(frame)
+        if node.op == "<=":
+            return lambda frame: left(frame) <= right(frame)
+        if node.op == ">":
+            return lambda frame: left(frame) > right(frame)
+        return lambda frame: left(frame) >= right(frame)
+
+    def compile_And(self, node: And):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return lambda frame: left(frame) and right(frame)
+
+    def compile_Or(self, node: Or):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return lambda frame: left(frame) or right(frame)
+
+    def compile_Not(self, node: Not):
+        operand = self.compile(node.operand)
+        return lambda frame: not operand(frame)
+
+
+def compile_program(program: Program, **options):
+    return ClosureCompiler(**options).compile_program(program)
+
+
+def run(compiled, frame: Frame):
+    # non-tail recursion still nests Python calls, leave room for the configured depth
+    needed = frame.calls.limit * PYTHON_FRAMES_PER_CALL + 1000
+    if sys.getrecursionlimit() < needed:
+        sys.setrecursionlimit(needed)
+    compiled(frame)
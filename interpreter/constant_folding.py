@@ -0,0 +1,304 @@
+"""
+Constant folding and constant propagation over the ANTLR parse tree.
+
+The pass records the value of every expression and condition it can prove is
+constant. Values of COST/DISCOUNT variables are propagated through straight-line
+code, CONFIRM arms and SCAN loops, so `COST total = price * quantity` after two
+literal COSTs folds to a single number. Conditions that fold to false mark
+arms that can never run.
+
+The result is a plain {context: value} dict shared by the engines: the
+reference visitor returns folded values without evaluating, the lowering
+turns them into constants and drops dead arms, and the LLVM compiler emits
+them as IR constants.
+"""
+from antlr4 import *
+from cash.CASHParser import CASHParser
+from cash.CASHVisitor import CASHVisitor
+import fixed_point
+
+# folded values must be representable as a literal by every engine
+FOLDABLE_TYPES = (int, float, str, bool)
+
+UNKNOWN = object()
+
+
+def assigned_in(ctx: ParserRuleContext) -> set:
+    """
+    Names written by COST, DISCOUNT or ASK anywhere below `ctx`.
+    """
+    names = set()
+    if isinstance(ctx, (CASHParser.CostContext, CASHParser.DiscountContext, CASHParser.AskContext)):
+        names.add(str(ctx.IDENTIFIER()))
+    for child in ctx.getChildren():
+        if isinstance(child, ParserRuleContext):
+            names |= assigned_in(child)
+    return names
+
+
+def called_in(ctx: ParserRuleContext) -> set:
+    """
+    Names of the tasks TODO calls anywhere below `ctx`.
+    """
+    names = set()
+    if isinstance(ctx, CASHParser.TodoContext):
+        names.add(str(ctx.IDENTIFIER()))
+    for child in ctx.getChildren():
+        if isinstance(child, ParserRuleContext):
+            names |= called_in(child)
+    return names
+
+
+class ConstantFolder(CASHVisitor):
+    """
+    Visiting an expression returns its constant value or UNKNOWN. `env` holds the
+    variables whose value is known at the current point of the program.
+
+    With `cents`, numbers are folded as scaled integers with the rounding of
+    fixed_point.py, exactly like the engines compute them in cents mode.
+    """
+
+    def __init__(self, cents: bool = False):
+        self.cents = cents
+        self.constants = {}
+        self.env = {}
+        # task name -> variables a call may assign, including in the tasks it calls
+        self.task_writes = {}
+
+    def fold(self, ctx: ParserRuleContext, value):
+        if value is not UNKNOWN and isinstance(value, FOLDABLE_TYPES):
+            self.constants[ctx] = value
+            return value
+        return UNKNOWN
+
+    def forget(self, names):
+        for name in names:
+            self.env.pop(name, None)
+
+    def changed_by_calls(self, ctx: ParserRuleContext) -> set:
+        """
+        Variables the TODOs anywhere below `ctx` may assign.
+        """
+        names = set()
+        for task in called_in(ctx):
+            names |= self.task_writes.get(task, set())
+        return names
+
+    # PROGRAM STRUCTURE
+    def visitProgram(self, ctx: CASHParser.ProgramContext):
+        # a TODO may change any variable the task, or a task it calls, assigns
+        calls = {}
+        for task in ctx.task_mod():
+            name = str(task.IDENTIFIER(0))
+            self.task_writes.setdefault(name, set()).update(assigned_in(task.task_body()))
+            calls.setdefault(name, set()).update(called_in(task.task_body()))
+        changed = True
+        while changed:
+            changed = False
+            for name, callees in calls.items():
+                for callee in callees:
+                    added = self.task_writes.get(callee, set()) - self.task_writes[name]
+                    if added:
+                        self.task_writes[name] |= added
+                        changed = True
+        self.visitChildren(ctx)
+        return self.constants
+
+    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
+        # a task can be called from anywhere, so nothing from the caller is known
+        outer = self.env
+        self.env = {}
+        self.visit(ctx.task_body())
+        self.env = outer
+
+    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
+        # variables the body changes, itself or through the tasks it calls, are
+        # unknown on every iteration and after the loop
+        changed = assigned_in(ctx) | self.changed_by_calls(ctx)
+        self.forget(changed)
+        if self.visit(ctx.bool_expr()) is False:
+            return
+        for stmt in ctx.main_stmt():
+            self.visit(stmt)
+        self.forget(changed)
+
+    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
+        before = self.env
+        outcomes = []
+        conds = ctx.bool_expr()
+        stmts = ctx.main_stmt()
+        always_taken = False
+        for cond, stmt in zip(conds, stmts):
+            self.env = dict(before)
+            value = self.visit(cond)
+            if value is UNKNOWN or value:
+                self.visit(stmt)
+                self.forget(self.changed_by_calls(stmt))
+                outcomes.append(self.env)
+            if value is not UNKNOWN and value:
+                always_taken = True
+                break
+
+        if not always_taken:
+            self.env = dict(before)
+            if len(stmts) > len(conds):
+                self.visit(stmts[len(conds)])
+                self.forget(self.changed_by_calls(stmts[len(conds)]))
+            outcomes.append(self.env)
+
+        # keep what every path that can run agrees on
+        merged = {}
+        for name, value in outcomes[0].items():
+            if all(name in env and type(env[name]) is type(value) and env[name] == value
+                   for env in outcomes[1:]):
+                merged[name] = value
+        self.env = merged
+
+    # STATEMENTS
+    def visitCost(self, ctx: CASHParser.CostContext):
+        name = str(ctx.IDENTIFIER())
+        value = self.visit(ctx.expression())
+        if value is UNKNOWN:
+            self.env.pop(name, None)
+        else:
+            self.env[name] = value
+
+    def visitDiscount(self, ctx: CASHParser.DiscountContext):
+        name = str(ctx.IDENTIFIER())
+        percent = self.visit(ctx.expression())
+        value = self.env.pop(name, UNKNOWN)
+        if percent is UNKNOWN or value is UNKNOWN:
+            return
+        try:
+            if self.cents:
+                self.env[name] = fixed_point.discount(percent, value)
+            else:
+                self.env[name] = value - (value * (float(percent) / 100))
+        except (TypeError, ValueError):
+            pass
+
+    def visitAsk(self, ctx: CASHParser.AskContext):
+        self.env.pop(str(ctx.IDENTIFIER()), None)
+
+    def visitTodo(self, ctx: CASHParser.TodoContext):
+        if ctx.actual_param_list():
+            for expr in ctx.actual_param_list().expression():
+                self.visit(expr)
+        self.forget(self.task_writes.get(str(ctx.IDENTIFIER()), ()))
+
+    def visitPrint(self, ctx: CASHParser.PrintContext):
+        if ctx.expression() is not None:
+            self.visit(ctx.expression())
+
+    # EXPRESSIONS
+    def visitNested(self, ctx: CASHParser.NestedContext):
+        return self.fold(ctx, self.visit(ctx.expression()))
+
+    def binary(self, ctx: ParserRuleContext, op):
+        left = self.visit(ctx.getChild(0))
+        right = self.visit(ctx.getChild(2))
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        try:
+            return self.fold(ctx, op(left, right))
+        except (TypeError, ValueError, ZeroDivisionError):
+            # leave it to the runtime to raise the error
+            return UNKNOWN
+
+    def visitMult(self, ctx: CASHParser.MultContext):
+        if self.cents:
+            return self.binary(ctx, fixed_point.mul)
+        return self.binary(ctx, lambda a, b: a * b)
+
+    def visitAdd(self, ctx: CASHParser.AddContext):
+        return self.binary(ctx, lambda a, b: a + b)
+
+    def visitSub(self, ctx: CASHParser.SubContext):
+        return self.binary(ctx, lambda a, b: a - b)
+
+    def visitDiv(self, ctx: CASHParser.DivContext):
+        if self.cents:
+            return self.binary(ctx, fixed_point.div)
+        return self.binary(ctx, lambda a, b: a / b)
+
+    def visitConcat(self, ctx: CASHParser.ConcatContext):
+        text = fixed_point.text if self.cents else str
+        return self.binary(ctx, lambda a, b: text(a) + text(b))
+
+    def visitSplit(self, ctx: CASHParser.SplitContext):
+        # a split produces a list, which no engine can embed as a literal
+        self.visit(ctx.getChild(0))
+        self.visit(ctx.getChild(2))
+        return UNKNOWN
+
+    def visitStrlit(self, ctx: CASHParser.StrlitContext):
+        return str(ctx.str_lit().STRING())[1:-1]
+
+    def visitFloat(self, ctx: CASHParser.FloatContext):
+        if self.cents:
+            return fixed_point.from_literal(str(ctx.FLOAT()))
+        return float(str(ctx.FLOAT()).replace(",", "."))
+
+    def visitInt(self, ctx: CASHParser.IntContext):
+        if self.cents:
+            return fixed_point.from_literal(str(ctx.INT()))
+        return int(str(ctx.INT()))
+
+    def visitVar(self, ctx: CASHParser.VarContext):
+        return self.fold(ctx, self.env.get(str(ctx.IDENTIFIER()), UNKNOWN))
+
+    # BOOLEAN EXPRESSIONS
+    def visitNested_bool(self, ctx: CASHParser.Nested_boolContext):
+        return self.fold(ctx, self.visit(ctx.bool_expr()))
+
+    def visitNot(self, ctx: CASHParser.NotContext):
+        value = self.visit(ctx.bool_expr())
+        if value is UNKNOWN:
+            return UNKNOWN
+        return self.fold(ctx, not value)
+
+    def visitAnd(self, ctx: CASHParser.AndContext):
+        left = self.visit(ctx.bool_expr(0))
+        right = self.visit(ctx.bool_expr(1))
+        if left is not UNKNOWN and not left:
+            return self.fold(ctx, False)
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        return self.fold(ctx, bool(right))
+
+    def visitOr(self, ctx: CASHParser.OrContext):
+        left = self.visit(ctx.bool_expr(0))
+        right = self.visit(ctx.bool_expr(1))
+        if left is not UNKNOWN and left:
+            return self.fold(ctx, True)
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        return self.fold(ctx, bool(right))
+
+    def visitComp(self, ctx: CASHParser.CompContext):
+        return self.fold(ctx, self.visit(ctx.comparison()))
+
+    def visitComparison(self, ctx: CASHParser.ComparisonContext):
+        left = self.visit(ctx.expression(0))
+        right = self.visit(ctx.expression(1))
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        op = ctx.getChild(1).getText()
+        try:
+            if op == "=":
+                value = left == right
+            elif op == "<":
+                value = left < right
+            elif op == "<=":
+                value = left <= right
+            elif op == ">":
+                value = left > right
+            else:
+                value = left >= right
+        except TypeError:
+            return UNKNOWN
+        return self.fold(ctx, value)
+
+
+def fold_constants(tree: CASHParser.ProgramContext, cents: bool = False) -> dict:
+    return ConstantFolder(cents).visit(tree)
@@ -0,0 +1,88 @@
+"""
+Fixed-point arithmetic for the cents mode.
+
+In cents mode every number is an integer count of hundredths. The literals
+`15` and `10,5` become 1500 and 1050. Sums and differences are exact. Products,
+quotients and DISCOUNT round their exact result to the nearest cent, halves
+away from zero. The LLVM backend emits the same integer operations on i64, so
+every engine prints the same receipts.
+
+Values have to fit in 64 bits for the compiled program to agree with the
+interpreter, which keeps Python's unbounded integers.
+"""
+
+SCALE = 100
+DIGITS = 2
+HALF = SCALE // 2
+# DISCOUNT multiplies two scaled numbers and divides by 100 percent
+PERCENT_SCALE = SCALE * 100
+
+
+def round_div(n: int, d: int) -> int:
+    """
+    n / d rounded to the nearest integer, halves away from zero.
+    """
+    q, r = divmod(abs(n), abs(d))
+    if 2 * r >= abs(d):
+        q += 1
+    return -q if (n < 0) != (d < 0) else q
+
+
+def round_scaled(n: int, d: int) -> int:
+    """
+    round_div for a positive even `d`, without the sign juggling.
+    """
+    if n >= 0:
+        return (n + d // 2) // d
+    return -((d // 2 - n) // d)
+
+
+def mul(a: int, b: int) -> int:
+    n = a * b
+    if n >= 0:
+        return (n + HALF) // SCALE
+    return -((HALF - n) // SCALE)
+
+
+def div(a: int, b: int) -> int:
+    return round_div(a * SCALE, b)
+
+
+def discount(percent: int, value: int) -> int:
+    return value - round_scaled(value * percent, PERCENT_SCALE)
+
+
+def from_literal(text: str) -> int:
+    """
+    The scaled value of an INT or FLOAT literal such as `-12` or `10,505`.
+    Digits past the cents are rounded, halves away from zero.
+    """
+    text = text.replace(",", ".")
+    negative = text.startswith("-")
+    whole, _, fraction = text.lstrip("-").partition(".")
+    value = int(whole) * SCALE + int((fraction + "0" * DIGITS)[:DIGITS])
+    if fraction[DIGITS:DIGITS + 1] >= "5":
+        value += 1
+    return -value if negative else value
+
+
+def from_number(number) -> int:
+    """
+    The scaled value of an int or float, e.g. an ASK answer. The float is
+    rounded exactly like the compiled `fptosi(|x| * SCALE + 0.5)`.
+    """
+    if type(number) is int:
+        return number * SCALE
+    scaled = int(abs(number) * SCALE + 0.5)
+    return -scaled if number < 0 else scaled
+
+
+def text(value) -> str:
+    """
+    How a value is printed: scaled numbers with exactly two decimals,
+    everything else as usual.
+    """
+    if type(value) is not int:
+        return str(value)
+    whole, cents = divmod(abs(value), SCALE)
+    return f"{'-' if value < 0 else ''}{whole}.{cents:0{DIGITS}d}"
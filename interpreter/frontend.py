@@ -0,0 +1,58 @@
+"""
+The ANTLR front end: lexing and parsing CASH source into a parse tree.
+
+Parsing runs in two stages. The first uses SLL prediction, which never looks
+at the full parser context and is much cheaper for the left-recursive
+expression rules, with an error strategy that gives up at the first syntax
+error instead of recovering. Only when that fails is the input parsed again
+with full LL prediction and the default error reporting. SLL either produces
+the same tree as LL or fails, so programs mean the same either way; invalid
+programs are reported exactly as before.
+
+A `FrontEnd` keeps its lexer and parser between files, which saves building
+them again for every script of a batch.
+"""
+from antlr4 import *
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ConsoleErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+from cash.CASHParser import CASHParser
+from cash.CASHLexer import CASHLexer
+
+
+class FrontEnd:
+    """
+    A reusable lexer and parser. Not thread-safe: use one per thread or process.
+    """
+
+    def __init__(self):
+        self.lexer = CASHLexer(InputStream(""))
+        self.parser = CASHParser(CommonTokenStream(self.lexer))
+        self.sll_failures = 0
+
+    def parse(self, input_stream: InputStream) -> CASHParser.ProgramContext:
+        self.lexer.inputStream = input_stream
+        token_stream = CommonTokenStream(self.lexer)
+        parser = self.parser
+
+        # errors the SLL stage runs into are reported by the LL stage, if they are real
+        parser.removeErrorListeners()
+        parser._errHandler = BailErrorStrategy()
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser.setTokenStream(token_stream)
+        try:
+            return parser.program()
+        except ParseCancellationException:
+            self.sll_failures += 1
+
+        # the tokens are kept, so only the parser runs again
+        parser.addErrorListener(ConsoleErrorListener.INSTANCE)
+        parser._errHandler = DefaultErrorStrategy()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser.reset()
+        return parser.program()
+
+
+def parse(input_stream: InputStream, front_end: FrontEnd | None = None) -> CASHParser.ProgramContext:
+    return (front_end or FrontEnd()).parse(input_stream)
@@ -0,0 +1,477 @@
+"""
+Incremental re-execution of a script that is edited or given new answers.
+
+A `Session` runs successive versions of one script. For every top-level
+statement it keeps the values the statement assigned, the answers it read and
+the receipts it printed. The statements form a dependency graph: a variable
+(or a task) links every statement that may assign it to the statements that
+read it, up to the next statement that assigns it again. RECEIPTs are
+statements without outgoing links.
+
+The next run diffs the new source against the previous one statement by
+statement. New and changed statements run again, and so does every statement
+that reads a value one of them changed or an answer that is different now.
+A statement that runs again and assigns the same values as before stops the
+change from spreading further. Every other statement keeps its cached values
+and receipts, so the statements evaluated are only those the change reaches,
+however long the script is.
+
+SCAN loops, CONFIRM chains and TODO calls are opaque units. They run again as
+a whole and count as reading every variable they may assign, including what
+the called tasks read and assign.
+
+The source is still parsed and lowered as a whole, since the diff works on
+the lowered statements. Only the closure engine runs incrementally.
+"""
+import csv
+from bisect import bisect_left
+from collections.abc import Mapping
+from difflib import SequenceMatcher
+from heapq import heappop, heappush
+
+from cash_ast import *
+from api import Channel
+from closure_engine import ClosureCompiler, run as run_closures
+from interpreter import load_program
+from memo import DEFAULT_MEMO_SIZE, analyze_purity, children
+from output import NO_VALUE
+from symbol_table import DEFAULT_RECURSION_LIMIT, Frame, UNSET, new_global_frame
+
+# where a statement sits and how the resolver laid it out, which does not
+# change what it computes
+LAYOUT_FIELDS = {"line", "depth", "slot", "checked", "types", "names", "tail"}
+
+
+def statement_key(node):
+    """
+    What identifies a statement in the diff: its whole lowered form except
+    line numbers and frame slots, with the types of constants, so 1 and 1.0
+    differ.
+    """
+    if isinstance(node, Node):
+        return (type(node).__name__,) + tuple(statement_key(getattr(node, field))
+                                              for field in node.__slots__ if field not in LAYOUT_FIELDS)
+    if isinstance(node, (list, tuple)):
+        return tuple(statement_key(item) for item in node)
+    return type(node).__name__, node
+
+
+def same_value(a, b) -> bool:
+    return a is b or (type(a) is type(b) and a == b)
+
+
+class Effects:
+    """
+    The globals a piece of code may read and assign, the variables it ASKs
+    and the tasks it calls. Globals are the variables resolved at `depth`.
+    """
+    __slots__ = ("reads", "writes", "asks", "calls")
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.asks = set()
+        self.calls = set()
+
+    def collect(self, node: Node, depth: int):
+        if isinstance(node, Var) and node.depth == depth:
+            self.reads.add(node.name)
+        if isinstance(node, (Cost, Discount, Ask)) and node.depth == depth:
+            self.writes.add(node.name)
+            if isinstance(node, Discount):
+                self.reads.add(node.name)
+        if isinstance(node, Ask):
+            # a task's own variable still takes an answer
+            self.asks.add(node.name)
+        if isinstance(node, Todo):
+            self.calls.add(node.name)
+        for child in children(node):
+            self.collect(child, depth)
+
+    def merge(self, other) -> bool:
+        size = len(self.reads) + len(self.writes) + len(self.asks) + len(self.calls)
+        self.reads |= other.reads
+        self.writes |= other.writes
+        self.asks |= other.asks
+        self.calls |= other.calls
+        return len(self.reads) + len(self.writes) + len(self.asks) + len(self.calls) != size
+
+
+def task_effects(program: Program) -> dict:
+    """
+    The effects of a call of every task, merged over its definitions and
+    including the tasks it calls.
+    """
+    tasks = {}
+    for stmt in program.body:
+        if isinstance(stmt, Task):
+            effects = tasks.setdefault(stmt.name, Effects())
+            for node in stmt.body:
+                effects.collect(node, 1)
+    changed = True
+    while changed:
+        changed = False
+        for effects in tasks.values():
+            for callee in list(effects.calls):
+                if callee in tasks and effects.merge(tasks[callee]):
+                    changed = True
+    return tasks
+
+
+class Unit:
+    """
+    One top-level statement. `inputs` are the keys its result depends on and
+    `writes` the keys it may assign: variable names, and ("task", name) for
+    task definitions and calls. `values` hold the written keys after it ran,
+    `answered` the answers it read per input column and `receipts` what it
+    printed.
+    """
+    __slots__ = ("node", "key", "inputs", "writes", "asks", "columns", "compiled", "values", "answered",
+                 "receipts")
+
+    def __init__(self, node: Node, tasks: dict):
+        self.node = node
+        self.key = statement_key(node)
+        self.compiled = None
+        self.values = None
+        self.answered = {}
+        self.receipts = []
+        if isinstance(node, Task):
+            self.inputs, self.writes, self.asks = set(), {("task", node.name)}, set()
+            return
+
+        effects = Effects()
+        effects.collect(node, 0)
+        for name in list(effects.calls):
+            if name in tasks:
+                effects.merge(tasks[name])
+        self.writes = effects.writes
+        self.asks = effects.asks
+        self.inputs = effects.reads | {("task", name) for name in effects.calls}
+        if not isinstance(node, (Cost, Discount, Ask, Print)):
+            # whatever it may assign but does not, keeps the value it had before
+            self.inputs |= effects.writes
+
+    def inherit(self, old):
+        self.values = old.values
+        self.answered = old.answered
+        self.receipts = old.receipts
+
+
+class Receipts:
+    def __init__(self):
+        self.lines = []
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.lines.append((prefix, value))
+
+
+class UnitAnswers:
+    """
+    The answers of one statement: every column continues where the
+    statements before it stopped.
+    """
+
+    def __init__(self, answers: dict, starts: dict, column):
+        self.answers = answers
+        self.starts = starts
+        self.column = column
+        self.read = {}
+
+    def ask(self, name: str, prompt: str) -> float:
+        column = self.column(name)
+        read = self.read.setdefault(column, [])
+        position = self.starts.get(column, 0) + len(read)
+        values = self.answers.get(column, ())
+        if position >= len(values):
+            raise EOFError(f"No input left for ASK {name}")
+        read.append(values[position])
+        return float(values[position])
+
+
+def answer_columns(inputs) -> dict:
+    """
+    Answers per column: a dict gives every variable its own list (a single
+    answer is a list of one), while a list answers the ASKs in order and is
+    one column, None.
+    """
+    if inputs is None:
+        return {}
+    if isinstance(inputs, Mapping):
+        return {name: list(values) if isinstance(values, (list, tuple)) else [values]
+                for name, values in inputs.items()}
+    return {None: list(inputs)}
+
+
+class Session:
+    """
+    Runs the versions of one script, each time evaluating only the statements
+    the changes since the previous run affect. `run` returns the receipts as
+    (prefix, value) pairs, with NO_VALUE for receipts that only print text.
+    `rerun` is how many statements the last run evaluated.
+    """
+
+    def __init__(self, fold: bool = True, cents: bool = False, memo_size: int = DEFAULT_MEMO_SIZE,
+                 memo_policy: str = "lru", recursion_limit: int = DEFAULT_RECURSION_LIMIT, cache=None,
+                 front_end=None):
+        self.fold = fold
+        self.cents = cents
+        self.memo_size = memo_size
+        self.memo_policy = memo_policy
+        self.recursion_limit = recursion_limit
+        self.cache = cache
+        self.front_end = front_end
+        self.units = []
+        self.answers = {}
+        self.columns = None
+        self.rerun = 0
+
+    def run(self, source: bytes, inputs=None, columns: dict | None = None) -> list:
+        """
+        Run a new version of the script. `inputs` are the answers like in
+        `api.Program.run`, and `columns` maps variables to differently named
+        keys of `inputs`.
+        """
+        ast, types = load_program(source, self.fold, self.cache, self.front_end, self.cents)
+        answers = answer_columns(inputs)
+        if isinstance(inputs, Mapping):
+            columns = dict(columns or {})
+            self.column = lambda name: columns.get(name, name)
+        else:
+            columns = None
+            self.column = lambda name: None
+
+        old = self.units
+        self.prepare(ast, types)
+        try:
+            self.diff(old)
+            if columns == self.columns:
+                self.compare_answers(answers)
+            else:
+                # every ASK reads from another column now
+                for column in self.askers:
+                    self.invalidate_answers(column, 0)
+            self.answers = answers
+            self.columns = columns
+            self.rerun = 0
+            while self.dirty:
+                self.execute(heappop(self.dirty))
+                self.rerun += 1
+        except BaseException:
+            # a statement stopped half way, so nothing cached can be trusted
+            self.units = []
+            raise
+        return [line for unit in self.units for line in unit.receipts]
+
+    # DEPENDENCY GRAPH
+    def prepare(self, ast: Program, types: dict):
+        self.channel = Channel()
+        self.compiler = ClosureCompiler(self.memo_size, self.memo_policy, types, self.channel, self.channel,
+                                        cents=self.cents)
+        if self.memo_size > 0:
+            self.compiler.pure_tasks = analyze_purity(ast)
+        self.frame = new_global_frame(len(ast.names), self.recursion_limit)
+        self.slots = {name: slot for slot, name in enumerate(ast.names)}
+        self.defined = {}
+
+        tasks = task_effects(ast)
+        self.units = [Unit(node, tasks) for node in ast.body]
+        self.writers = {}
+        self.readers = {}
+        self.askers = {}
+        for index, unit in enumerate(self.units):
+            unit.columns = {self.column(name) for name in unit.asks}
+            for key in unit.writes:
+                self.writers.setdefault(key, []).append(index)
+            for key in unit.inputs:
+                self.readers.setdefault(key, []).append(index)
+            for column in unit.columns:
+                self.askers.setdefault(column, []).append(index)
+        self.dirty = []
+        self.queued = set()
+
+    def mark(self, index: int):
+        if index not in self.queued:
+            self.queued.add(index)
+            heappush(self.dirty, index)
+
+    def invalidate(self, key, start: int):
+        """
+        Mark the statements from `start` on that read the value `key` has
+        there, up to the next statement that assigns it.
+        """
+        writers = self.writers.get(key, ())
+        position = bisect_left(writers, start)
+        stop = writers[position] if position < len(writers) else len(self.units)
+        readers = self.readers.get(key, ())
+        for index in readers[bisect_left(readers, start):]:
+            if index > stop:
+                break
+            self.mark(index)
+
+    def invalidate_answers(self, column, start: int):
+        """
+        Mark every statement from `start` on that reads from `column`,
+        because the answers they get have moved.
+        """
+        askers = self.askers.get(column, ())
+        for index in askers[bisect_left(askers, start):]:
+            self.mark(index)
+
+    def diff(self, old: list):
+        """
+        Match the statements with the previous version. Unchanged ones keep
+        their results, the others are marked, and so is whatever read a value
+        or an answer from a statement that is gone.
+        """
+        new = self.units
+        old_keys = [unit.key for unit in old]
+        new_keys = [unit.key for unit in new]
+        # an edit usually touches a few lines, so the common ends are matched
+        # directly and only the middle goes through the slower diff
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old_keys[prefix] == new_keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old), len(new)) - prefix
+               and old_keys[len(old) - 1 - suffix] == new_keys[len(new) - 1 - suffix]):
+            suffix += 1
+        opcodes = [("equal", 0, prefix, 0, prefix)]
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_keys[prefix:len(old) - suffix],
+                                                   new_keys[prefix:len(new) - suffix], autojunk=False).get_opcodes():
+            opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+        opcodes.append(("equal", len(old) - suffix, len(old), len(new) - suffix, len(new)))
+
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                for before, after in zip(old[i1:i2], new[j1:j2]):
+                    after.inherit(before)
+                continue
+            if tag == "replace" and i2 - i1 == j2 - j1:
+                # edited in place: what the old statement assigned is compared
+                # with what the new one assigns once it ran
+                for index, (before, after) in enumerate(zip(old[i1:i2], new[j1:j2]), j1):
+                    after.inherit(before)
+                    self.mark(index)
+                    for key in before.writes - after.writes:
+                        self.invalidate(key, index)
+                continue
+            for before in old[i1:i2]:
+                for key in before.writes:
+                    self.invalidate(key, j1)
+                for column in before.answered:
+                    self.invalidate_answers(column, j1)
+            for index in range(j1, j2):
+                self.mark(index)
+
+    def compare_answers(self, answers: dict):
+        """
+        Mark the statements that would now read different answers.
+        """
+        for column in self.answers.keys() | answers.keys():
+            values = answers.get(column, [])
+            if self.answers.get(column, []) == values:
+                continue
+            position = 0
+            for index in self.askers.get(column, ()):
+                if index in self.queued:
+                    # it may read a different number of answers, moving all later ones
+                    self.invalidate_answers(column, index)
+                    break
+                read = self.units[index].answered.get(column, [])
+                if read != values[position:position + len(read)]:
+                    self.mark(index)
+                position += len(read)
+
+    # EVALUATION
+    def value_at(self, name: str, index: int):
+        """
+        The value of a variable just before statement `index` runs.
+        """
+        writers = self.writers.get(name, ())
+        position = bisect_left(writers, index) - 1
+        while position >= 0:
+            values = self.units[writers[position]].values
+            if values is not None and name in values:
+                return values[name]
+            position -= 1
+        return UNSET
+
+    def task_at(self, name: str, index: int):
+        """
+        The task a TODO in statement `index` calls, compiled for this version.
+        """
+        writers = self.writers.get(("task", name), ())
+        position = bisect_left(writers, index) - 1
+        if position < 0:
+            return None
+        definition = writers[position]
+        if definition not in self.defined:
+            holder = Frame(0)
+            self.compiler.compile(self.units[definition].node)(holder)
+            self.defined[definition] = holder.tasks[name]
+        return self.defined[definition]
+
+    def answered_before(self, column, index: int) -> int:
+        askers = self.askers.get(column, ())
+        return sum(len(self.units[asker].answered.get(column, ())) for asker in askers[:bisect_left(askers, index)])
+
+    def execute(self, index: int):
+        unit = self.units[index]
+        frame = self.frame
+        slots = frame.slots
+        # the task frames of this run share the dict, so it is refilled in place
+        frame.tasks.clear()
+        for key in unit.inputs | unit.writes:
+            if type(key) is tuple:
+                task = self.task_at(key[1], index)
+                if task is not None:
+                    frame.tasks[key[1]] = task
+            else:
+                slots[self.slots[key]] = self.value_at(key, index)
+
+        receipts = Receipts()
+        answers = UnitAnswers(self.answers, {column: self.answered_before(column, index) for column in unit.columns},
+                              self.column)
+        self.channel.inputs, self.channel.output = answers, receipts
+        if unit.compiled is None:
+            unit.compiled = self.compiler.compile(unit.node)
+        try:
+            run_closures(unit.compiled, frame)
+        finally:
+            self.channel.inputs = self.channel.output = None
+
+        values = {key: unit.key if type(key) is tuple else slots[self.slots[key]] for key in unit.writes}
+        before = unit.values or {}
+        for key, value in values.items():
+            if key not in before or not same_value(before[key], value):
+                self.invalidate(key, index + 1)
+        for key in before.keys() - values.keys():
+            # no longer assigned here, e.g. after a task definition went away
+            self.invalidate(key, index + 1)
+        for column in unit.answered.keys() | answers.read.keys():
+            if len(unit.answered.get(column, ())) != len(answers.read.get(column, ())):
+                self.invalidate_answers(column, index + 1)
+        unit.values = values
+        unit.answered = answers.read
+        unit.receipts = receipts.lines
+
+
+def read_answers(path: str | None = None, csv_path: str | None = None) -> list | dict | None:
+    """
+    The answers in an --input file as a list, or in a --csv file as a dict of
+    columns, with empty cells skipped like `inputs.CSVInput` does.
+    """
+    if csv_path is not None:
+        with open(csv_path, newline="", encoding="utf-8") as stream:
+            reader = csv.DictReader(stream)
+            columns = {name: [] for name in reader.fieldnames or ()}
+            for row in reader:
+                for name, value in row.items():
+                    if name in columns and value is not None and value.strip():
+                        columns[name].append(value)
+        return columns
+    if path is not None:
+        with open(path, encoding="utf-8") as stream:
+            return [line for line in stream if line.strip()]
+    return None
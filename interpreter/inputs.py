@@ -0,0 +1,143 @@
+"""
+Where ASK gets its answers.
+
+Every engine calls `ask(name, prompt)` on an input source. The default prompts
+on the terminal like `input()`. For scripted runs the answers come from a
+line-delimited stream (a file or piped stdin) or from CSV columns, read through
+buffered file objects and without echoing prompts. Programs embedding CASH
+pass the answers per variable in a dict.
+"""
+import csv
+import sys
+
+
+class PromptInput:
+    """
+    Asks on the terminal. Buffered receipts in `output` are flushed first so
+    they show up before the prompt.
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+
+    def ask(self, name: str, prompt: str) -> float:
+        if self.output is not None:
+            self.output.flush()
+        return float(input(f"{prompt}: "))
+
+    def close(self):
+        pass
+
+
+class StreamInput:
+    """
+    One answer per line, in the order the ASKs run. Blank lines are skipped.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines = iter(stream)
+
+    def ask(self, name: str, prompt: str) -> float:
+        for line in self.lines:
+            if line.strip():
+                return float(line)
+        raise EOFError(f"No input left for ASK {name}")
+
+    def close(self):
+        close_stream(self.stream)
+
+
+class CSVInput:
+    """
+    Every ASKed variable reads its own column from top to bottom, so `ASK price`
+    takes the next value of the `price` column. `columns` maps variable names to
+    differently named columns. Empty cells are skipped, which lets a column with
+    a single answer sit next to one with an answer per loop iteration.
+    """
+
+    def __init__(self, stream, columns: dict | None = None):
+        self.stream = stream
+        self.reader = csv.DictReader(stream)
+        self.columns = columns or {}
+        self.rows = []
+        self.positions = {}
+
+    def ask(self, name: str, prompt: str) -> float:
+        column = self.columns.get(name, name)
+        if column not in (self.reader.fieldnames or ()):
+            raise KeyError(f"CSV input has no column {column} for ASK {name}")
+
+        position = self.positions.get(column, 0)
+        while True:
+            if position == len(self.rows):
+                row = next(self.reader, None)
+                if row is None:
+                    raise EOFError(f"No input left in column {column} for ASK {name}")
+                self.rows.append(row)
+            value = self.rows[position][column]
+            position += 1
+            if value is not None and value.strip():
+                break
+        self.positions[column] = position
+        return float(value)
+
+    def close(self):
+        close_stream(self.stream)
+
+
+class MappingInput:
+    """
+    Every ASKed variable takes the next of its own answers, like a CSV column:
+    with {"price": [10, 12]} the first `ASK price` gets 10 and the second 12.
+    A single answer is a list of one.
+    """
+
+    def __init__(self, answers: dict):
+        self.answers = {name: iter(values if isinstance(values, (list, tuple)) else [values])
+                        for name, values in answers.items()}
+
+    def ask(self, name: str, prompt: str) -> float:
+        for value in self.answers.get(name, ()):
+            return float(value)
+
+    def close(self):
+        close_stream(self.stream)
+        raise EOFError(f"No input left for ASK {name}")
+
+    def close(self):
+        pass
+
+
+def close_stream(stream):
+    # answers may also come from lists, which have nothing to close
+    if stream is not sys.stdin and hasattr(stream, "close"):
+        stream.close()
+
+
+def parse_columns(pairs: list) -> dict:
+    """
+    Turn ["price=unit_price", ...] into {"price": "unit_price", ...}.
+    """
+    columns = {}
+    for pair in pairs:
+        name, sep, column = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected VARIABLE=COLUMN, got {pair}")
+        columns[name] = column
+    return columns
+
+
+def open_input(path: str | None = None, csv_path: str | None = None, columns: dict | None = None, output=None):
+    """
+    The input source for the command line options. "-" reads from stdin.
+    `output` is flushed before every prompt. Close the source when the run
+    is over; stdin is left open.
+    """
+    if csv_path is not None:
+        stream = sys.stdin if csv_path == "-" else open(csv_path, newline="", encoding="utf-8")
+        return CSVInput(stream, columns)
+    if path is not None:
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        return StreamInput(stream)
+    return PromptInput(output)
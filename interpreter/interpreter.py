@@ -1,180 +1,254 @@
+import argparse
 import sys
-from antlr4 import *
-from cash.CASHParser import CASHParser
-from cash.CASHLexer import CASHLexer
-from cash.CASHVisitor import CASHVisitor
-from symbol_table import SymbolTable, Task
-
-class InterpreterVisitor(CASHVisitor): 
-    def __init__(self, symbol_table: SymbolTable):
-        self.symbol_table = symbol_table
-
-    # EXPRESSIONS
-    def visitNested(self, ctx: CASHParser.NestedContext):
-        return self.visit(ctx.expression())
-
-    def visitMult(self, ctx: CASHParser.MultContext):
-        return self.visit(ctx.getChild(0)) * self.visit(ctx.getChild(2))
-    
-    def visitAdd(self, ctx: CASHParser.AddContext):
-        return self.visit(ctx.getChild(0)) + self.visit(ctx.getChild(2))
-    
-    def visitDiv(self, ctx: CASHParser.DivContext):
-        return self.visit(ctx.getChild(0)) / self.visit(ctx.getChild(2))
-    
-    def visitSub(self, ctx: CASHParser.SubContext):
-        return self.visit(ctx.getChild(0)) - self.visit(ctx.getChild(2))
-    
-    def visitNested_bool(self, ctx: CASHParser.Nested_boolContext):
-        return self.visit(ctx.bool_expr())
-    
-    def visitAnd(self, ctx: CASHParser.AndContext):
-        return self.visit(ctx.getChild(0)) and self.visit(ctx.getChild(2))
-    
-    def visitOr(self, ctx: CASHParser.OrContext):
-        return self.visit(ctx.getChild(0)) or self.visit(ctx.getChild(2))
-    
-    def visitNot(self, ctx: CASHParser.NotContext):
-        return not self.visit(ctx.bool_expr())
-
-    def visitComp(self, ctx: CASHParser.CompContext):
-        return self.visit(ctx.comparison())
-    
-    def visitComparison(self, ctx: CASHParser.ComparisonContext):
-        left = self.visit(ctx.getChild(0))
-        right = self.visit(ctx.getChild(ctx.getChildCount()-1))
-
-        if ctx.COMPARE_EQ() is not None:
-            return left == right 
-        elif ctx.COMPARE_LT() is not None: 
-            return left < right 
-        elif ctx.COMPARE_LTE() is not None:
-            return left <= right 
-        elif ctx.COMPARE_GT() is not None: 
-            return left > right
-        elif ctx.COMPARE_GTE() is not None:
-            return left >= right
-        
-    def visitConcat(self, ctx: CASHParser.ConcatContext):
-        return str(self.visit(ctx.getChild(0))) + str(self.visit(ctx.getChild(2)))
-    
-    def visitSplit(self, ctx: CASHParser.SplitContext):
-        return str(self.visit(ctx.getChild(0))).split(str(self.visit(ctx.getChild(2))))
-
-    # TYPES
-    def visitInt(self, ctx: CASHParser.IntContext):
-        return int(str(ctx.INT()))
-    
-    def visitFloat(self, ctx: CASHParser.FloatContext):
-        return float(str(ctx.FLOAT()).replace(",", "."))
-
-    def visitVar(self, ctx: CASHParser.VarContext):
-        name = str(ctx.IDENTIFIER())
-        var = self.symbol_table.get_var(name)
-        return var
-    
-    def visitStrlit(self, ctx: CASHParser.StrlitContext):
-        return self.visit(ctx.str_lit())
-
-    def visitStr_lit(self, ctx: CASHParser.Str_litContext):
-        if ctx.STRING() is not None:
-            return str(ctx.STRING())[1:-1]
-        if ctx.WHITESPACE() is not None:
-            return ' '
-    
-    # STATEMENTS
-    def visitPrint(self, ctx: CASHParser.PrintContext):
-        empty_string = ""
-        if ctx.STRING() is not None: 
-            string_token = ctx.STRING()
-            empty_string += str(string_token)[1:-1]
-
-        if ctx.expression() is not None:
-            value = self.visit(ctx.expression())
-            empty_string += str(value)
-        print(str(empty_string))
-
-    def visitCost(self, ctx: CASHParser.CostContext):
-        name = str(ctx.IDENTIFIER())
-        value = self.visit(ctx.expression())
-        self.symbol_table.add_var(name,value)
-
-    def visitDiscount(self, ctx: CASHParser.DiscountContext):
-        exp1 = self.visit(ctx.expression())
-        name = str(ctx.IDENTIFIER())
-        exp2 = self.symbol_table.get_var(name)
-        exp2 = exp2 - (exp2 * (float(exp1) / 100))
-        self.symbol_table.add_var(name, exp2)
-    
-    def visitAsk(self, ctx: CASHParser.AskContext):
-        prompt = str(ctx.STRING())[1:-1]
-        value = float(input(f"{prompt}: "))
-        name = str(ctx.IDENTIFIER()) 
-        self.symbol_table.add_var(name, value)
-
-    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
-        for c, stmt in zip(ctx.bool_expr(), ctx.main_stmt()):
-            if self.visit(c):
-                self.visit(stmt)
-                return
-        if len(ctx.main_stmt()) <= len(ctx.bool_expr()):
-            return
-        self.visit(ctx.main_stmt(len(ctx.bool_expr())))
-
-    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
-        isSatisfied = self.visit(ctx.bool_expr())
-        while isSatisfied:
-            for stmt in ctx.main_stmt():
-                self.visit(stmt)
-            isSatisfied = self.visit(ctx.bool_expr())
-
-    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
-        name = str(ctx.IDENTIFIER(0))
-        params = self.visit(ctx.param_list())
-        task_body = list(ctx.task_body().getChildren())
-        task = Task(name, params, task_body)
-        self.symbol_table.add_task(task)
-
-    def visitTodo(self, ctx: CASHParser.TodoContext):
-        name = str(ctx.IDENTIFIER())
-        
-        if ctx.actual_param_list():
-            params = self.visit(ctx.actual_param_list())
-        else:
-            params = []
-
-        task = self.symbol_table.get_task(name)
-
-        task.execute(self, params)
-
-    def visitParam_list(self, ctx: CASHParser.Param_listContext):
-        index = 0
-        curr = ctx.IDENTIFIER(index)
-        result = []
-        while curr is not None: 
-            result.append(str(curr))
-            index += 1
-            curr = ctx.IDENTIFIER(index)
-        return result
-    
-    def visitActual_param_list(self, ctx: CASHParser.Actual_param_listContext):
-        return [self.visit(expr) for expr in ctx.expression()]
+import time
+from pathlib import Path
+from symbol_table import SymbolTable, DEFAULT_RECURSION_LIMIT, new_global_frame
+from resolver import resolve
+from ast_cache import ASTCache, DEFAULT_AST_CACHE_SIZE
+from inputs import open_input, parse_columns
+from output import TextSink, RecordSink, DEFAULT_FLUSH_EVERY
+from closure_engine import ClosureCompiler, run as run_closures
+from bytecode import CodeObject, build_memos, compile_bytecode, hash_source, run as run_bytecode
+from memo import DEFAULT_MEMO_SIZE, MEMO_POLICIES
+# ANTLR, the generated parser and everything that walks the parse tree are
+# imported only when a source has to be parsed, so cached programs start fast
+
+# how often --watch looks for changes, in seconds
+WATCH_INTERVAL = 0.2
+
+def load_program(source: bytes, fold: bool = True, cache: ASTCache | None = None, front_end=None,
+                 cents: bool = False) -> tuple:
+    """
+    The resolved AST of a source and the types the TypeChecker inferred for it,
+    taken from `cache` when the same source was lowered before. `front_end`
+    parses it otherwise. With `cents` its numbers are scaled integers.
+    """
+    if cache is not None:
+        cached = cache.load(source, fold, cents)
+        if cached is not None:
+            return cached
+
+    from antlr4 import InputStream
+    from frontend import parse
+    from constant_folding import fold_constants
+    from typechecker import TypeChecker
+    from lowering import lower
+
+    tree = parse(InputStream(source.decode("utf-8")), front_end)
+    constants = fold_constants(tree, cents) if fold else {}
+    checker = TypeChecker(SymbolTable())
+    types = checker.visit(tree)
+    program = resolve(lower(tree, constants, cents, checker.use_types)), types
+    if cache is not None:
+        cache.store(source, fold, program, cents)
+    return program
+
+def load_bytecode(fpath: Path, fold: bool = True, cache: ASTCache | None = None) -> CodeObject:
+    """
+    Return the bytecode for `fpath`. A `.cashc` file next to the source is reused
+    when it was built from the same source with the same `fold`, otherwise it
+    is (re)written.
+    """
+    if fpath.suffix == ".cashc":
+        code_object = CodeObject.loads(fpath.read_bytes())
+        if code_object is None:
+            raise ValueError(f"{fpath} was not written by this version of CASH")
+        return code_object
+
+    source = fpath.read_bytes()
+    source_hash = hash_source(source, fold)
+    compiled_path = fpath.with_suffix(".cashc")
+    if compiled_path.exists():
+        code_object = CodeObject.loads(compiled_path.read_bytes(), source_hash)
+        if code_object is not None:
+            return code_object
+
+    code_object = compile_bytecode(load_program(source, fold, cache)[0])
+    try:
+        compiled_path.write_bytes(code_object.dumps(source_hash))
+    except OSError:
+        pass
+    return code_object
+
+def print_memo_stats(memos):
+    for memo in memos:
+        print(memo.summary(), file=sys.stderr)
+
+def run_vectorized(args, cache: ASTCache | None):
+    # NumPy is only needed for batches, so it is imported here
+    from vectorized import read_columns, run_batch, write_receipts
+
+    program, _ = load_program(Path(args.file).read_bytes(), not args.no_fold, cache)
+    stream = sys.stdin if args.csv == "-" else open(args.csv, newline="", encoding="utf-8")
+    with stream:
+        columns, rows = read_columns(stream, parse_columns(args.column))
+    receipts = run_batch(program, columns, rows)
+    write_receipts(receipts, rows, sys.stdout)
+
+def run_watch(args, fpath: Path, cache: ASTCache | None):
+    """
+    Run the script again whenever it or its answers change, re-evaluating only
+    the statements the change affects.
+    """
+    from frontend import FrontEnd
+    from incremental import Session, read_answers
+
+    session = Session(not args.no_fold, args.cents, args.memo_size, args.memo_policy, args.recursion_limit, cache,
+                      FrontEnd())
+    columns = parse_columns(args.column)
+    watched = [fpath] + [Path(name) for name in (args.input, args.csv) if name is not None]
+    seen = None
+    try:
+        while True:
+            stamps = [path.stat().st_mtime_ns if path.exists() else None for path in watched]
+            if stamps != seen:
+                seen = stamps
+                start = time.perf_counter()
+                try:
+                    receipts = session.run(fpath.read_bytes(), read_answers(args.input, args.csv), columns)
+                except Exception as error:
+                    print(f"{type(error).__name__}: {error}", file=sys.stderr)
+                else:
+                    stream = open(args.output, "w", encoding="utf-8") if args.output else None
+                    output = RecordSink(stream or sys.stdout) if args.records else TextSink(stream, 0)
+                    for prefix, value in receipts:
+                        output.receipt(prefix, value)
+                    output.close()
+                    print(f"re-ran {session.rerun} of {len(session.units)} statements "
+                          f"in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
 
 def main():
-    if len(sys.argv) >= 2:
-        fname = sys.argv[1]
-        input_stream = FileStream(fname, encoding="utf-8")
-
-        lexer = CASHLexer(input_stream)
-        token_stream = CommonTokenStream(lexer)
-        parser = CASHParser(token_stream)
-        tree = parser.program()
-        table = SymbolTable()
-        visitor = InterpreterVisitor(table)
+    arg_parser = argparse.ArgumentParser(description="Run a CASH program.")
+    arg_parser.add_argument("file", help="path to a .cash source file or a compiled .cashc file")
+    engine = arg_parser.add_mutually_exclusive_group()
+    engine.add_argument("--visitor", action="store_true", help="run with the reference parse-tree visitor")
+    engine.add_argument("--bytecode", action="store_true", help="run on the bytecode VM and cache it as .cashc")
+    engine.add_argument("--vectorize", action="store_true",
+                        help="run once per row of --csv with NumPy and write the receipts as CSV")
+    arg_parser.add_argument("--recursion-limit", type=int, default=DEFAULT_RECURSION_LIMIT,
+                            help="maximum depth of nested TODO calls")
+    arg_parser.add_argument("--memo-size", type=int, default=DEFAULT_MEMO_SIZE,
+                            help="cached calls per pure task, 0 disables memoization")
+    arg_parser.add_argument("--memo-policy", choices=MEMO_POLICIES, default="lru",
+                            help="which cached call to evict when a task's cache is full")
+    arg_parser.add_argument("--memo-stats", action="store_true",
+                            help="print cache hits and misses of memoized tasks to stderr")
+    arg_parser.add_argument("--no-fold", action="store_true",
+                            help="skip constant folding and dead-branch elimination")
+    arg_parser.add_argument("--cents", action="store_true",
+                            help="compute exactly in whole cents instead of floats, rounding halves away from zero")
+    answers = arg_parser.add_mutually_exclusive_group()
+    answers.add_argument("--input", metavar="FILE",
+                         help="answer ASK from FILE, one value per line, without prompting (- for stdin)")
+    answers.add_argument("--csv", metavar="FILE",
+                         help="answer ASK from the CSV column named after the variable (- for stdin)")
+    arg_parser.add_argument("--column", action="append", default=[], metavar="VARIABLE=COLUMN",
+                            help="read VARIABLE from a differently named CSV column")
+    arg_parser.add_argument("--output", metavar="FILE", help="write the receipts to FILE instead of stdout")
+    arg_parser.add_argument("--flush-every", type=int, default=None, metavar="N",
+                            help="write the receipts in batches of N lines, 0 only at exit "
+                                 f"(default: 1 on a terminal, {DEFAULT_FLUSH_EVERY} otherwise)")
+    arg_parser.add_argument("--records", action="store_true",
+                            help="print every receipt as a JSON record of its prefix and value")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always parse, without reading or writing the AST cache")
+    arg_parser.add_argument("--cache-dir", type=Path, default=None,
+                            help="where lowered programs are cached (default: $CASH_CACHE_DIR/ast or ~/.cache/cash/ast)")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_AST_CACHE_SIZE, metavar="BYTES",
+                            help="remove the least recently used cached programs beyond this size")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="run again whenever the file or its answers change, re-evaluating only what changed")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="print how often each statement, loop and task ran and how long it took to stderr")
+    arg_parser.add_argument("--profile-out", metavar="FILE",
+                            help="profile and write the time per call stack to FILE in collapsed-stack format")
+    args = arg_parser.parse_args()
+    fpath = Path(args.file)
+    cache = None if args.no_cache else ASTCache(args.cache_dir, args.cache_size)
+
+    profiler = None
+    if args.profile or args.profile_out:
+        if args.vectorize or args.bytecode or fpath.suffix == ".cashc":
+            arg_parser.error("profiling needs the default engine or --visitor")
+        from profiler import Profiler
+        profiler = Profiler()
+    if args.cents and (args.vectorize or args.bytecode or args.visitor or fpath.suffix == ".cashc"):
+        arg_parser.error("--cents needs the default engine")
+
+    if args.watch:
+        if args.vectorize or args.bytecode or args.visitor or fpath.suffix == ".cashc" or profiler is not None:
+            arg_parser.error("--watch needs the default engine")
+        if "-" in (args.input, args.csv):
+            arg_parser.error("--watch reads the answers from a file, not stdin")
+        run_watch(args, fpath, cache)
+        return
+
+    if args.vectorize:
+        if args.csv is None:
+            arg_parser.error("--vectorize needs the batch as --csv FILE")
+        run_vectorized(args, cache)
+        return
+
+    stream = open(args.output, "w", encoding="utf-8") if args.output else None
+    output = RecordSink(stream or sys.stdout) if args.records else TextSink(stream, flush_policy(args, stream))
+    try:
+        inputs = open_input(args.input, args.csv, parse_columns(args.column), output)
+        try:
+            run_program(args, fpath, inputs, output, cache, profiler)
+        finally:
+            inputs.close()
+    finally:
+        output.close()
+        if profiler is not None:
+            write_profile(args, profiler)
+
+def write_profile(args, profiler):
+    if args.profile:
+        profiler.report(sys.stderr)
+    if args.profile_out:
+        with open(args.profile_out, "w", encoding="utf-8") as out:
+            profiler.write_collapsed(out)
+
+def flush_policy(args, stream) -> int:
+    if args.flush_every is not None:
+        return args.flush_every
+    # receipts show up right away on a terminal, pipes and files get them in batches
+    return 1 if stream is None and sys.stdout.isatty() else DEFAULT_FLUSH_EVERY
+
+def run_program(args, fpath: Path, inputs, output, cache: ASTCache | None, profiler=None):
+    if args.bytecode or fpath.suffix == ".cashc":
+        code_object = load_bytecode(fpath, not args.no_fold, cache)
+        memos = build_memos(code_object, args.memo_size, args.memo_policy)
+        run_bytecode(code_object, new_global_frame(len(code_object.names), args.recursion_limit), memos, inputs,
+                     output)
+        if args.memo_stats:
+            print_memo_stats(memos.values())
+        return
+
+    # the parse-tree visitor is kept as the reference engine
+    if args.visitor:
+        from antlr4 import FileStream
+        from frontend import parse
+        from constant_folding import fold_constants
+        from visitor import InterpreterVisitor, ProfilingVisitor
+
+        tree = parse(FileStream(args.file, encoding="utf-8"))
+        constants = {} if args.no_fold else fold_constants(tree)
+        if profiler is None:
+            visitor = InterpreterVisitor(SymbolTable(), constants, inputs, output)
+        else:
+            visitor = ProfilingVisitor(SymbolTable(), profiler, constants, inputs, output)
         visitor.visit(tree)
-        # print(tree.toStringTree(recog=parser))
     else:
-        print("Usage: python interpreter/interpreter.py path/to/file.cash")
+        ast, types = load_program(fpath.read_bytes(), not args.no_fold, cache, cents=args.cents)
+        compiler = ClosureCompiler(args.memo_size, args.memo_policy, types, inputs, output, profiler, args.cents)
+        program = compiler.compile_program(ast)
+        run_closures(program, new_global_frame(len(ast.names), args.recursion_limit))
+        if args.memo_stats:
+            print_memo_stats(compiler.memos)
+    # print(tree.toStringTree(recog=parser))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,168 @@
+"""
+Lowers the ANTLR parse tree into the AST of cash_ast.py.
+"""
+import sys
+
+from antlr4 import *
+from cash.CASHParser import CASHParser
+from cash.CASHVisitor import CASHVisitor
+from cash_ast import *
+import fixed_point
+
+
+class Lowering(CASHVisitor):
+    """
+    Walks the ANTLR parse tree once and returns the equivalent AST.
+
+    `constants` is the result of the constant folding pass: folded expressions
+    become `Const` nodes and CONFIRM arms that can never run are left out.
+
+    With `cents`, numeric literals become scaled integers (see fixed_point.py).
+
+    `use_types` are the TypeChecker's types per read, kept on every `Var`.
+
+    String literals are interned, so every occurrence of the same text is one
+    object, pickled once into the AST cache and compared by identity first.
+    """
+
+    def __init__(self, constants: dict | None = None, cents: bool = False, use_types: dict | None = None):
+        self.constants = constants or {}
+        self.cents = cents
+        self.use_types = use_types or {}
+
+    def visit(self, tree):
+        if tree in self.constants:
+            return Const(literal(self.constants[tree]))
+        return tree.accept(self)
+
+    # PROGRAM STRUCTURE
+    def visitProgram(self, ctx: CASHParser.ProgramContext):
+        body = []
+        for child in ctx.getChildren():
+            if isinstance(child, ParserRuleContext):
+                body.append(self.visit(child))
+        return Program(body)
+
+    def visitMain_stmt(self, ctx: CASHParser.Main_stmtContext):
+        return self.visit(ctx.statement())
+
+    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
+        body = [self.visit(stmt) for stmt in ctx.main_stmt()]
+        return Scan(self.visit(ctx.bool_expr()), body, ctx.start.line)
+
+    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
+        conds = ctx.bool_expr()
+        stmts = ctx.main_stmt()
+        arms = []
+        fallback = None
+        for c, stmt in zip(conds, stmts):
+            cond = self.visit(c)
+            if isinstance(cond, Const):
+                if not cond.value:
+                    continue
+                # always taken, so it ends the chain
+                fallback = [self.visit(stmt)]
+                break
+            arms.append((cond, [self.visit(stmt)]))
+        else:
+            if len(stmts) > len(conds):
+                fallback = [self.visit(stmts[len(conds)])]
+        return Cond(arms, fallback, ctx.start.line)
+
+    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
+        name = str(ctx.IDENTIFIER(0))
+        params = [str(param) for param in ctx.param_list().IDENTIFIER()]
+        body = [self.visit(stmt) for stmt in ctx.task_body().getChildren()]
+        return Task(name, params, body, ctx.start.line)
+
+    # STATEMENTS
+    def visitCost(self, ctx: CASHParser.CostContext):
+        return Cost(str(ctx.IDENTIFIER()), self.visit(ctx.expression()), ctx.start.line)
+
+    def visitPrint(self, ctx: CASHParser.PrintContext):
+        prefix = None
+        if ctx.STRING() is not None:
+            prefix = literal(str(ctx.STRING())[1:-1])
+        expr = None
+        if ctx.expression() is not None:
+            expr = self.visit(ctx.expression())
+        return Print(prefix, expr, ctx.start.line)
+
+    def visitDiscount(self, ctx: CASHParser.DiscountContext):
+        return Discount(self.visit(ctx.expression()), str(ctx.IDENTIFIER()), ctx.start.line)
+
+    def visitAsk(self, ctx: CASHParser.AskContext):
+        return Ask(str(ctx.IDENTIFIER()), literal(str(ctx.STRING())[1:-1]), ctx.start.line)
+
+    def visitTodo(self, ctx: CASHParser.TodoContext):
+        args = []
+        if ctx.actual_param_list():
+            args = [self.visit(expr) for expr in ctx.actual_param_list().expression()]
+        return Todo(str(ctx.IDENTIFIER()), args, ctx.start.line)
+
+    # EXPRESSIONS
+    def visitNested(self, ctx: CASHParser.NestedContext):
+        return self.visit(ctx.expression())
+
+    def visitMult(self, ctx: CASHParser.MultContext):
+        return BinOp("*", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitAdd(self, ctx: CASHParser.AddContext):
+        return BinOp("+", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitSub(self, ctx: CASHParser.SubContext):
+        return BinOp("-", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitDiv(self, ctx: CASHParser.DivContext):
+        return BinOp("/", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitConcat(self, ctx: CASHParser.ConcatContext):
+        return BinOp("++", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitSplit(self, ctx: CASHParser.SplitContext):
+        return BinOp("//", self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+    def visitStrlit(self, ctx: CASHParser.StrlitContext):
+        return Const(literal(str(ctx.str_lit().STRING())[1:-1]))
+
+    def visitFloat(self, ctx: CASHParser.FloatContext):
+        if self.cents:
+            return Const(fixed_point.from_literal(str(ctx.FLOAT())))
+        return Const(float(str(ctx.FLOAT()).replace(",", ".")))
+
+    def visitInt(self, ctx: CASHParser.IntContext):
+        if self.cents:
+            return Const(fixed_point.from_literal(str(ctx.INT())))
+        return Const(int(str(ctx.INT())))
+
+    def visitVar(self, ctx: CASHParser.VarContext):
+        return Var(str(ctx.IDENTIFIER()), self.use_types.get(ctx))
+
+    # BOOLEAN EXPRESSIONS
+    def visitNested_bool(self, ctx: CASHParser.Nested_boolContext):
+        return self.visit(ctx.bool_expr())
+
+    def visitNot(self, ctx: CASHParser.NotContext):
+        return Not(self.visit(ctx.bool_expr()))
+
+    def visitAnd(self, ctx: CASHParser.AndContext):
+        return And(self.visit(ctx.bool_expr(0)), self.visit(ctx.bool_expr(1)))
+
+    def visitOr(self, ctx: CASHParser.OrContext):
+        return Or(self.visit(ctx.bool_expr(0)), self.visit(ctx.bool_expr(1)))
+
+    def visitComp(self, ctx: CASHParser.CompContext):
+        return self.visit(ctx.comparison())
+
+    def visitComparison(self, ctx: CASHParser.ComparisonContext):
+        op = ctx.getChild(1).getText()
+        return Compare(op, self.visit(ctx.expression(0)), self.visit(ctx.expression(1)))
+
+
+def literal(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def lower(tree: CASHParser.ProgramContext, constants: dict | None = None, cents: bool = False,
+          use_types: dict | None = None) -> Program:
+    return Lowering(constants, cents, use_types).visit(tree)
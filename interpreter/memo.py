@@ -0,0 +1,185 @@
+"""
+Memoization of pure TASKs.
+
+CASH tasks have no return value: a task hands results back by assigning
+variables of the main program. A task is treated as pure when it never ASKs,
+never prints a RECEIPT and only calls other pure tasks. Its effect is then
+fully decided by its arguments and the globals it reads, so a call can be
+served by replaying the global writes recorded for the same inputs.
+"""
+from collections import OrderedDict
+
+from cash_ast import *
+
+MEMO_POLICIES = ("lru", "fifo")
+DEFAULT_MEMO_SIZE = 256
+
+
+class TaskEffects:
+    def __init__(self):
+        self.has_io = False
+        self.reads = set()
+        self.writes = set()
+        self.callees = set()
+
+    def collect(self, node: Node):
+        if isinstance(node, (Ask, Print)):
+            self.has_io = True
+        if isinstance(node, Var) and node.depth > 0:
+            self.reads.add(node.slot)
+        if isinstance(node, (Cost, Ask, Discount)) and node.depth > 0:
+            self.writes.add(node.slot)
+            if isinstance(node, Discount):
+                self.reads.add(node.slot)
+        if isinstance(node, Todo):
+            self.callees.add(node.name)
+
+        for child in children(node):
+            self.collect(child)
+
+
+def children(node: Node) -> list:
+    if isinstance(node, (BinOp, Compare, And, Or)):
+        return [node.left, node.right]
+    if isinstance(node, Not):
+        return [node.operand]
+    if isinstance(node, Cost):
+        return [node.expr]
+    if isinstance(node, Print):
+        return [node.expr] if node.expr is not None else []
+    if isinstance(node, Discount):
+        return [node.percent]
+    if isinstance(node, Todo):
+        return list(node.args)
+    if isinstance(node, Scan):
+        return [node.cond] + node.body
+    if isinstance(node, Cond):
+        result = []
+        for cond, body in node.arms:
+            result.append(cond)
+            result.extend(body)
+        return result + (node.fallback or [])
+    return []
+
+
+def definite_writes(stmts: list) -> set:
+    """
+    The global slots every run of `stmts` assigns, not counting the tasks it calls.
+    """
+    slots = set()
+    for stmt in stmts:
+        if isinstance(stmt, (Cost, Ask, Discount)) and stmt.depth > 0:
+            slots.add(stmt.slot)
+        elif isinstance(stmt, Cond) and stmt.fallback is not None:
+            arms = [definite_writes(body) for _, body in stmt.arms] + [definite_writes(stmt.fallback)]
+            slots |= set.intersection(*arms)
+    return slots
+
+
+def analyze_purity(program: Program) -> dict:
+    """
+    Map the name of every pure task to the (reads, writes) global slots of a
+    call, including everything its callees read and write. `program` must be
+    resolved. A slot a call may leave unassigned counts as read too, since
+    its value after the call is then the one from before. Tasks defined more
+    than once are never pure, since which body runs is only known at runtime.
+    """
+    definitions = {}
+    for stmt in program.body:
+        if isinstance(stmt, Task):
+            definitions.setdefault(stmt.name, []).append(stmt)
+
+    effects = {}
+    for name, tasks in definitions.items():
+        if len(tasks) == 1:
+            effect = TaskEffects()
+            for stmt in tasks[0].body:
+                effect.collect(stmt)
+            effects[name] = effect
+
+    # start from every candidate being pure and drop tasks until nothing changes
+    pure = {name for name, effect in effects.items() if not effect.has_io}
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            effect = effects[name]
+            if not effect.callees <= pure:
+                pure.discard(name)
+                changed = True
+                continue
+            for callee in effect.callees:
+                reads = effect.reads | effects[callee].reads
+                writes = effect.writes | effects[callee].writes
+                if reads != effect.reads or writes != effect.writes:
+                    effect.reads, effect.writes = reads, writes
+                    changed = True
+
+    result = {}
+    for name in pure:
+        effect = effects[name]
+        maybe = effect.writes - definite_writes(definitions[name][0].body)
+        result[name] = tuple(sorted(effect.reads | maybe)), tuple(sorted(effect.writes))
+    return result
+
+
+class TaskMemo:
+    """
+    A bounded cache from (arguments, globals read) to the globals a call changed.
+    `policy` is "lru" to evict the least recently used entry or "fifo" to evict
+    the oldest one.
+    """
+
+    def __init__(self, name: str, reads: tuple, writes: tuple,
+                 size: int = DEFAULT_MEMO_SIZE, policy: str = "lru"):
+        if policy not in MEMO_POLICIES:
+            raise ValueError(f"Unknown memo policy {policy}")
+        self.name = name
+        self.reads = reads
+        self.writes = writes
+        self.size = size
+        self.lru = policy == "lru"
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, global_slots: list, param_values: list):
+        """
+        The cache key, or None when an input cannot be hashed (e.g. a `//` result).
+        Types are part of the key so 1 and 1.0 do not share an entry.
+        """
+        values = tuple(param_values) + tuple(global_slots[slot] for slot in self.reads)
+        key = values + tuple(map(type, values))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def lookup(self, key):
+        effect = self.entries.get(key)
+        if effect is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.lru:
+            self.entries.move_to_end(key)
+        return effect
+
+    def store(self, key, global_slots: list):
+        # a write of the value a slot already had is still a write: the key
+        # does not hold written values, so a later hit may find another one there
+        effect = tuple((slot, global_slots[slot]) for slot in self.writes)
+        self.entries[key] = effect
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def summary(self) -> str:
+        return f"{self.name}: {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+
+def replay(effect: tuple, global_slots: list):
+    for slot, value in effect:
+        global_slots[slot] = value
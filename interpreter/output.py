@@ -0,0 +1,112 @@
+"""
+Where RECEIPT output goes.
+
+Every engine hands a RECEIPT to `sink.receipt(prefix, value)`, leaving out the
+value when the statement only prints text. Sinks decide how the receipt is
+stored and when it is written: `TextSink` buffers lines and writes them to a
+stream in batches, `MemorySink` keeps the text, `CallbackSink` passes every
+line on, and `RecordSink` keeps structured records instead of text.
+"""
+import json
+import sys
+
+from strings import plain
+
+# value of a RECEIPT that only prints its prefix
+NO_VALUE = object()
+
+DEFAULT_FLUSH_EVERY = 4096
+
+
+def receipt_text(prefix: str, value) -> str:
+    return prefix if value is NO_VALUE else prefix + str(value)
+
+
+class TextSink:
+    """
+    Buffers lines and writes them to `stream` with a single write once
+    `flush_every` lines are pending. 1 writes every line right away, 0 only
+    writes when the sink is flushed or closed. `stream` defaults to whatever
+    sys.stdout is at the time of writing.
+    """
+
+    def __init__(self, stream=None, flush_every: int = 1):
+        self.stream = stream
+        self.flush_every = flush_every
+        self.pending = []
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.pending.append(receipt_text(prefix, value))
+        if self.flush_every and len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        stream = self.stream or sys.stdout
+        stream.write("\n".join(self.pending) + "\n")
+        stream.flush()
+        self.pending.clear()
+
+    def close(self):
+        self.flush()
+        if self.stream is not None and self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+
+
+class MemorySink:
+    def __init__(self):
+        self.lines = []
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.lines.append(receipt_text(prefix, value))
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.lines)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.callback(receipt_text(prefix, value))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordSink:
+    """
+    Keeps every receipt as a {"prefix", "value"} record, with the value left
+    as the program computed it (None for text-only receipts). Given a
+    `stream`, the records are written to it as JSON lines when the sink is
+    closed.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.records = []
+
+    def receipt(self, prefix: str, value=NO_VALUE):
+        self.records.append({"prefix": prefix, "value": None if value is NO_VALUE else plain(value)})
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.stream is None:
+            return
+        self.stream.writelines(json.dumps(record) + "\n" for record in self.records)
+        self.stream.flush()
+        if self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
@@ -0,0 +1,141 @@
+"""
+Execution profiling for CASH programs.
+
+A profiled program counts and times every statement, SCAN loop, CONFIRM chain
+and task body, attributed to the source line it starts on. Profiling is opt-in
+and decided when the program is prepared: the engines wrap their statements
+only when they are given a `Profiler`, so an unprofiled run executes exactly
+the same code as before and pays nothing for it.
+
+Besides the per-site table, the time is also kept per call stack, which
+`write_collapsed` exports in the collapsed-stack format read by flamegraph.pl,
+speedscope and similar tools.
+"""
+import time
+
+# how sites are labelled, keyed by the class name of the AST node or of the
+# ANTLR context they come from
+SITE_KINDS = {
+    "Cost": "COST", "CostContext": "COST",
+    "Print": "RECEIPT", "PrintContext": "RECEIPT",
+    "Discount": "DISCOUNT", "DiscountContext": "DISCOUNT",
+    "Ask": "ASK", "AskContext": "ASK",
+    "Todo": "TODO", "TodoContext": "TODO",
+    "Scan": "SCAN", "Scan_modContext": "SCAN",
+    "Cond": "CONFIRM", "Cond_modContext": "CONFIRM",
+    "Task": "TASK", "Task_modContext": "TASK",
+}
+
+
+def site_label(kind: str, name: str | None, line: int) -> str:
+    return f"{kind} {name}:{line}" if name else f"{kind}:{line}"
+
+
+def context_site(ctx) -> tuple:
+    """
+    (kind, name, line) of a statement, SCAN, CONFIRM or task in the parse tree.
+    """
+    kind = SITE_KINDS[type(ctx).__name__]
+    identifier = getattr(ctx, "IDENTIFIER", None)
+    name = None
+    if identifier is not None:
+        # a task's IDENTIFIER(0) is its name, a statement has a single one
+        token = identifier(0) if kind == "TASK" else identifier()
+        name = str(token)
+    return kind, name, ctx.start.line
+
+
+class Site:
+    __slots__ = ("kind", "name", "line", "label", "count", "total_ns", "active")
+
+    def __init__(self, kind: str, name: str | None, line: int):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.label = site_label(kind, name, line)
+        self.count = 0
+        self.total_ns = 0
+        # how many runs of this site are in progress, so recursion is not counted twice
+        self.active = 0
+
+
+class Profiler:
+    """
+    Collects counts and times per site and per call stack. `enter` and `leave`
+    bracket every run of a site; engines usually go through `wrap`.
+    """
+
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.sites = {}
+        self.stack = []
+        self.starts = []
+        self.children = []
+        self.stacks = {}
+
+    def site(self, kind: str, name: str | None, line: int) -> Site:
+        key = (kind, name, line)
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = Site(kind, name, line)
+        return site
+
+    def node_site(self, node) -> Site:
+        return self.site(SITE_KINDS[type(node).__name__], getattr(node, "name", None), node.line)
+
+    def enter(self, site: Site):
+        site.count += 1
+        site.active += 1
+        self.stack.append(site)
+        self.children.append(0)
+        self.starts.append(self.clock())
+
+    def leave(self):
+        elapsed = self.clock() - self.starts.pop()
+        site = self.stack[-1]
+        site.active -= 1
+        if not site.active:
+            site.total_ns += elapsed
+
+        path = tuple(entry.label for entry in self.stack)
+        self.stacks[path] = self.stacks.get(path, 0) + elapsed - self.children.pop()
+        self.stack.pop()
+        if self.children:
+            self.children[-1] += elapsed
+
+    def wrap(self, site: Site, body):
+        """
+        Profile a compiled closure taking a frame, keeping what it returns.
+        """
+        enter, leave = self.enter, self.leave
+
+        def profiled(frame):
+            enter(site)
+            try:
+                return body(frame)
+            finally:
+                leave()
+        return profiled
+
+    def report(self, out):
+        """
+        Print every site that ran with its count and cumulative time, slowest first.
+        """
+        # every nanosecond spent in a site is the self time of exactly one stack
+        total_ns = sum(self.stacks.values())
+        out.write(f"{'count':>10}  {'total ms':>10}  {'%':>5}  site\n")
+        for site in sorted(self.sites.values(), key=lambda site: (-site.total_ns, site.line)):
+            if not site.count:
+                continue
+            share = 100 * site.total_ns / total_ns if total_ns else 0.0
+            out.write(f"{site.count:>10}  {site.total_ns / 1e6:>10.3f}  {share:>5.1f}  {site.label}\n")
+
+    def write_collapsed(self, out, root: str = "main"):
+        """
+        One `frame;frame;... microseconds` line per call stack, counting the time
+        spent in the innermost frame itself.
+        """
+        for path, self_ns in sorted(self.stacks.items()):
+            micros = self_ns // 1000
+            if micros > 0:
+                out.write(";".join((root,) + path) + f" {micros}\n")
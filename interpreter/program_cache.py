@@ -0,0 +1,133 @@
+"""
+A content-addressed on-disk cache for compiled programs.
+
+Entries are files named by the sha256 of everything that decides their
+content (the source, the compiler version, the target, ...). Reading an entry
+refreshes its modification time, and when the cache grows past its size cap
+the entries used least recently are removed first.
+"""
+import hashlib
+import os
+from functools import lru_cache
+from stat import S_ISREG
+from pathlib import Path
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+# a worker process parses all its programs with one lexer and parser
+FRONT_END = None
+
+
+def default_cache_dir() -> Path:
+    if "CASH_CACHE_DIR" in os.environ:
+        return Path(os.environ["CASH_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "cash"
+
+
+def cache_key(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        # length prefixes keep ("ab", "c") and ("a", "bc") apart
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    def __init__(self, directory: Path | None = None, max_size: int = DEFAULT_CACHE_SIZE, suffix: str = ""):
+        self.directory = Path(directory) if directory is not None else default_cache_dir()
+        self.max_size = max_size
+        self.suffix = suffix
+
+    def path(self, key: str) -> Path:
+        return self.directory / (key + self.suffix)
+
+    def lookup(self, key: str) -> Path | None:
+        """
+        The path of the entry for `key`, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def load(self, key: str) -> bytes | None:
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def store(self, key: str, data: bytes, mode: int = 0o644) -> Path:
+        """
+        Write an entry atomically, so concurrent runs never see half a file.
+        """
+        import tempfile
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            os.chmod(tmp, mode)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+        return self.path(key)
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*" + self.suffix):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not S_ISREG(stat.st_mode):
+                # e.g. the directory of another cache inside this one
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+def load_source(source: bytes) -> tuple:
+    """
+    The resolved AST and inferred types of `source`, parsed with the process's
+    FrontEnd and kept in the on-disk AST cache.
+    """
+    # the loader needs ANTLR, which the compiled-program cache does not
+    from interpreter import load_program
+    from ast_cache import ASTCache
+    from frontend import FrontEnd
+
+    global FRONT_END
+    if FRONT_END is None:
+        FRONT_END = FrontEnd()
+    return load_program(source, True, ASTCache(), FRONT_END)
+
+
+def program_loader(size: int):
+    """
+    `load_source` behind an LRU cache of `size` programs, for the long-lived
+    workers of batch.py and server.py. It is keyed on the source itself, so an
+    edited script is loaded again.
+    """
+    return lru_cache(maxsize=size)(load_source)
@@ -0,0 +1,202 @@
+"""
+Resolves every variable in a lowered program to a fixed frame slot.
+
+The program body owns the global scope and every task gets its own scope whose
+`next` is the global scope. Inside a task, parameters and the names it assigns
+are local, unless the main program assigns the same name, in which case the
+task updates the global. Names that are only read fall back to the enclosing
+scope.
+"""
+from __future__ import annotations
+from cash_ast import *
+
+
+class Scope:
+    def __init__(self, next: Scope | None = None):
+        self.names = {}
+        self.next = next
+
+    def declare(self, name: str) -> int:
+        if name not in self.names:
+            self.names[name] = len(self.names)
+        return self.names[name]
+
+    def lookup(self, name: str):
+        """
+        Return (depth, slot) of the nearest declaration, depth counting `next` hops.
+        """
+        depth = 0
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return depth, scope.names[name]
+            scope = scope.next
+            depth += 1
+        return None
+
+
+def assigned_names(stmts: list) -> list:
+    """
+    Names written by COST, DISCOUNT or ASK in `stmts`, not counting task definitions.
+    """
+    names = []
+    for stmt in stmts:
+        if isinstance(stmt, (Cost, Discount, Ask)):
+            names.append(stmt.name)
+        elif isinstance(stmt, Scan):
+            names.extend(assigned_names(stmt.body))
+        elif isinstance(stmt, Cond):
+            for _, body in stmt.arms:
+                names.extend(assigned_names(body))
+            names.extend(assigned_names(stmt.fallback or []))
+    return names
+
+
+def mark_tail_calls(stmts: list):
+    """
+    Flag the TODOs that end a task body, directly or as the last statement of a
+    CONFIRM/CHECK_AGAIN/FALLBACK arm that ends it.
+    """
+    if not stmts:
+        return
+    last = stmts[-1]
+    if isinstance(last, Todo):
+        last.tail = True
+    elif isinstance(last, Cond):
+        for _, body in last.arms:
+            mark_tail_calls(body)
+        mark_tail_calls(last.fallback)
+
+
+class Resolver:
+    """
+    Annotates Var, Cost, Discount and Ask nodes with their (depth, slot) and
+    records the slot layout on the Program and on every Task.
+
+    Alongside it tracks which local slots are definitely assigned, so reads that
+    can never see an unassigned variable skip the runtime check.
+    """
+
+    def __init__(self):
+        self.global_scope = Scope()
+        self.scope = self.global_scope
+        self.assigned = set()
+
+    def resolve_program(self, program: Program) -> Program:
+        for name in assigned_names(program.body):
+            self.global_scope.declare(name)
+        self.resolve_block(program.body)
+        program.names = list(self.global_scope.names)
+        return program
+
+    def resolve_block(self, stmts: list):
+        for stmt in stmts:
+            self.resolve(stmt)
+
+    def resolve(self, node: Node):
+        method = getattr(self, "resolve_" + type(node).__name__)
+        method(node)
+
+    def bind(self, node: Node, name: str):
+        location = self.scope.lookup(name)
+        if location is None:
+            # never assigned anywhere, reads fail at runtime like in the visitor
+            self.global_scope.declare(name)
+            location = self.scope.lookup(name)
+        node.depth, node.slot = location
+
+    def mark_assigned(self, node: Node):
+        if node.depth == 0:
+            self.assigned.add(node.slot)
+
+    # STATEMENTS
+    def resolve_Cost(self, node: Cost):
+        self.resolve(node.expr)
+        self.bind(node, node.name)
+        self.mark_assigned(node)
+
+    def resolve_Print(self, node: Print):
+        if node.expr is not None:
+            self.resolve(node.expr)
+
+    def resolve_Discount(self, node: Discount):
+        self.resolve(node.percent)
+        self.bind(node, node.name)
+
+    def resolve_Ask(self, node: Ask):
+        self.bind(node, node.name)
+        self.mark_assigned(node)
+
+    def resolve_Todo(self, node: Todo):
+        for arg in node.args:
+            self.resolve(arg)
+
+    def resolve_Scan(self, node: Scan):
+        self.resolve(node.cond)
+        # the body may never run, so nothing it assigns is definite afterwards
+        before = set(self.assigned)
+        self.resolve_block(node.body)
+        self.assigned = before
+
+    def resolve_Cond(self, node: Cond):
+        before = set(self.assigned)
+        outcomes = []
+        for cond, body in node.arms:
+            self.resolve(cond)
+            self.assigned = set(before)
+            self.resolve_block(body)
+            outcomes.append(self.assigned)
+        self.assigned = set(before)
+        if node.fallback is not None:
+            self.resolve_block(node.fallback)
+            outcomes.append(self.assigned)
+            self.assigned = before | set.intersection(*outcomes)
+        else:
+            self.assigned = before
+
+    def resolve_Task(self, node: Task):
+        scope = Scope(self.global_scope)
+        for param in node.params:
+            scope.declare(param)
+        for name in assigned_names(node.body):
+            if scope.lookup(name) is None:
+                scope.declare(name)
+
+        outer_scope, outer_assigned = self.scope, self.assigned
+        self.scope = scope
+        self.assigned = set(scope.names[param] for param in node.params)
+        self.resolve_block(node.body)
+        self.scope, self.assigned = outer_scope, outer_assigned
+        node.names = list(scope.names)
+        mark_tail_calls(node.body)
+
+    # EXPRESSIONS
+    def resolve_Const(self, node: Const):
+        pass
+
+    def resolve_Var(self, node: Var):
+        self.bind(node, node.name)
+        node.checked = not (node.depth == 0 and node.slot in self.assigned)
+
+    def resolve_BinOp(self, node: BinOp):
+        self.resolve(node.left)
+        self.resolve(node.right)
+
+    def resolve_Compare(self, node: Compare):
+        self.resolve(node.left)
+        self.resolve(node.right)
+
+    def resolve_And(self, node: And):
+        self.resolve(node.left)
+        self.resolve(node.right)
+
+    def resolve_Or(self, node: Or):
+        self.resolve(node.left)
+        self.resolve(node.right)
+
+    def resolve_Not(self, node: Not):
+        self.resolve(node.operand)
+
+
+def resolve(program: Program) -> Program:
+    return Resolver().resolve_program(program)
@@ -0,0 +1,251 @@
+"""
+A long-lived CASH execution service.
+
+Running `interpreter.py` once per script pays for starting Python, importing
+ANTLR and parsing every time. The daemon pays once. It accepts run requests
+on a Unix socket or over HTTP on localhost and runs them on a pool of worker
+processes. Each worker keeps the programs it has loaded in an LRU cache.
+
+A request is a JSON object with either the path of a `script` or the `source`
+of a program, and optionally the `inputs` answering its ASKs in order:
+
+    {"script": "example_code/calc.cash", "inputs": [3, 4]}
+
+The response holds what the program printed, the error that stopped it (or
+null), whether the program came from the cache, and timings in seconds:
+
+    {"output": "...", "error": null, "cached": true,
+     "timings": {"load": ..., "compile": ..., "exec": ..., "total": ...}}
+
+On the Unix socket every line is a request, answered by one line in order.
+Over HTTP, requests are POSTed to /run. Every request compiles its own
+closures and runs in a new global frame, so concurrent requests never share
+variables, tasks or memos.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from program_cache import program_loader
+from symbol_table import DEFAULT_RECURSION_LIMIT, new_global_frame
+from inputs import StreamInput
+from output import MemorySink
+from closure_engine import ClosureCompiler, run as run_closures
+
+PROGRAM_CACHE_SIZE = 256
+DEFAULT_PORT = 8765
+# the longest request line or body accepted, sources included
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+cached_program = None
+
+
+class RequestError(ValueError):
+    pass
+
+
+def init_worker(cache_size: int):
+    """
+    Give the worker its program cache. Ctrl-C is left to the daemon, which
+    waits for running requests before it exits.
+    """
+    global cached_program
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cached_program = program_loader(cache_size)
+
+
+def parse_request(body: bytes) -> dict:
+    try:
+        request = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise RequestError(f"invalid JSON: {e}") from None
+    if not isinstance(request, dict):
+        raise RequestError("a request must be a JSON object")
+    if ("script" in request) == ("source" in request):
+        raise RequestError("a request needs either 'script' or 'source'")
+    program = request.get("script", request.get("source"))
+    if not isinstance(program, str):
+        raise RequestError("'script' and 'source' must be strings")
+    inputs = request.get("inputs", [])
+    if not isinstance(inputs, list) or not all(isinstance(answer, (int, float, str)) for answer in inputs):
+        raise RequestError("'inputs' must be a list of numbers or strings")
+    return request
+
+
+def execute(request: dict, recursion_limit: int = DEFAULT_RECURSION_LIMIT) -> dict:
+    """
+    Run one request in a worker.
+    """
+    output = MemorySink()
+    error = None
+    cached = False
+    marks = [time.perf_counter()]
+    try:
+        if "script" in request:
+            source = Path(request["script"]).read_bytes()
+        else:
+            source = request["source"].encode("utf-8")
+        hits = cached_program.cache_info().hits
+        ast, types = cached_program(source)
+        cached = cached_program.cache_info().hits > hits
+        marks.append(time.perf_counter())
+
+        answers = StreamInput([str(answer) for answer in request.get("inputs", [])])
+        program = ClosureCompiler(types=types, inputs=answers, output=output).compile_program(ast)
+        marks.append(time.perf_counter())
+        run_closures(program, new_global_frame(len(ast.names), recursion_limit))
+        marks.append(time.perf_counter())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    timings = {phase: end - start for phase, start, end in zip(("load", "compile", "exec"), marks, marks[1:])}
+    return {"output": output.getvalue(), "error": error, "cached": cached, "timings": timings}
+
+
+def new_pool(workers: int | None, cache_size: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_size,))
+
+
+class Server:
+    """
+    Answers requests on the pool `new_executor()` returns. When a worker dies
+    (killed, out of memory, ...) the pool is broken for good, so the requests
+    it was running fail and a new pool takes over.
+    """
+
+    def __init__(self, new_executor, recursion_limit: int = DEFAULT_RECURSION_LIMIT):
+        self.new_executor = new_executor
+        self.executor = new_executor()
+        self.recursion_limit = recursion_limit
+
+    async def respond(self, body: bytes) -> tuple:
+        """
+        The HTTP status and the JSON response for a request body.
+        """
+        start = time.perf_counter()
+        try:
+            request = parse_request(body)
+        except RequestError as e:
+            return 400, {"error": str(e)}
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            response = await loop.run_in_executor(executor, execute, request, self.recursion_limit)
+        except BrokenProcessPool as e:
+            # requests running together all see the same pool break, only the first replaces it
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = self.new_executor()
+            return 500, {"error": f"a worker died while running the request: {e}"}
+        # includes the time spent waiting for a free worker
+        response["timings"]["total"] = time.perf_counter() - start
+        return 200, response
+
+    async def handle_lines(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(json.dumps({"error": "request too long"}).encode() + b"\n")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                _, response = await self.respond(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        try:
+            try:
+                status, response = await self.http_request(reader)
+            except (ValueError, asyncio.IncompleteReadError):
+                status, response = 400, {"error": "malformed HTTP request"}
+            body = json.dumps(response).encode()
+            writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                         "Content-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def http_request(self, reader) -> tuple:
+        method, target, _ = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if target != "/run":
+            return 404, {"error": f"no such endpoint: {target}"}
+        if method != "POST":
+            return 405, {"error": "requests are POSTed to /run"}
+        length = int(headers.get("content-length", 0))
+        if length > MAX_REQUEST_BYTES:
+            return 413, {"error": "request too long"}
+        return await self.respond(await reader.readexactly(length))
+
+
+async def serve(args):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    server = Server(lambda: new_pool(args.workers, args.cache_size), args.recursion_limit)
+    try:
+        if args.socket:
+            listener = await asyncio.start_unix_server(server.handle_lines, args.socket, limit=MAX_REQUEST_BYTES)
+            where = args.socket
+        else:
+            # only local clients: a request can read any script the daemon can
+            listener = await asyncio.start_server(server.handle_http, "127.0.0.1", args.port,
+                                                  limit=MAX_REQUEST_BYTES)
+            where = f"http://127.0.0.1:{args.port}/run"
+        print(f"serving on {where}", file=sys.stderr)
+        try:
+            async with listener:
+                await stop.wait()
+        finally:
+            if args.socket:
+                try:
+                    os.unlink(args.socket)
+                except OSError:
+                    pass
+    finally:
+        server.executor.shutdown()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Serve CASH run requests from a pool of warm workers.")
+    arg_parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket, one JSON request per line")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                            help=f"listen for HTTP on localhost (default: {DEFAULT_PORT})")
+    arg_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    arg_parser.add_argument("--cache-size", type=int, default=PROGRAM_CACHE_SIZE,
+                            help=f"programs each worker keeps loaded (default: {PROGRAM_CACHE_SIZE})")
+    arg_parser.add_argument("--recursion-limit", type=int, default=DEFAULT_RECURSION_LIMIT,
+                            help=f"maximum depth of nested task calls (default: {DEFAULT_RECURSION_LIMIT})")
+    args = arg_parser.parse_args()
+    asyncio.run(serve(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+String values for the interpreter engines.
+
+`++` in a SCAN loop, such as `COST line = line ++ "-" $`, would copy the whole
+string on every iteration. Once a concatenation is long enough, it yields a
+`Rope` instead: a list of parts that later `++`s append to in place, so
+building a string of n pieces takes O(n) instead of O(n^2). The text is only
+joined when it is printed or compared, and the joined string is kept.
+
+`//` yields a `Split`, which only splits the text when its parts are used.
+
+Both behave like the str and the list they stand for wherever a CASH value
+can go: printing, comparisons, `++`, arithmetic and memo keys.
+"""
+from collections.abc import Sequence
+
+# shorter results are plain strings, which is faster for the usual labels
+ROPE_MIN_LENGTH = 256
+
+
+class Rope:
+    """
+    Immutable text made of `parts[:count]`. The ropes built from one another
+    share the `parts` list: appending to the newest one extends the list,
+    while appending to an older one copies its parts first.
+    """
+    __slots__ = ("parts", "count", "length", "text")
+
+    def __init__(self, parts: list, count: int, length: int):
+        self.parts = parts
+        self.count = count
+        self.length = length
+        self.text = None
+
+    def __str__(self) -> str:
+        if self.text is None:
+            parts = self.parts if len(self.parts) == self.count else self.parts[:self.count]
+            self.text = "".join(parts)
+        return self.text
+
+    def __repr__(self) -> str:
+        return repr(str(self))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == plain(other)
+
+    def __ne__(self, other):
+        return str(self) != plain(other)
+
+    def __lt__(self, other):
+        return str(self) < plain(other)
+
+    def __le__(self, other):
+        return str(self) <= plain(other)
+
+    def __gt__(self, other):
+        return str(self) > plain(other)
+
+    def __ge__(self, other):
+        return str(self) >= plain(other)
+
+    def __add__(self, other):
+        return str(self) + plain(other)
+
+    def __radd__(self, other):
+        return plain(other) + str(self)
+
+    def __mul__(self, other):
+        return str(self) * other
+
+    __rmul__ = __mul__
+
+
+class Split(Sequence):
+    """
+    The list of the parts of `text` between `separator`s. The text is split
+    the first time a part is needed, counting them is done without splitting.
+    """
+    __slots__ = ("text", "separator", "parts")
+
+    def __init__(self, text: str, separator: str):
+        if not separator:
+            # str.split fails right away, so this does too
+            raise ValueError("empty separator")
+        self.text = text
+        self.separator = separator
+        self.parts = None
+
+    def items(self) -> list:
+        if self.parts is None:
+            self.parts = self.text.split(self.separator)
+        return self.parts
+
+    def __len__(self) -> int:
+        if self.parts is None:
+            return self.text.count(self.separator) + 1
+        return len(self.parts)
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def __repr__(self) -> str:
+        return repr(self.items())
+
+    __str__ = __repr__
+    # lists cannot be hashed, so neither can a split
+    __hash__ = None
+
+    def __eq__(self, other):
+        return self.items() == plain(other)
+
+    def __ne__(self, other):
+        return self.items() != plain(other)
+
+    def __lt__(self, other):
+        return self.items() < plain(other)
+
+    def __le__(self, other):
+        return self.items() <= plain(other)
+
+    def __gt__(self, other):
+        return self.items() > plain(other)
+
+    def __ge__(self, other):
+        return self.items() >= plain(other)
+
+    def __add__(self, other):
+        return self.items() + plain(other)
+
+    def __radd__(self, other):
+        return plain(other) + self.items()
+
+    def __mul__(self, other):
+        return self.items() * other
+
+    __rmul__ = __mul__
+
+
+def plain(value):
+    """
+    The str or list a rope or a split stands for; any other value as it is.
+    """
+    if type(value) is Rope:
+        return str(value)
+    if type(value) is Split:
+        return value.items()
+    return value
+
+
+def as_text(value):
+    """
+    The text of a value for `++`, with ropes kept as they are.
+    """
+    return value if type(value) is Rope else str(value)
+
+
+def concat(left, right):
+    """
+    left ++ right, for two values that are already text (str or Rope).
+    """
+    if type(right) is Rope:
+        right = str(right)
+    if type(left) is Rope:
+        parts = left.parts
+        if len(parts) != left.count:
+            # a longer rope was already built from `left`
+            parts = parts[:left.count]
+        parts.append(right)
+        return Rope(parts, left.count + 1, left.length + len(right))
+    length = len(left) + len(right)
+    if length < ROPE_MIN_LENGTH:
+        return left + right
+    return Rope([left, right], 2, length)
+
+
+def split(text, separator):
+    return Split(str(text), str(separator))
@@ -1,42 +1,71 @@
 from __future__ import annotations
-class Task: 
-    def __init__(self, name: str, param_names: list, body):
+class Task:
+    def __init__(self, name: str, param_names: list, body, scope: SymbolTable | None = None,
+                 shared: frozenset = frozenset()):
         self.name = name
         self.param_names = param_names
         self.body = body
+        self.scope = scope
+        # the names the main program assigns, which the task shares with it
+        self.shared = shared
 
-    def execute(self, visitor: 'InterpreterVisitor', param_values): 
-
-    
+    def execute(self, visitor: 'InterpreterVisitor', param_values):
+        # parameters live in a fresh scope whose `next` is the scope the task was defined in
+        local = SymbolTable(self.scope, self.shared)
         for name, value in zip(self.param_names, param_values):
-            visitor.symbol_table.add_var(name, value)
+            local.define_var(name, value)
 
-        for stmt in self.body:
-            visitor.visit(stmt)
+        caller = visitor.symbol_table
+        visitor.symbol_table = local
+        try:
+            for stmt in self.body:
+                visitor.visit(stmt)
+        finally:
+            visitor.symbol_table = caller
 
 class SymbolTable:
 
-    def __init__(self, next: SymbolTable | None = None):
+    def __init__(self, next: SymbolTable | None = None, shared: frozenset = frozenset()):
         self.storage = {}
         self.tasks = {}
         self.types = {}
         self.next = next
+        # names that belong to `next` even before it assigns them
+        self.shared = shared
 
     def add_var(self, name: str, value: float):
+        # assignments update the nearest scope that already holds the name
+        table = self
+        while table is not None:
+            if name in table.storage:
+                table.storage[name] = value
+                return
+            table = table.next
+        table = self
+        while name in table.shared and table.next is not None:
+            table = table.next
+        table.storage[name] = value
+
+    def define_var(self, name: str, value: float):
         self.storage[name] = value
 
     def get_var(self, name: str):
-        if name not in self.storage:
-            raise KeyError(f"Variable {name} not found!!")
-        return self.storage[name]
-    
+        table = self
+        while table is not None:
+            if name in table.storage:
+                return table.storage[name]
+            table = table.next
+        raise KeyError(f"Variable {name} not found!!")
+
 
     def add_task(self, task: Task):
-        self.tasks[task.name] = task 
+        self.tasks[task.name] = task
 
-    def get_task(self, name: str): 
+    def get_task(self, name: str):
+        if name not in self.tasks and self.next is not None:
+            return self.next.get_task(name)
         return self.tasks[name]
-    
+
     def is_defined(self, name: str):
         result = name in self.storage
         if not result and self.next is not None:
@@ -45,3 +74,64 @@ class SymbolTable:
 
     def resister_var_name(self, name: str):
         self.types[name] = {"string", "integer", "float"}
+
+# marks a frame slot whose variable has not been assigned yet
+UNSET = object()
+
+DEFAULT_RECURSION_LIMIT = 1000
+
+class Frame:
+    """
+    Array-backed variable storage used by the compiled engines. The resolver
+    gives every variable a fixed slot, and `next` links a task frame to the
+    global frame it was defined in. `tasks` and `calls` are shared by every
+    frame of one run.
+    """
+    __slots__ = ("slots", "next", "tasks", "calls")
+
+    def __init__(self, size: int, next: Frame | None = None):
+        self.slots = [UNSET] * size
+        self.next = next
+        self.tasks = next.tasks if next is not None else {}
+        self.calls = next.calls if next is not None else None
+
+class CallDepthExceeded(RecursionError):
+    def __init__(self, limit: int):
+        super().__init__(f"Task calls nested deeper than {limit}")
+        self.limit = limit
+
+class CallStack:
+    """
+    Hands out the frames for task invocations. Frames are pooled per size and
+    reused once the call returns, and nesting is capped at `limit` calls.
+    """
+
+    def __init__(self, global_frame: Frame, limit: int = DEFAULT_RECURSION_LIMIT):
+        self.global_frame = global_frame
+        self.limit = limit
+        self.depth = 0
+        self.pools = {}
+        global_frame.calls = self
+
+    def push(self, size: int) -> Frame:
+        if self.depth >= self.limit:
+            raise CallDepthExceeded(self.limit)
+        self.depth += 1
+        pool = self.pools.get(size)
+        if pool is None:
+            pool = self.pools[size] = ([], [UNSET] * size)
+        free, blank = pool
+        if free:
+            frame = free.pop()
+            frame.slots[:] = blank
+            return frame
+        return Frame(size, self.global_frame)
+
+    def pop(self, frame: Frame):
+        self.depth -= 1
+        self.pools[len(frame.slots)][0].append(frame)
+
+def new_global_frame(size: int, recursion_limit: int = DEFAULT_RECURSION_LIMIT) -> Frame:
+    frame = Frame(size)
+    CallStack(frame, recursion_limit)
+    return frame
@@ -1,12 +1,14 @@
 import sys
+from collections import deque
 from antlr4 import *
 from cash.CASHParser import CASHParser
-from cash.CASHLexer import CASHLexer
 from cash.CASHVisitor import CASHVisitor
+from constant_folding import assigned_in
+from frontend import parse
 from symbol_table import SymbolTable
 from typing import Literal
 
-CASH_TYP = Literal["string", "integer", "float", "boolean"]
+CASH_TYP = Literal["string", "integer", "float", "boolean", "list"]
 
 class ExitCall(Exception):
     pass
@@ -25,95 +27,398 @@ class UnsoundTypes(Exception):
         self.expected = expected
         self.actual = actual
 
-class TypeChecker(CASHVisitor): 
+NUMERIC = {"integer", "float"}
+
+NO_TYPES = frozenset()
+
+
+def local(name: str) -> tuple:
+    """
+    The key of a task's local variable, so it never mixes with a global of the
+    same name.
+    """
+    return ("local", name)
+
+
+class TypeNode:
+    """
+    A value in the dataflow graph: an assignment, a task parameter, or the join
+    of the values that reach a point where control flow merges. `types` only
+    ever grows. A node with an `expr` is typed from it, a join is the union of
+    its `inputs`, and `users` are the nodes to update when `types` grows.
+    """
+    __slots__ = ("types", "expr", "inputs", "users")
+
+    def __init__(self, types: frozenset = NO_TYPES, expr=None):
+        self.types = types
+        self.expr = expr
+        self.inputs = []
+        self.users = []
+
+
+class TaskInfo:
+    """
+    One task definition. `locals` are its parameters and the names it assigns
+    that the main program does not. `writes` are the globals a call may change
+    and `reads` the globals whose value a call may see, both including the
+    tasks it calls. `entry` holds a join per global read, fed by every call,
+    and `exit` the value of every written global when the task returns.
+    """
+
+    def __init__(self, ctx: CASHParser.Task_modContext, global_names: set):
+        self.ctx = ctx
+        self.name = str(ctx.IDENTIFIER(0))
+        self.params = [str(param) for param in ctx.param_list().IDENTIFIER()]
+        assigned = assigned_in(ctx.task_body())
+        self.locals = set(self.params) | (assigned - global_names)
+        self.writes = (assigned - set(self.params)) & global_names
+        self.reads = {name for name in map(str, (var.IDENTIFIER() for var in vars_in(ctx.task_body())))
+                      if name not in self.locals} | self.writes
+        self.calls = {str(todo.IDENTIFIER()) for todo in todos_in(ctx.task_body())}
+        self.param_nodes = {param: TypeNode() for param in self.params}
+        self.entry = {}
+        self.exit = {}
+
+
+class TypeChecker(CASHVisitor):
+    """
+    Infers the set of types every variable can hold with a flow-sensitive
+    dataflow analysis of the program and its tasks.
+
+    The analysis runs on the control-flow graph in sparse form. One walk over
+    the program turns every assignment into a node and places a join wherever
+    control flow merges: after a CONFIRM chain for the variables its arms
+    assign, at the head of a SCAN for the variables its body assigns, at the
+    entry of a task for its parameters and the globals it reads, and after a
+    TODO for the globals the task may write. Every read is linked to the one
+    node that reaches it. A worklist then grows the type sets along these
+    links until nothing changes. A set can only grow a few times, so the
+    analysis takes time linear in the size of the program, however many
+    variables and branches it has.
+
+    Tasks are analyzed once for all their calls. Parameters get the union of
+    the arguments passed, and globals the union of what the callers hold.
+
+    `visit` returns the types of every variable over the whole program, which
+    is what storage needs. `use_types` holds the types each read can see at its
+    point of the program, and `signatures()` the parameter types of every task.
+    """
     def __init__(self, symbol_table: SymbolTable):
         self.symbol_table = symbol_table
-        self.current_pushdown = set()
+        self.use_types = {}
+        self.reaching = {}
+        self.nodes = []
+        self.definitions = []
+        self.tasks = {}
+        self.global_names = set()
+        self.task = None
+        self.current = {}
+        # (callee, values before the call) and (callees, global, value before, result),
+        # linked once every task has been walked
+        self.call_sites = []
+        self.returns = []
 
-    def visitVar(self, ctx: CASHParser.VarContext):
+    # GRAPH
+    def node(self, types: frozenset = NO_TYPES, expr=None) -> TypeNode:
+        node = TypeNode(types, expr)
+        self.nodes.append(node)
+        return node
+
+    def link(self, source: TypeNode | None, target: TypeNode):
+        if source is not None:
+            target.inputs.append(source)
+            source.users.append(target)
+
+    def key(self, name: str):
+        return local(name) if self.task is not None and name in self.task.locals else name
+
+    def lookup(self, key):
+        """
+        The node holding `key` at the current point, None while it is unassigned.
+        A task sees the globals it was called with.
+        """
+        node = self.current.get(key)
+        if node is None and self.task is not None and isinstance(key, str):
+            node = self.current[key] = self.task_entry(self.task, key)
+        return node
+
+    def task_entry(self, task: TaskInfo, name: str) -> TypeNode:
+        if name not in task.entry:
+            task.entry[name] = self.node()
+        return task.entry[name]
+
+    def resolve(self, ctx: ParserRuleContext) -> list:
+        """
+        Link every read in an expression or condition to the node reaching it.
+        """
+        nodes = []
+        for var in vars_in(ctx):
+            node = self.reaching[var] = self.lookup(self.key(str(var.IDENTIFIER())))
+            if node is not None:
+                nodes.append(node)
+        return nodes
+
+    def expression(self, ctx: ParserRuleContext) -> TypeNode:
+        node = self.node(expr=ctx)
+        for source in self.resolve(ctx):
+            source.users.append(node)
+        return node
+
+    def define(self, name: str, node: TypeNode):
+        self.current[self.key(name)] = node
+        self.definitions.append((name, node))
+
+    def assigned_keys(self, ctx: ParserRuleContext) -> set:
+        """
+        Everything a SCAN or CONFIRM may change, including through TODOs.
+        """
+        keys = {self.key(name) for name in assigned_in(ctx)}
+        for todo in todos_in(ctx):
+            for callee in self.tasks.get(str(todo.IDENTIFIER()), []):
+                keys |= callee.writes
+        return keys
+
+    # WALK
+    def walk(self, children):
+        for child in children:
+            if isinstance(child, CASHParser.Main_stmtContext):
+                statement = child.statement()
+                if isinstance(statement, CASHParser.TodoContext):
+                    self.call(statement)
+                else:
+                    self.visit(statement)
+            elif isinstance(child, CASHParser.Scan_modContext):
+                self.scan(child)
+            elif isinstance(child, CASHParser.Cond_modContext):
+                self.cond(child)
+            # task definitions are walked on their own
+
+    def scan(self, ctx: CASHParser.Scan_modContext):
+        # the condition and the body start from the values before the loop or
+        # from the end of the previous iteration
+        heads = {}
+        for key in self.assigned_keys(ctx):
+            head = self.node()
+            self.link(self.lookup(key), head)
+            heads[key] = self.current[key] = head
+        self.resolve(ctx.bool_expr())
+        self.walk(ctx.main_stmt())
+        for key, head in heads.items():
+            self.link(self.current.get(key), head)
+            self.current[key] = head
+
+    def cond(self, ctx: CASHParser.Cond_modContext):
+        keys = self.assigned_keys(ctx)
+        before = {key: self.lookup(key) for key in keys}
+        conds = ctx.bool_expr()
+        stmts = ctx.main_stmt()
+        ends = []
+        for index, stmt in enumerate(stmts):
+            self.restore(before)
+            if index < len(conds):
+                self.resolve(conds[index])
+            self.walk([stmt])
+            ends.append({key: self.current.get(key) for key in keys})
+        if len(stmts) == len(conds):
+            # no FALLBACK, so every test may fail
+            ends.append(before)
+
+        for key in keys:
+            joined = self.node()
+            for end in ends:
+                self.link(end[key], joined)
+            self.current[key] = joined
+
+    def restore(self, values: dict):
+        for key, node in values.items():
+            if node is None:
+                self.current.pop(key, None)
+            else:
+                self.current[key] = node
+
+    def call(self, ctx: CASHParser.TodoContext):
+        """
+        Arguments flow into the parameters of every task of that name, the
+        globals the tasks read into their entries, and the globals they may
+        write come back as a join of what they return.
+        """
         name = str(ctx.IDENTIFIER())
-        result_types = self.current_pushdown.intersection(self.symbol_table.types[name])
-        if len(result_types) == 0:
-            raise UnsoundTypes(name, self.current_pushdown, self.symbol_table.types[name])
-        else:
-            self.symbol_table.types[name] = result_types
-            return result_types
-        
+        args = [self.expression(expr) for expr in ctx.actual_param_list().expression()]
+        callees = self.tasks.get(name, [])
+        before = {key: self.lookup(key) for callee in callees for key in callee.reads}
+        for callee in callees:
+            # extra arguments are dropped, missing parameters stay unassigned
+            for param, arg in zip(callee.params, args):
+                self.link(arg, callee.param_nodes[param])
+            self.call_sites.append((callee, before))
+        for key in set().union(*(callee.writes for callee in callees)):
+            result = self.node()
+            self.returns.append((callees, key, before[key], result))
+            self.current[key] = result
+
+    def walk_task(self, task: TaskInfo):
+        self.task = task
+        self.current = {local(param): node for param, node in task.param_nodes.items()}
+        self.walk(task.ctx.task_body().getChildren())
+        task.exit = {key: self.lookup(key) for key in task.writes}
+        self.task = None
+
+    def link_calls(self):
+        for callee, before in self.call_sites:
+            for key in callee.reads:
+                self.link(before[key], self.task_entry(callee, key))
+        for callees, key, before, result in self.returns:
+            for callee in callees:
+                self.link(callee.exit[key] if key in callee.writes else before, result)
+
+    # FIXPOINT
+    def propagate(self):
+        """
+        Type every expression once, then push every growth of a node to its
+        users until nothing grows.
+        """
+        changed = deque()
+        for node in self.nodes:
+            if node.expr is not None:
+                node.types = frozenset(self.visit(node.expr))
+            if node.types:
+                changed.append(node)
+        while changed:
+            node = changed.popleft()
+            for user in node.users:
+                if user.expr is not None:
+                    types = user.types | self.visit(user.expr)
+                else:
+                    types = user.types | node.types
+                if types != user.types:
+                    user.types = types
+                    changed.append(user)
+
+    # PROGRAM STRUCTURE
+    def visitProgram(self, ctx: CASHParser.ProgramContext):
+        for child in ctx.getChildren():
+            if isinstance(child, ParserRuleContext) and not isinstance(child, CASHParser.Task_modContext):
+                self.global_names |= assigned_in(child)
+        tasks = [TaskInfo(task, self.global_names) for task in ctx.task_mod()]
+        for task in tasks:
+            self.tasks.setdefault(task.name, []).append(task)
+        self.close_tasks(tasks)
+
+        self.walk(ctx.getChildren())
+        # every task is analyzed even if it is never called, so its assignments are typed
+        for task in tasks:
+            self.walk_task(task)
+        self.link_calls()
+        self.propagate()
+
+        types = self.symbol_table.types
+        for name, node in self.definitions:
+            types.setdefault(name, set()).update(node.types)
+        for task in tasks:
+            for param, node in task.param_nodes.items():
+                types.setdefault(param, set()).update(node.types)
+        for var, node in self.reaching.items():
+            self.use_types[var] = node.types if node is not None else NO_TYPES
+        return types
+
+    def close_tasks(self, tasks: list):
+        """
+        A call also writes and reads what the tasks it calls write and read.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for task in tasks:
+                for name in task.calls:
+                    for callee in self.tasks.get(name, []):
+                        if not (callee.writes <= task.writes and callee.reads <= task.reads):
+                            task.writes |= callee.writes
+                            task.reads |= callee.reads | callee.writes
+                            changed = True
+
+    def signatures(self) -> dict:
+        """
+        The parameters of every task with the types they can hold, merged over
+        all definitions with the same name.
+        """
+        result = {}
+        for name, tasks in self.tasks.items():
+            params = result.setdefault(name, {})
+            for task in tasks:
+                for param, node in task.param_nodes.items():
+                    params.setdefault(param, set()).update(node.types)
+        return result
+
+    # STATEMENTS
+    def visitCost(self, ctx: CASHParser.CostContext):
+        self.define(str(ctx.IDENTIFIER()), self.expression(ctx.expression()))
+
+    def visitDiscount(self, ctx: CASHParser.DiscountContext):
+        self.resolve(ctx.expression())
+        # discount always returns float
+        self.define(str(ctx.IDENTIFIER()), self.node(frozenset({"float"})))
+
+    def visitAsk(self, ctx: CASHParser.AskContext):
+        self.define(str(ctx.IDENTIFIER()), self.node(frozenset({"float"})))
+
+    def visitPrint(self, ctx: CASHParser.PrintContext):
+        if ctx.expression() is not None:
+            self.resolve(ctx.expression())
+
+    # EXPRESSIONS
+    def visitVar(self, ctx: CASHParser.VarContext):
+        node = self.reaching.get(ctx)
+        return node.types if node is not None else NO_TYPES
+
     def visitInt(self, ctx: CASHParser.IntContext):
         return {'integer'}
-    
+
     def visitFloat(self, ctx: CASHParser.FloatContext):
         return {'float'}
-    
+
+    def visitStrlit(self, ctx: CASHParser.StrlitContext):
+        return {'string'}
+
     def visitNested(self, ctx: CASHParser.NestedContext):
         return self.visit(ctx.expression())
-    
-    def visitCost(self, ctx: CASHParser.CostContext):
-        self.current_pushdown = {"integer", "float"}
-        name = str(ctx.IDENTIFIER())
-        admissable_types = self.visit(ctx.expression())
-        self.symbol_table.types[name] = admissable_types
 
-    def visitAdd(self, ctx: CASHParser.AddContext):
-        self.current_pushdown = {"integer", "float"}
+    def arithmetic(self, ctx: ParserRuleContext, division: bool = False):
         lt = self.visit(ctx.getChild(0))
         rt = self.visit(ctx.getChild(2))
-        if "float" in lt or "float" in rt:
-            return {"float"}
-        else:
-            return {"integer"}
-    
+        result = set()
+        for left in lt:
+            for right in rt:
+                if left in NUMERIC and right in NUMERIC:
+                    # `/` is true division, so it is float even for two integers
+                    result.add("float" if division or "float" in (left, right) else "integer")
+                else:
+                    # e.g. "ab" * 2 or "a" + "b"; anything else fails when it runs
+                    result |= {left, right} - NUMERIC
+        return result
+
+    def visitAdd(self, ctx: CASHParser.AddContext):
+        return self.arithmetic(ctx)
+
     def visitSub(self, ctx: CASHParser.SubContext):
-        self.current_pushdown = {"integer", "float"}
-        lt = self.visit(ctx.getChild(0))
-        rt = self.visit(ctx.getChild(2))
-        if "float" in lt or "float" in rt:
-            return {"float"}
-        else:
-            return {"integer"}
-    
+        return self.arithmetic(ctx)
+
     def visitMult(self, ctx: CASHParser.MultContext):
-        self.current_pushdown = {"integer", "float"}
-        lt = self.visit(ctx.getChild(0))
-        rt = self.visit(ctx.getChild(2))
-        if "float" in lt or "float" in rt:
-            return {"float"}
-        else:
-            return {"integer"}
+        return self.arithmetic(ctx)
 
     def visitDiv(self, ctx: CASHParser.DivContext):
-        self.current_pushdown = {"integer", "float"}
-        lt = self.visit(ctx.getChild(0))
-        rt = self.visit(ctx.getChild(2))
-        if "float" in lt or "float" in rt:
-            return {"float"}
-        else:
-            return {"integer"}
+        return self.arithmetic(ctx, division=True)
 
-    def visitDiscount(self, ctx: CASHParser.DiscountContext):
-        name = str(ctx.IDENTIFIER())
-        self.current_pushdown = {"integer", "float"}
-        discount_type = self.visit(ctx.expression())
-        self.symbol_table.types[name] = {"float"} 
-        # TODO discount always returns float
-    
-    def visitAsk(self, ctx: CASHParser.AskContext):
-        name = str(ctx.IDENTIFIER())
-        self.symbol_table.types[name] = {"float"}
-
-    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
-        for c, stmt in zip(ctx.comparison(), ctx.main_stmt()):
-            self.visit(c)
-            self.visit(stmt)
-        self.visit(ctx.main_stmt(len(ctx.comparison())))
+    def visitConcat(self, ctx: CASHParser.ConcatContext):
+        self.visit(ctx.getChild(0))
+        self.visit(ctx.getChild(2))
+        return {"string"}
 
-    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
-        self.visit(ctx.comparison())
-        for stmt in ctx.main_stmt():
-            self.visit(stmt)
+    def visitSplit(self, ctx: CASHParser.SplitContext):
+        self.visit(ctx.getChild(0))
+        self.visit(ctx.getChild(2))
+        return {"list"}
 
     def visitComparison(self, ctx: CASHParser.ComparisonContext):
-        self.current_pushdown = {"integer", "float"}
         self.visit(ctx.getChild(0))
         self.visit(ctx.getChild(ctx.getChildCount() - 1))
         return {"boolean"}
@@ -125,16 +430,38 @@ class TypeChecker(CASHVisitor):
                 print(f"{var_name} is {types.__iter__().__next__()}")
             else:
                 print(f"Error: {var_name} is unclear!")
+        for task_name, params in self.signatures().items():
+            signature = ", ".join(f"{param}: {' | '.join(sorted(types)) or 'never called'}"
+                                  for param, types in params.items())
+            print(f"TASK {task_name}({signature})")
+
+
+def contexts_in(ctx: ParserRuleContext, kind: type) -> list:
+    if isinstance(ctx, kind):
+        return [ctx]
+    found = []
+    for child in ctx.getChildren():
+        if isinstance(child, ParserRuleContext):
+            found.extend(contexts_in(child, kind))
+    return found
+
+def todos_in(ctx: ParserRuleContext) -> list:
+    """
+    Every TODO below `ctx`.
+    """
+    return contexts_in(ctx, CASHParser.TodoContext)
+
+def vars_in(ctx: ParserRuleContext) -> list:
+    """
+    Every variable read below `ctx`.
+    """
+    return contexts_in(ctx, CASHParser.VarContext)
+
 def main():
-    # input_stream = FileStream("./example_code/calc.cash", encoding="utf-8")
-    # input_stream = FileStream("./example_code/ifThenElse.cash", encoding="utf-8")
-    input_stream = FileStream("./example_code/int_float.cash", encoding="utf-8")
-    # input_stream = FileStream("./example_code/while.cash", encoding="utf-8")
-
-    lexer = CASHLexer(input_stream)
-    token_stream = CommonTokenStream(lexer)
-    parser = CASHParser(token_stream)
-    tree = parser.program()
+    if len(sys.argv) < 2:
+        print("Usage: python typechecker.py path/to/file.cash")
+        return
+    tree = parse(FileStream(sys.argv[1], encoding="utf-8"))
     symbol_table = SymbolTable()
 
     # visitor = InterpreterVisitor(symbol_table)
@@ -152,4 +479,4 @@ def main():
         print(f"Error: {e.name} does not exist")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
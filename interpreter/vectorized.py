@@ -0,0 +1,224 @@
+"""
+Vectorized batch execution with NumPy.
+
+A program is run once for a whole batch of independent rows: every ASK variable
+is bound to a column of answers and every expression is evaluated as an array
+operation over all rows at once. CONFIRM/CHECK_AGAIN/FALLBACK run every arm on
+all rows and merge the variables they assign with `np.select`, so each row
+ends up with the values of the arm it would have taken. Each RECEIPT yields one
+array of values, along with the mask of rows that actually printed it.
+
+Only straight-line programs with conditionals can be vectorized. Loops, task
+calls and string operators depend on per-row control flow or values and raise
+`NotVectorizable`. Arithmetic that would raise for a row (e.g. a division by
+zero) yields inf or nan for that row instead.
+"""
+import csv
+import warnings
+
+import numpy as np
+
+from cash_ast import *
+
+
+class NotVectorizable(Exception):
+    def __init__(self, node: Node, reason: str):
+        super().__init__(f"line {getattr(node, 'line', 0)}: {reason}")
+        self.node = node
+
+
+class Receipt:
+    """
+    The values one RECEIPT statement printed. `mask` marks the rows that reached
+    the statement, `values` holds a value for every row.
+    """
+    __slots__ = ("line", "prefix", "values", "mask")
+
+    def __init__(self, line: int, prefix: str, values, mask):
+        self.line = line
+        self.prefix = prefix
+        self.values = values
+        self.mask = mask
+
+
+
+ARITHMETIC = {
+    "*": np.multiply,
+    "+": np.add,
+    "-": np.subtract,
+    "/": np.true_divide,
+}
+
+COMPARISONS = {
+    "=": np.equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+
+class VectorEvaluator:
+    """
+    Runs a lowered `Program` over `rows` rows. `columns` maps every ASKed
+    variable to an array with one answer per row.
+    """
+
+    def __init__(self, columns: dict, rows: int):
+        self.columns = columns
+        self.rows = rows
+        self.env = {}
+        self.mask = np.ones(rows, dtype=bool)
+        self.receipts = []
+        self.asked = set()
+
+    def run(self, program: Program) -> list:
+        with np.errstate(all="ignore"):
+            self.execute_block(program.body)
+        return self.receipts
+
+    def execute_block(self, stmts: list):
+        for stmt in stmts:
+            method = getattr(self, "execute_" + type(stmt).__name__, None)
+            if method is None:
+                raise NotVectorizable(stmt, f"{type(stmt).__name__} cannot run on a batch")
+            method(stmt)
+
+    def rowwise(self, value):
+        return np.broadcast_to(value, (self.rows,))
+
+    # STATEMENTS
+    def execute_Cost(self, node: Cost):
+        self.env[node.name] = self.evaluate(node.expr)
+
+    def execute_Print(self, node: Print):
+        values = None if node.expr is None else self.rowwise(self.evaluate(node.expr))
+        self.receipts.append(Receipt(node.line, node.prefix or "", values, self.mask))
+
+    def execute_Discount(self, node: Discount):
+        rate = np.asarray(self.evaluate(node.percent), dtype=float) / 100
+        value = self.load(node.name)
+        self.env[node.name] = value - (value * rate)
+
+    def execute_Ask(self, node: Ask):
+        if node.name in self.asked:
+            raise NotVectorizable(node, f"{node.name} is asked more than once")
+        if node.name not in self.columns:
+            raise NotVectorizable(node, f"no input column for ASK {node.name}")
+        self.asked.add(node.name)
+        self.env[node.name] = np.asarray(self.columns[node.name], dtype=float)
+
+    def execute_Task(self, node: Task):
+        # defining a task is harmless, only calling it needs per-row control flow
+        pass
+
+    def execute_Scan(self, node: Scan):
+        if isinstance(node.cond, Const) and not node.cond.value:
+            return
+        raise NotVectorizable(node, "SCAN loops cannot run on a batch")
+
+    def execute_Cond(self, node: Cond):
+        """
+        Run every arm on the rows that take it and merge what the arms assigned.
+        The rows an arm does not take keep the values from before the CONFIRM.
+        """
+        before = self.env
+        outer = self.mask
+        remaining = outer
+        branches = []
+        for cond, body in node.arms:
+            self.env = before
+            taken = remaining & self.rowwise(self.evaluate(cond)).astype(bool)
+            remaining = remaining & ~taken
+            self.env, self.mask = dict(before), taken
+            self.execute_block(body)
+            branches.append((taken, self.env))
+
+        self.env, self.mask = dict(before), remaining
+        self.execute_block(node.fallback or [])
+        branches.append((remaining, self.env))
+
+        merged = dict(before)
+        for name in set().union(*(env for _, env in branches)):
+            if all(env.get(name) is before.get(name) for _, env in branches):
+                continue
+            # rows where no arm assigned a variable that did not exist before read nan
+            default = before.get(name, np.nan)
+            choices = [self.rowwise(env.get(name, default)) for _, env in branches]
+            merged[name] = np.select([taken for taken, _ in branches], choices, default)
+        self.env, self.mask = merged, outer
+
+    # EXPRESSIONS
+    def load(self, name: str):
+        if name not in self.env:
+            raise KeyError(f"Variable {name} not found!!")
+        return self.env[name]
+
+    def evaluate(self, node: Node):
+        if isinstance(node, Const):
+            if isinstance(node.value, str):
+                raise NotVectorizable(node, "string values cannot run on a batch")
+            return node.value
+        if isinstance(node, Var):
+            return self.load(node.name)
+        if isinstance(node, BinOp):
+            if node.op not in ARITHMETIC:
+                raise NotVectorizable(node, f"{node.op} cannot run on a batch")
+            return ARITHMETIC[node.op](self.evaluate(node.left), self.evaluate(node.right))
+        if isinstance(node, Compare):
+            return COMPARISONS[node.op](self.evaluate(node.left), self.evaluate(node.right))
+        if isinstance(node, And):
+            return np.logical_and(self.evaluate(node.left), self.evaluate(node.right))
+        if isinstance(node, Or):
+            return np.logical_or(self.evaluate(node.left), self.evaluate(node.right))
+        if isinstance(node, Not):
+            return np.logical_not(self.evaluate(node.operand))
+        raise NotVectorizable(node, f"{type(node).__name__} cannot run on a batch")
+
+
+def read_columns(stream, columns: dict | None = None) -> tuple:
+    """
+    Read a CSV with a header into float arrays keyed by variable name. `columns`
+    maps variable names to differently named CSV columns. Returns the arrays
+    and the number of rows.
+    """
+    header = next(csv.reader([stream.readline()]))
+    with warnings.catch_warnings():
+        # an empty batch is fine, loadtxt warns about it
+        warnings.simplefilter("ignore", UserWarning)
+        data = np.loadtxt(stream, delimiter=",", dtype=float, ndmin=2)
+    if data.size == 0:
+        data = np.empty((0, len(header)))
+    by_column = {name: data[:, index] for index, name in enumerate(header)}
+
+    arrays = dict(by_column)
+    for name, column in (columns or {}).items():
+        arrays[name] = by_column[column]
+    return arrays, data.shape[0]
+
+
+def run_batch(program: Program, columns: dict, rows: int) -> list:
+    return VectorEvaluator(columns, rows).run(program)
+
+
+def receipt_column(receipt: Receipt) -> list:
+    """
+    The text a RECEIPT printed for every row, empty where the row did not reach it.
+    """
+    if receipt.values is None:
+        texts = [receipt.prefix] * len(receipt.mask)
+    else:
+        prefix = receipt.prefix
+        texts = [prefix + str(value) for value in receipt.values.tolist()]
+    if not receipt.mask.all():
+        texts = [text if reached else "" for text, reached in zip(texts, receipt.mask.tolist())]
+    return texts
+
+
+def write_receipts(receipts: list, rows: int, out):
+    """
+    Write one CSV row per input row and one column per RECEIPT statement.
+    """
+    writer = csv.writer(out)
+    writer.writerow([f"line {receipt.line}" for receipt in receipts])
+    writer.writerows(zip(*(receipt_column(receipt) for receipt in receipts)))
@@ -0,0 +1,227 @@
+"""
+The reference engine: evaluates CASH by walking the ANTLR parse tree directly.
+"""
+from antlr4 import *
+from cash.CASHParser import CASHParser
+from cash.CASHVisitor import CASHVisitor
+from symbol_table import SymbolTable, Task
+from inputs import PromptInput
+from output import TextSink
+from strings import as_text, concat, split
+from profiler import context_site
+from constant_folding import assigned_in
+
+class InterpreterVisitor(CASHVisitor): 
+    def __init__(self, symbol_table: SymbolTable, constants: dict | None = None, inputs=None, output=None):
+        self.symbol_table = symbol_table
+        self.constants = constants or {}
+        self.inputs = inputs or PromptInput()
+        self.output = output or TextSink()
+        self.global_names = frozenset()
+
+    def visit(self, tree):
+        # expressions the constant folder proved constant are not evaluated
+        if tree in self.constants:
+            return self.constants[tree]
+        return tree.accept(self)
+
+    # EXPRESSIONS
+    def visitNested(self, ctx: CASHParser.NestedContext):
+        return self.visit(ctx.expression())
+
+    def visitMult(self, ctx: CASHParser.MultContext):
+        return self.visit(ctx.getChild(0)) * self.visit(ctx.getChild(2))
+    
+    def visitAdd(self, ctx: CASHParser.AddContext):
+        return self.visit(ctx.getChild(0)) + self.visit(ctx.getChild(2))
+    
+    def visitDiv(self, ctx: CASHParser.DivContext):
+        return self.visit(ctx.getChild(0)) / self.visit(ctx.getChild(2))
+    
+    def visitSub(self, ctx: CASHParser.SubContext):
+        return self.visit(ctx.getChild(0)) - self.visit(ctx.getChild(2))
+    
+    def visitNested_bool(self, ctx: CASHParser.Nested_boolContext):
+        return self.visit(ctx.bool_expr())
+    
+    def visitAnd(self, ctx: CASHParser.AndContext):
+        return self.visit(ctx.getChild(0)) and self.visit(ctx.getChild(2))
+    
+    def visitOr(self, ctx: CASHParser.OrContext):
+        return self.visit(ctx.getChild(0)) or self.visit(ctx.getChild(2))
+    
+    def visitNot(self, ctx: CASHParser.NotContext):
+        return not self.visit(ctx.bool_expr())
+
+    def visitComp(self, ctx: CASHParser.CompContext):
+        return self.visit(ctx.comparison())
+    
+    def visitComparison(self, ctx: CASHParser.ComparisonContext):
+        left = self.visit(ctx.getChild(0))
+        right = self.visit(ctx.getChild(ctx.getChildCount()-1))
+
+        if ctx.COMPARE_EQ() is not None:
+            return left == right 
+        elif ctx.COMPARE_LT() is not None: 
+            return left < right 
+        elif ctx.COMPARE_LTE() is not None:
+            return left <= right 
+        elif ctx.COMPARE_GT() is not None: 
+            return left > right
+        elif ctx.COMPARE_GTE() is not None:
+            return left >= right
+        
+    def visitConcat(self, ctx: CASHParser.ConcatContext):
+        return concat(as_text(self.visit(ctx.getChild(0))), as_text(self.visit(ctx.getChild(2))))
+    
+    def visitSplit(self, ctx: CASHParser.SplitContext):
+        return split(self.visit(ctx.getChild(0)), self.visit(ctx.getChild(2)))
+
+    # TYPES
+    def visitInt(self, ctx: CASHParser.IntContext):
+        return int(str(ctx.INT()))
+    
+    def visitFloat(self, ctx: CASHParser.FloatContext):
+        return float(str(ctx.FLOAT()).replace(",", "."))
+
+    def visitVar(self, ctx: CASHParser.VarContext):
+        name = str(ctx.IDENTIFIER())
+        var = self.symbol_table.get_var(name)
+        return var
+    
+    def visitStrlit(self, ctx: CASHParser.StrlitContext):
+        return self.visit(ctx.str_lit())
+
+    def visitStr_lit(self, ctx: CASHParser.Str_litContext):
+        if ctx.STRING() is not None:
+            return str(ctx.STRING())[1:-1]
+        if ctx.WHITESPACE() is not None:
+            return ' '
+    
+    # STATEMENTS
+    def visitPrint(self, ctx: CASHParser.PrintContext):
+        empty_string = ""
+        if ctx.STRING() is not None: 
+            string_token = ctx.STRING()
+            empty_string += str(string_token)[1:-1]
+
+        if ctx.expression() is not None:
+            self.output.receipt(empty_string, self.visit(ctx.expression()))
+        else:
+            self.output.receipt(empty_string)
+
+    def visitCost(self, ctx: CASHParser.CostContext):
+        name = str(ctx.IDENTIFIER())
+        value = self.visit(ctx.expression())
+        self.symbol_table.add_var(name,value)
+
+    def visitDiscount(self, ctx: CASHParser.DiscountContext):
+        exp1 = self.visit(ctx.expression())
+        name = str(ctx.IDENTIFIER())
+        exp2 = self.symbol_table.get_var(name)
+        exp2 = exp2 - (exp2 * (float(exp1) / 100))
+        self.symbol_table.add_var(name, exp2)
+    
+    def visitAsk(self, ctx: CASHParser.AskContext):
+        prompt = str(ctx.STRING())[1:-1]
+        name = str(ctx.IDENTIFIER()) 
+        value = self.inputs.ask(name, prompt)
+        self.symbol_table.add_var(name, value)
+
+    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
+        for c, stmt in zip(ctx.bool_expr(), ctx.main_stmt()):
+            if self.visit(c):
+                self.visit(stmt)
+                return
+        if len(ctx.main_stmt()) <= len(ctx.bool_expr()):
+            return
+        self.visit(ctx.main_stmt(len(ctx.bool_expr())))
+
+    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
+        isSatisfied = self.visit(ctx.bool_expr())
+        while isSatisfied:
+            for stmt in ctx.main_stmt():
+                self.visit(stmt)
+            isSatisfied = self.visit(ctx.bool_expr())
+
+    def visitProgram(self, ctx: CASHParser.ProgramContext):
+        # like the resolver: a name the main program assigns anywhere is global
+        # inside every task, even before the main program first assigns it
+        names = set()
+        for stmt in ctx.main_stmt() + ctx.cond_mod() + ctx.scan_mod():
+            names |= assigned_in(stmt)
+        self.global_names = frozenset(names)
+        return self.visitChildren(ctx)
+
+    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
+        name = str(ctx.IDENTIFIER(0))
+        params = self.visit(ctx.param_list())
+        task_body = list(ctx.task_body().getChildren())
+        task = Task(name, params, task_body, self.symbol_table, self.global_names)
+        self.symbol_table.add_task(task)
+
+    def visitTodo(self, ctx: CASHParser.TodoContext):
+        name = str(ctx.IDENTIFIER())
+        
+        if ctx.actual_param_list():
+            params = self.visit(ctx.actual_param_list())
+        else:
+            params = []
+
+        task = self.symbol_table.get_task(name)
+
+        task.execute(self, params)
+
+    def visitParam_list(self, ctx: CASHParser.Param_listContext):
+        index = 0
+        curr = ctx.IDENTIFIER(index)
+        result = []
+        while curr is not None: 
+            result.append(str(curr))
+            index += 1
+            curr = ctx.IDENTIFIER(index)
+        return result
+    
+    def visitActual_param_list(self, ctx: CASHParser.Actual_param_listContext):
+        return [self.visit(expr) for expr in ctx.expression()]
+
+
+class ProfilingVisitor(InterpreterVisitor):
+    """
+    The reference engine with every statement, SCAN, CONFIRM and task body
+    counted and timed by `profiler`. A separate class, so the plain visitor
+    has no profiling checks at all.
+    """
+
+    def __init__(self, symbol_table: SymbolTable, profiler, constants: dict | None = None, inputs=None,
+                 output=None):
+        super().__init__(symbol_table, constants, inputs, output)
+        self.profiler = profiler
+        self.task_sites = {}
+
+    def profiled(self, site, visit, ctx):
+        self.profiler.enter(site)
+        try:
+            return visit(ctx)
+        finally:
+            self.profiler.leave()
+
+    def visitMain_stmt(self, ctx: CASHParser.Main_stmtContext):
+        site = self.profiler.site(*context_site(ctx.statement()))
+        return self.profiled(site, super().visitMain_stmt, ctx)
+
+    def visitScan_mod(self, ctx: CASHParser.Scan_modContext):
+        return self.profiled(self.profiler.site(*context_site(ctx)), super().visitScan_mod, ctx)
+
+    def visitCond_mod(self, ctx: CASHParser.Cond_modContext):
+        return self.profiled(self.profiler.site(*context_site(ctx)), super().visitCond_mod, ctx)
+
+    def visitTask_mod(self, ctx: CASHParser.Task_modContext):
+        self.task_sites[str(ctx.IDENTIFIER(0))] = self.profiler.site(*context_site(ctx))
+        return super().visitTask_mod(ctx)
+
+    def visitTodo(self, ctx: CASHParser.TodoContext):
+        site = self.task_sites.get(str(ctx.IDENTIFIER()))
+        if site is None:
+            return super().visitTodo(ctx)
+        return self.profiled(site, super().visitTodo, ctx)
@@ -0,0 +1,44 @@
+"""
+Shared setup for the tests: the interpreter modules are imported from
+interpreter/, and every test gets its own cache directory so runs never reuse
+programs cached by another test or by the user.
+
+The generated ANTLR parser (the `cash` package, see the README) must be
+importable.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+EXAMPLES = ROOT / "example_code"
+
+sys.path.insert(0, str(ROOT / "interpreter"))
+sys.path.append(str(ROOT / "compiler"))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch) -> Path:
+    path = tmp_path / "cache"
+    monkeypatch.setenv("CASH_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def cash(tmp_path):
+    """
+    Run a script with interpreter.py, or compiler.py with `compiler=True`,
+    answering its ASKs from `answers`, and return what it printed.
+    """
+    def run(path: Path, *flags: str, answers=(), compiler: bool = False) -> str:
+        answers_file = tmp_path / "answers.txt"
+        answers_file.write_text("".join(f"{answer}\n" for answer in answers))
+        driver = ROOT / ("compiler/compiler.py" if compiler else "interpreter/interpreter.py")
+        result = subprocess.run([sys.executable, str(driver), str(path), *flags, "--input", str(answers_file)],
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    return run
@@ -0,0 +1,56 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import api
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "example_code"
+
+CALC = (EXAMPLES / "calc.cash").read_text()
+PROMPT = (EXAMPLES / "promptUser.cash").read_text()
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_records_carry_the_computed_values(engine):
+    program = api.compile(PROMPT, engine=engine)
+    assert program.run({"price": 10, "quantity": 3}) == [{"prefix": "Discounted total: ", "value": 27.0}]
+    assert program.run([10, 3]) == [{"prefix": "Discounted total: ", "value": 27.0}]
+
+
+def test_programs_cannot_be_changed():
+    program = api.compile(CALC)
+    with pytest.raises(AttributeError):
+        program.engine = "bytecode"
+
+
+def test_threads_share_a_program():
+    program = api.compile(PROMPT)
+    results = []
+
+    def run(price):
+        for _ in range(20):
+            results.append((price, program.run({"price": price, "quantity": 1})[0]["value"]))
+
+    threads = [threading.Thread(target=run, args=(price,)) for price in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(value == pytest.approx(price * 0.9) for price, value in results)
+
+
+def test_native_records_hold_the_printed_lines():
+    pytest.importorskip("llvmlite")
+    program = api.compile(CALC, engine="llvm")
+    assert program.run() == [{"prefix": "Total: 27.0", "value": None}]
+
+
+def test_compiling_natively_does_not_grow_sys_path():
+    pytest.importorskip("llvmlite")
+    api.compile(CALC, engine="llvm")
+    size = len(sys.path)
+    for _ in range(3):
+        api.compile(CALC, engine="llvm")
+    assert len(sys.path) == size
@@ -0,0 +1,37 @@
+import api
+from bytecode import CodeObject
+from interpreter import load_bytecode
+
+SUM = 'HELLO.\nRECEIPT "sum: ", 3 + 4 $\nBYE.\n'
+
+
+def test_cashc_is_reused_for_the_same_source(tmp_path):
+    script = tmp_path / "sum.cash"
+    script.write_text(SUM)
+    load_bytecode(script)
+    compiled = script.with_suffix(".cashc")
+    built = compiled.stat().st_mtime_ns
+    assert load_bytecode(script).consts == CodeObject.loads(compiled.read_bytes()).consts
+    assert compiled.stat().st_mtime_ns == built
+
+
+def test_cashc_is_rebuilt_when_the_source_changes(tmp_path):
+    script = tmp_path / "sum.cash"
+    script.write_text(SUM)
+    load_bytecode(script)
+    script.write_text(SUM.replace("3 + 4", "5 + 6"))
+    assert 11 in load_bytecode(script).consts
+
+
+def test_cashc_is_rebuilt_when_folding_changes(tmp_path):
+    script = tmp_path / "sum.cash"
+    script.write_text(SUM)
+    assert 7 in load_bytecode(script, fold=True).consts
+    unfolded = load_bytecode(script, fold=False).consts
+    assert 7 not in unfolded and {3, 4} <= set(unfolded)
+    assert 7 in load_bytecode(script, fold=True).consts
+
+
+def test_negative_zero_keeps_its_own_constant():
+    program = api.compile('HELLO.\nRECEIPT "a ", 0,0 $\nRECEIPT "b ", 0,0 * (0 - 1) $\nBYE.\n', engine="bytecode")
+    assert [str(record["value"]) for record in program.run()] == ["0.0", "-0.0"]
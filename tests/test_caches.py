@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import frontend
+from ast_cache import ASTCache
+from interpreter import load_program
+from program_cache import ProgramCache
+
+SOURCE = b'HELLO.\nCOST a = 2 $\nRECEIPT "a: ", a * 3 $\nBYE.\n'
+
+
+def test_ast_cache_hit_skips_parsing(tmp_path, monkeypatch):
+    cache = ASTCache(tmp_path)
+    program, types = load_program(SOURCE, cache=cache)
+    monkeypatch.setattr(frontend, "parse", lambda *args: pytest.fail("the source was parsed"))
+    cached, cached_types = load_program(SOURCE, cache=cache)
+    assert cached.names == program.names and cached_types == types
+
+
+def test_ast_cache_keys_on_source_folding_and_cents(tmp_path):
+    cache = ASTCache(tmp_path)
+    load_program(SOURCE, cache=cache)
+    assert cache.load(SOURCE) is not None
+    assert cache.load(SOURCE.replace(b"2", b"4")) is None
+    assert cache.load(SOURCE, fold=False) is None
+    assert cache.load(SOURCE, cents=True) is None
+
+
+def test_ast_cache_ignores_corrupt_entries(tmp_path):
+    cache = ASTCache(tmp_path)
+    load_program(SOURCE, cache=cache)
+    for entry in tmp_path.glob("*.ast"):
+        entry.write_bytes(b"not a pickle")
+    assert cache.load(SOURCE) is None
+    assert load_program(SOURCE, cache=cache)[0].names == ["a"]
+
+
+def test_program_cache_evicts_least_recently_used(tmp_path):
+    cache = ProgramCache(tmp_path, max_size=25)
+    cache.store("old", b"x" * 10)
+    cache.store("used", b"x" * 10)
+    # the oldest entry becomes the most recently used
+    os.utime(cache.path("old"), ns=(0, 0))
+    os.utime(cache.path("used"), ns=(0, 0))
+    assert cache.lookup("used") is not None
+    cache.store("new", b"x" * 10)
+    assert cache.lookup("old") is None
+    assert cache.load("used") == b"x" * 10
+    assert cache.load("new") == b"x" * 10
+
+
+def test_compiled_programs_key_on_every_option():
+    pytest.importorskip("llvmlite")
+    from compiler import program_key
+
+    options = dict(jit=True, fold=True, prompt=False, profile=False, cents=False)
+    key = program_key(SOURCE, **options)
+    assert program_key(SOURCE, **options) == key
+    assert program_key(SOURCE.replace(b"2", b"4"), **options) != key
+    for name in options:
+        assert program_key(SOURCE, **dict(options, **{name: not options[name]})) != key
+
+
+def test_compiler_reuses_and_invalidates_cached_objects(cash, tmp_path, cache_dir):
+    pytest.importorskip("llvmlite")
+    script = tmp_path / "a.cash"
+    script.write_bytes(SOURCE)
+    assert cash(script, "--jit", compiler=True) == "a: 6\n"
+    entries = set(cache_dir.iterdir())
+    assert cash(script, "--jit", compiler=True) == "a: 6\n"
+    assert set(cache_dir.iterdir()) == entries
+    script.write_bytes(SOURCE.replace(b"2", b"4"))
+    assert cash(script, "--jit", compiler=True) == "a: 12\n"
+    assert cash(script, "--jit", "--no-fold", compiler=True) == "a: 12\n"
+    assert len(set(cache_dir.iterdir()) - entries) == 2
@@ -0,0 +1,43 @@
+import pytest
+
+import api
+
+CENTS = """HELLO.
+ASK price = "price" $
+COST quantity = 3 $
+COST total = price * quantity $
+DISCOUNT(15, total) $
+RECEIPT "total: ", total $
+RECEIPT "share: ", total / 7 $
+COST tip = 0,1 + 0,2 $
+RECEIPT "tip: ", tip $
+COST i = 0 $
+SCAN (i < 3):
+    COST total = total - 0,005 $
+    COST i = i + 1 $
+$
+RECEIPT "after: ", total $
+BYE.
+"""
+
+EXPECTED = "total: 25.63\nshare: 3.66\ntip: 0.30\nafter: 25.60\n"
+
+
+def test_cents_are_exact_and_rounded_half_away_from_zero(cash, tmp_path):
+    script = tmp_path / "cents.cash"
+    script.write_text(CENTS)
+    assert cash(script, "--cents", answers=["10.05"]) == EXPECTED
+    assert cash(script, "--cents", "--no-fold", answers=["10.05"]) == EXPECTED
+
+
+def test_llvm_cents_build_matches_the_interpreter(cash, tmp_path):
+    pytest.importorskip("llvmlite")
+    script = tmp_path / "cents.cash"
+    script.write_text(CENTS)
+    assert cash(script, "--cents", "--jit", answers=["10.05"], compiler=True) == EXPECTED
+    assert cash(script, "--cents", "--jit", "--no-fold", answers=["10.05"], compiler=True) == EXPECTED
+
+
+def test_cents_api_runs_print_two_decimals():
+    program = api.compile(CENTS, cents=True)
+    assert [record["value"] for record in program.run([10.05])] == ["25.63", "3.66", "0.30", "25.60"]
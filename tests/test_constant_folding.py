@@ -0,0 +1,92 @@
+import pytest
+from antlr4 import InputStream
+
+import api
+from constant_folding import fold_constants
+from frontend import parse
+
+TASK_IN_LOOP = """HELLO.
+START TASK dec (IN: x):
+    COST n = n - x $
+END dec
+COST n = 3 $
+SCAN (n > 0):
+    RECEIPT "n: ", n $
+    TODO dec(x: 1) $
+$
+BYE.
+"""
+
+TASK_IN_CONFIRM = """HELLO.
+START TASK dec (IN: x):
+    COST n = n - x $
+END dec
+COST n = 3 $
+CONFIRM n > 0:
+    TODO dec(x: 5) $
+FALLBACK:
+    RECEIPT "never" $
+CONFIRM n > 0:
+    RECEIPT "positive" $
+FALLBACK:
+    RECEIPT "negative" $
+BYE.
+"""
+
+NESTED_CALL_IN_LOOP = """HELLO.
+START TASK dec (IN: x):
+    COST n = n - x $
+END dec
+START TASK step (IN: x):
+    TODO dec(x: x) $
+END step
+COST n = 2 $
+SCAN (n > 0):
+    TODO step(x: 1) $
+    RECEIPT "n: ", n $
+$
+BYE.
+"""
+
+
+def folded_values(source: str) -> set:
+    return set(fold_constants(parse(InputStream(source))).values())
+
+
+def receipts(source: str, engine: str, fold: bool = True) -> list:
+    return [record["prefix"] + str(record["value"])
+            for record in api.compile(source, engine=engine, fold=fold).run()]
+
+
+def test_propagates_through_straight_line_code():
+    values = folded_values('HELLO.\nCOST a = 2 $\nCOST b = a * 3 $\nRECEIPT "b: ", b + 1 $\nBYE.\n')
+    assert {6, 7} <= values
+
+
+def test_loop_condition_changed_by_a_task_is_not_folded():
+    assert True not in folded_values(TASK_IN_LOOP)
+    assert 3 not in folded_values(TASK_IN_LOOP)
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_loop_calling_a_task_terminates(engine):
+    assert receipts(TASK_IN_LOOP, engine) == ["n: 3", "n: 2", "n: 1"]
+    assert receipts(TASK_IN_LOOP, engine, fold=False) == ["n: 3", "n: 2", "n: 1"]
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_tasks_called_from_confirm_arms_are_forgotten(engine):
+    assert receipts(TASK_IN_CONFIRM, engine) == ["negative"]
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_writes_of_tasks_called_through_other_tasks_are_forgotten(engine):
+    assert receipts(NESTED_CALL_IN_LOOP, engine) == ["n: 1", "n: 0"]
+
+
+def test_visitor_and_jit_terminate(cash, tmp_path):
+    script = tmp_path / "loop.cash"
+    script.write_text(TASK_IN_LOOP)
+    assert cash(script, "--visitor") == "n: 3\nn: 2\nn: 1\n"
+    pytest.importorskip("llvmlite")
+    assert cash(script, "--jit", compiler=True) == "n: 3\nn: 2\nn: 1\n"
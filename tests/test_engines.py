@@ -0,0 +1,155 @@
+"""
+Every engine runs the examples to the same receipts.
+"""
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+import api
+from symbol_table import CallDepthExceeded
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "example_code"
+
+# answers for every ASK the examples make, in order
+ANSWERS = {
+    "func.cash": [10, 2, 4, 1, 5, 3],
+    "ifThenElse.cash": [10, 12],
+    "promptUser.cash": [10, 3],
+    "while.cash": [2, 10, 2, 4, 1],
+}
+
+SCRIPTS = sorted(path.name for path in EXAMPLES.glob("*.cash"))
+
+
+@pytest.fixture
+def example(tmp_path):
+    # the bytecode engine writes its .cashc next to the source
+    def copy(name: str) -> Path:
+        return Path(shutil.copy(EXAMPLES / name, tmp_path / name))
+
+    return copy
+
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_engines_print_the_same_receipts(cash, example, name):
+    script = example(name)
+    answers = ANSWERS.get(name, ())
+    expected = cash(script, answers=answers)
+    assert expected
+    assert cash(script, "--visitor", answers=answers) == expected
+    assert cash(script, "--bytecode", answers=answers) == expected
+    # the second bytecode run loads the .cashc file
+    assert cash(script, "--bytecode", answers=answers) == expected
+    assert cash(script, "--no-fold", answers=answers) == expected
+
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_jit_prints_the_same_receipts(cash, example, name):
+    pytest.importorskip("llvmlite")
+    script = example(name)
+    answers = ANSWERS.get(name, ())
+    assert cash(script, "--jit", answers=answers, compiler=True) == cash(script, answers=answers)
+
+
+COUNTDOWN = """HELLO.
+START TASK down (IN: k):
+    CONFIRM k > 0:
+        TODO down(k: k - 1) $
+    FALLBACK:
+        RECEIPT "done" $
+END down
+TODO down(k: 5000) $
+BYE.
+"""
+
+NESTED = """HELLO.
+START TASK down (IN: k):
+    CONFIRM k > 0:
+        TODO down(k: k - 1) $
+    FALLBACK:
+        RECEIPT "done" $
+    RECEIPT "back" $
+END down
+TODO down(k: 5000) $
+BYE.
+"""
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_tail_calls_run_past_the_recursion_limit(engine):
+    program = api.compile(COUNTDOWN, engine=engine, recursion_limit=100)
+    assert program.run() == [{"prefix": "", "value": "done"}]
+
+
+@pytest.mark.parametrize("engine", ["closure", "bytecode"])
+def test_nested_calls_stop_at_the_recursion_limit(engine):
+    with pytest.raises(CallDepthExceeded):
+        api.compile(NESTED, engine=engine, recursion_limit=100).run()
+    records = api.compile(NESTED.replace("5000", "50"), engine=engine, recursion_limit=100).run()
+    assert [record["value"] for record in records] == ["done"] + ["back"] * 51
+
+
+# y is global, since the main program assigns it, even though the task runs first
+SHARED_BEFORE_ASSIGNED = """HELLO.
+START TASK t (IN: n):
+    COST y = n $
+    COST z = n + 1 $
+END t
+TODO t(n: 3) $
+RECEIPT "y: ", y $
+COST y = 1 $
+RECEIPT "y: ", y $
+BYE.
+"""
+
+TASK_LOCAL = """HELLO.
+START TASK t (IN: n):
+    COST z = n + 1 $
+END t
+TODO t(n: 3) $
+RECEIPT "z: ", z $
+BYE.
+"""
+
+
+def test_tasks_share_every_name_the_main_program_assigns(cash, tmp_path):
+    script = tmp_path / "shared.cash"
+    script.write_text(SHARED_BEFORE_ASSIGNED)
+    assert cash(script) == "y: 3\ny: 1\n"
+    assert cash(script, "--visitor") == "y: 3\ny: 1\n"
+    assert cash(script, "--bytecode") == "y: 3\ny: 1\n"
+    pytest.importorskip("llvmlite")
+    assert cash(script, "--jit", compiler=True) == "y: 3\ny: 1\n"
+
+
+def test_task_locals_stay_in_the_task():
+    from antlr4 import InputStream
+    from frontend import parse
+    from inputs import StreamInput
+    from output import MemorySink
+    from symbol_table import SymbolTable
+    from visitor import InterpreterVisitor
+
+    for engine in ("closure", "bytecode"):
+        with pytest.raises(KeyError, match="Variable z not found"):
+            api.compile(TASK_LOCAL, engine=engine).run()
+    visitor = InterpreterVisitor(SymbolTable(), inputs=StreamInput([]), output=MemorySink())
+    with pytest.raises(KeyError, match="Variable z not found"):
+        visitor.visit(parse(InputStream(TASK_LOCAL)))
+
+
+@pytest.mark.parametrize("option", ["path", "csv_path"])
+def test_answer_files_are_closed(tmp_path, option):
+    from inputs import open_input
+
+    answers = tmp_path / "answers"
+    answers.write_text("price\n10\n")
+    inputs = open_input(**{option: str(answers)})
+    inputs.close()
+    assert inputs.stream.closed
+
+    stdin = open_input("-")
+    stdin.close()
+    assert stdin.stream is sys.stdin and not sys.stdin.closed
@@ -0,0 +1,147 @@
+import pytest
+
+import api
+from incremental import Session
+from output import NO_VALUE
+
+CHAINS = """HELLO.
+ASK price = "price" $
+COST quantity = 3 $
+COST total = price * quantity $
+RECEIPT "total: ", total $
+COST fee = 2 $
+COST shipping = fee * 4 $
+RECEIPT "shipping: ", shipping $
+CONFIRM total > 100:
+    DISCOUNT(10, total) $
+FALLBACK:
+    RECEIPT "no discount" $
+RECEIPT "final: ", total $
+BYE.
+"""
+
+
+def full_run(source: str, inputs) -> list:
+    return [(record["prefix"], record["value"]) for record in api.compile(source).run(inputs)]
+
+
+def receipts(session: Session, source: str, inputs) -> list:
+    return [(prefix, None if value is NO_VALUE else value) for prefix, value in session.run(source.encode(), inputs)]
+
+
+def test_first_run_evaluates_everything():
+    session = Session()
+    assert receipts(session, CHAINS, [10]) == full_run(CHAINS, [10])
+    assert session.rerun == len(session.units) == 9
+
+
+def test_unchanged_version_reruns_nothing():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    assert receipts(session, CHAINS, [10]) == full_run(CHAINS, [10])
+    assert session.rerun == 0
+
+
+def test_edit_reruns_only_its_dependents():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    edited = CHAINS.replace("COST fee = 2", "COST fee = 3")
+    assert receipts(session, edited, [10]) == full_run(edited, [10])
+    # the fee, the shipping computed from it and its receipt
+    assert session.rerun == 3
+
+
+def test_equal_value_stops_the_change():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    edited = CHAINS.replace("price * quantity", "quantity * price")
+    assert receipts(session, edited, [10]) == full_run(edited, [10])
+    assert session.rerun == 1
+
+
+def test_folded_to_the_same_statement_reruns_nothing():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    edited = CHAINS.replace("COST quantity = 3", "COST quantity = 1 + 2")
+    assert receipts(session, edited, [10]) == full_run(edited, [10])
+    assert session.rerun == 0
+
+
+def test_changed_answer_reruns_its_readers():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    assert receipts(session, CHAINS, [50]) == full_run(CHAINS, [50])
+    # the ASK, the total, its receipt, the CONFIRM and the final receipt
+    assert session.rerun == 5
+
+
+def test_inserted_and_deleted_statements():
+    session = Session()
+    session.run(CHAINS.encode(), [10])
+    inserted = CHAINS.replace('RECEIPT "shipping: "', 'COST shipping = shipping + 1 $\nRECEIPT "shipping: "')
+    assert receipts(session, inserted, [10]) == full_run(inserted, [10])
+    assert session.rerun == 2
+    assert receipts(session, CHAINS, [10]) == full_run(CHAINS, [10])
+    assert session.rerun == 1
+
+
+def test_answers_per_variable_and_columns():
+    session = Session()
+    assert receipts(session, CHAINS, {"price": 40}) == full_run(CHAINS, {"price": 40})
+    # the same answer from a renamed column reruns every ASK, but nothing it feeds
+    result = session.run(CHAINS.encode(), {"cost": [40]}, columns={"price": "cost"})
+    assert [(prefix, None if value is NO_VALUE else value) for prefix, value in result] == full_run(CHAINS, [40])
+    assert session.rerun == 1
+
+
+TASKS = """HELLO.
+START TASK add (IN: x):
+    COST sum = sum + x $
+END add
+COST sum = 0 $
+COST other = 1 $
+TODO add(x: 2) $
+RECEIPT "sum: ", sum $
+RECEIPT "other: ", other $
+BYE.
+"""
+
+
+def test_task_edit_reruns_its_calls():
+    session = Session()
+    session.run(TASKS.encode())
+    edited = TASKS.replace("sum + x", "sum + x * 2")
+    assert receipts(session, edited, None) == full_run(edited, None)
+    # the definition, the TODO and the receipt of the sum
+    assert session.rerun == 3
+
+
+def test_failed_run_is_not_cached():
+    session = Session()
+    session.run(TASKS.encode())
+    broken = TASKS.replace("COST other = 1", "COST other = 1 / (sum - sum)")
+    with pytest.raises(ZeroDivisionError):
+        session.run(broken.encode())
+    assert receipts(session, TASKS, None) == full_run(TASKS, None)
+    assert session.rerun == len(session.units)
+
+
+def test_removed_task_definition_invalidates_what_it_assigned():
+    source = """HELLO.
+START TASK f (IN: x):
+    COST a = a + x $
+END f
+COST a = 0 $
+ASK b = "b" $
+START TASK f (IN: x):
+    COST b = b + x $
+END f
+TODO f(x: 5) $
+RECEIPT "a: ", a $
+RECEIPT "b: ", b $
+BYE.
+"""
+    session = Session()
+    assert receipts(session, source, [1]) == [("a: ", 0), ("b: ", 6.0)]
+    edited = source.replace("START TASK f (IN: x):\n    COST b = b + x $\nEND f\n", "")
+    assert receipts(session, edited, [1]) == full_run(edited, [1]) == [("a: ", 5), ("b: ", 1.0)]
@@ -0,0 +1,112 @@
+from bytecode import build_memos, compile_bytecode, run as run_bytecode
+from closure_engine import ClosureCompiler, run as run_closures
+from inputs import StreamInput
+from interpreter import load_program
+from output import MemorySink
+from symbol_table import new_global_frame
+
+# `scale` only reads `rate`, so it is memoized; the third call sees another rate
+SCALE = """HELLO.
+START TASK scale (IN: x):
+    COST out = x * rate $
+END scale
+COST out = 0 $
+COST rate = 2 $
+TODO scale(x: 3) $
+RECEIPT "out: ", out $
+COST out = 0 $
+TODO scale(x: 3) $
+RECEIPT "out: ", out $
+COST rate = 5 $
+TODO scale(x: 3) $
+RECEIPT "out: ", out $
+BYE.
+"""
+
+EXPECTED = "out: 6\nout: 6\nout: 15\n"
+
+
+def test_closure_memo_misses_when_a_read_global_changes():
+    ast, types = load_program(SCALE.encode())
+    output = MemorySink()
+    compiler = ClosureCompiler(16, "lru", types, StreamInput([]), output)
+    run_closures(compiler.compile_program(ast), new_global_frame(len(ast.names)))
+    assert output.getvalue() == EXPECTED
+    [memo] = compiler.memos
+    assert (memo.hits, memo.misses) == (1, 2)
+
+
+def test_bytecode_memo_misses_when_a_read_global_changes():
+    code_object = compile_bytecode(load_program(SCALE.encode())[0])
+    output = MemorySink()
+    memos = build_memos(code_object, 16)
+    run_bytecode(code_object, new_global_frame(len(code_object.names)), memos, StreamInput([]), output)
+    assert output.getvalue() == EXPECTED
+    [memo] = memos.values()
+    assert (memo.hits, memo.misses) == (1, 2)
+
+
+def test_memo_size_zero_disables_memoization():
+    ast, types = load_program(SCALE.encode())
+    output = MemorySink()
+    compiler = ClosureCompiler(0, "lru", types, StreamInput([]), output)
+    run_closures(compiler.compile_program(ast), new_global_frame(len(ast.names)))
+    assert output.getvalue() == EXPECTED
+    assert not compiler.memos
+
+
+# the second call writes the value x had before the first one
+SAME_VALUE = """HELLO.
+START TASK setx (IN: n):
+    COST x = n $
+END setx
+COST x = 5 $
+TODO setx(n: 5) $
+COST x = 7 $
+TODO setx(n: 5) $
+RECEIPT "x: ", x $
+BYE.
+"""
+
+# only some calls assign x, so the others must keep whatever x holds
+CONDITIONAL = """HELLO.
+START TASK setx (IN: n):
+    CONFIRM n > 10:
+        COST x = n $
+    FALLBACK:
+        COST y = n $
+END setx
+COST x = 1 $
+COST y = 0 $
+TODO setx(n: 5) $
+COST x = 7 $
+TODO setx(n: 5) $
+RECEIPT "x: ", x $
+BYE.
+"""
+
+
+def run_closure(source: str) -> str:
+    ast, types = load_program(source.encode())
+    output = MemorySink()
+    compiler = ClosureCompiler(16, "lru", types, StreamInput([]), output)
+    run_closures(compiler.compile_program(ast), new_global_frame(len(ast.names)))
+    return output.getvalue()
+
+
+def run_vm(source: str) -> str:
+    code_object = compile_bytecode(load_program(source.encode())[0])
+    output = MemorySink()
+    run_bytecode(code_object, new_global_frame(len(code_object.names)), build_memos(code_object, 16),
+                 StreamInput([]), output)
+    return output.getvalue()
+
+
+def test_hits_replay_writes_of_unchanged_values():
+    assert run_closure(SAME_VALUE) == "x: 5\n"
+    assert run_vm(SAME_VALUE) == "x: 5\n"
+
+
+def test_hits_keep_slots_a_call_did_not_assign():
+    assert run_closure(CONDITIONAL) == "x: 7\n"
+    assert run_vm(CONDITIONAL) == "x: 7\n"